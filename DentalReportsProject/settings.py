@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from .database import database_config
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -47,6 +50,8 @@ CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
 CRISPY_TEMPLATE_PACK = "bootstrap5"
 
 MIDDLEWARE = [
+    # Primero, para que sus tiempos incluyan al resto de middlewares
+    'dental_reports.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -60,7 +65,8 @@ ROOT_URLCONF = 'DentalReportsProject.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates que además mide el tiempo de renderizado (Server-Timing 'tpl')
+        'BACKEND': 'dental_reports.instrumentation.InstrumentedDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],  # Faltaba una coma aquí
         'APP_DIRS': True,
         'OPTIONS': {
@@ -80,10 +86,43 @@ WSGI_APPLICATION = 'DentalReportsProject.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Se configura con DATABASE_URL y las variables descritas en DentalReportsProject/database.py.
+# Sin DATABASE_URL se usa SQLite en modo WAL con conexiones persistentes.
 DATABASES = {
+    'default': database_config(BASE_DIR / 'db.sqlite3', os.environ),
+}
+
+
+# Caché
+# El backend se elige con la variable de entorno DENTAL_REPORTS_CACHE:
+#   - 'locmem' (por defecto): memoria del proceso, sin dependencias
+#   - 'file': archivos en BASE_DIR/cache, compartida por todos los procesos
+#   - 'redis': servidor Redis (o compatible) en DENTAL_REPORTS_REDIS_URL; requiere
+#     el paquete `redis`. En los tests basta con DENTAL_REPORTS_CACHE=locmem para
+#     sustituirlo por la caché local, que tiene la misma interfaz.
+
+CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'dental-reports',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache',
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    },
+    'redis': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('DENTAL_REPORTS_REDIS_URL', 'redis://127.0.0.1:6379/1'),
+    },
+}
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        **CACHE_BACKENDS[os.environ.get('DENTAL_REPORTS_CACHE', 'locmem')],
+        'KEY_PREFIX': 'dental_reports',
+        'TIMEOUT': 300,
     }
 }
 
@@ -129,6 +168,82 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Informes dentales
+# Número máximo de plantillas compiladas que se mantienen en memoria por proceso
+DENTAL_REPORTS_TEMPLATE_CACHE_SIZE = 128
+
+# Generar los PDF en segundo plano (requiere `manage.py run_pdf_worker`)
+DENTAL_REPORTS_PDF_ASYNC = True
+
+# Directorio (dentro de MEDIA_ROOT) de la caché de PDFs direccionada por contenido
+DENTAL_REPORTS_PDF_CACHE_DIR = 'pdf_cache'
+
+# Imágenes incrustadas en los PDF: se reducen a este lado mayor (px) y se guardan ya
+# preparadas en memoria, hasta DENTAL_REPORTS_PDF_IMAGE_CACHE_BYTES por proceso
+DENTAL_REPORTS_PDF_IMAGE_MAX_SIZE = 1200
+DENTAL_REPORTS_PDF_IMAGE_CACHE_BYTES = 32 * 1024 * 1024
+
+# Backend de búsqueda de texto completo: 'auto' (SQLite FTS5 si está disponible)
+# o la ruta a una subclase de dental_reports.search.BaseSearchBackend
+DENTAL_REPORTS_SEARCH_BACKEND = 'auto'
+
+# Segundos que se mantiene en caché el panel de inicio (se invalida también con cada cambio)
+DENTAL_REPORTS_DASHBOARD_CACHE_TIMEOUT = 300
+
+# Correo
+# Para pruebas: DENTAL_REPORTS_EMAIL_BACKEND=django.core.mail.backends.locmem.EmailBackend,
+# o un servidor SMTP local (p. ej. `python -m aiosmtpd -n -l localhost:1025` con EMAIL_PORT=1025)
+EMAIL_BACKEND = os.environ.get('DENTAL_REPORTS_EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
+EMAIL_HOST = os.environ.get('EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(os.environ.get('EMAIL_PORT', 25))
+EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER', '')
+EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD', '')
+EMAIL_USE_TLS = os.environ.get('EMAIL_USE_TLS', '') == '1'
+EMAIL_TIMEOUT = 30
+DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'informes@localhost')
+
+# Intentos de envío de cada correo de la bandeja de salida antes de darlo por fallido
+DENTAL_REPORTS_EMAIL_MAX_ATTEMPTS = 5
+
+# Segundos que se mantienen en caché los listados (plantillas, categorías, clínicas, dentistas)
+DENTAL_REPORTS_VIEW_CACHE_TIMEOUT = 600
+
+# Descargas ZIP: hasta DENTAL_REPORTS_ZIP_STREAM_LIMIT informes con el PDF ya generado se
+# descargan al momento; el resto se genera con `manage.py build_report_archives`
+DENTAL_REPORTS_ZIP_STREAM_LIMIT = 50
+DENTAL_REPORTS_ZIP_MAX_REPORTS = 5000
+
+# Instrumentación por petición: cabecera Server-Timing, log `dental_reports.requests`
+# (INFO para las peticiones más lentas que DENTAL_REPORTS_SLOW_REQUEST_MS) e
+# histogramas por vista en /metrics/ (sólo personal)
+DENTAL_REPORTS_INSTRUMENTATION = True
+DENTAL_REPORTS_SERVER_TIMING = True
+DENTAL_REPORTS_SLOW_REQUEST_MS = 500
+
+# Autoguardado del editor visual: cada cuántos parches se compactan en el contenido de la plantilla
+DENTAL_REPORTS_PLANTILLA_COMPACT_EVERY = 50
+
+# Historial de plantillas e informes: cada cuántas versiones se guarda una
+# instantánea completa en lugar de las diferencias con la anterior
+DENTAL_REPORTS_REVISION_SNAPSHOT_EVERY = 20
+
+# Almacenamiento comprimido de report_content y form_data: 'auto' (zstd si está
+# instalado el paquete zstandard, si no zlib), 'zstd', 'zlib' o 'none'. Los valores
+# más cortos que MIN_BYTES se guardan sin comprimir. Los diccionarios por plantilla
+# se entrenan con `manage.py compress_reports --train`
+DENTAL_REPORTS_COMPRESSION_CODEC = 'auto'
+DENTAL_REPORTS_COMPRESSION_LEVEL = None
+DENTAL_REPORTS_COMPRESSION_MIN_BYTES = 256
+DENTAL_REPORTS_COMPRESSION_DICTIONARIES = True
+DENTAL_REPORTS_COMPRESSION_DICT_SIZE = 64 * 1024
+
+# Renderizado bajo demanda: los informes nuevos guardan la versión de su plantilla
+# en lugar del HTML (si al renderizarlo desde form_data sale idéntico). El HTML
+# renderizado se cachea en el espacio 'renders' durante RENDER_CACHE_TIMEOUT segundos.
+# Los informes existentes se convierten con `manage.py convert_render_on_read --convert`
+DENTAL_REPORTS_RENDER_ON_READ = False
+DENTAL_REPORTS_RENDER_CACHE_TIMEOUT = 600
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
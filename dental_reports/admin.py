@@ -1,10 +1,13 @@
 from django.contrib import admin
+from django.db.models import Count
+from django.utils import timezone
 from django.utils.html import format_html
 from django.urls import reverse
 from .models import (
     TemplateCategory, Specialty, ReportTemplate,
-    GeneratedReport, DentalClinic, DentistContact
+    GeneratedReport, DentalClinic, DentistContact, OutboundEmail, ReportArchive
 )
+from .rendering import RenderMismatch, report_html
 
 
 # Registrar una sola vez cada modelo
@@ -13,10 +16,15 @@ class TemplateCategoryAdmin(admin.ModelAdmin):
     list_display = ('name', 'description', 'template_count')
     search_fields = ('name',)
 
+    def get_queryset(self, request):
+        # Contar en la misma consulta del listado en lugar de una por fila
+        return super().get_queryset(request).annotate(num_templates=Count('templates'))
+
     def template_count(self, obj):
-        return obj.templates.count()
+        return obj.num_templates
 
     template_count.short_description = "Núm. Plantillas"
+    template_count.admin_order_field = 'num_templates'
 
 
 @admin.register(Specialty)
@@ -24,10 +32,14 @@ class SpecialtyAdmin(admin.ModelAdmin):
     list_display = ('name', 'description', 'template_count')
     search_fields = ('name',)
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(num_templates=Count('report_templates'))
+
     def template_count(self, obj):
-        return obj.report_templates.count()
+        return obj.num_templates
 
     template_count.short_description = "Núm. Plantillas"
+    template_count.admin_order_field = 'num_templates'
 
 
 class TemplatePreviewInline(admin.TabularInline):
@@ -48,7 +60,9 @@ class ReportTemplateAdmin(admin.ModelAdmin):
     list_display = (
     'name', 'category', 'specialty', 'is_active', 'is_public', 'created_by', 'created_at', 'preview_button')
     list_filter = ('is_active', 'is_public', 'category', 'specialty', 'created_at')
+    list_select_related = ('category', 'specialty', 'created_by')
     search_fields = ('name', 'description')
+    autocomplete_fields = ('category', 'specialty')
     readonly_fields = ('created_at', 'updated_at', 'created_by', 'html_preview')
     fieldsets = (
         ('Información Básica', {
@@ -80,7 +94,7 @@ class ReportTemplateAdmin(admin.ModelAdmin):
 
     def preview_button(self, obj):
         if obj.pk:
-            url = reverse('template_detail', args=[obj.pk])
+            url = reverse('dental_reports:template_detail', args=[obj.pk])
             return format_html('<a class="button" href="{}">Ver Plantilla</a>', url)
         return ""
 
@@ -96,11 +110,16 @@ class ReportTemplateAdmin(admin.ModelAdmin):
 class GeneratedReportAdmin(admin.ModelAdmin):
     list_display = ('title', 'template_link', 'patient_name', 'doctor_name', 'created_at', 'pdf_download')
     list_filter = ('created_at', 'template')
+    list_select_related = ('template',)
     search_fields = ('title', 'patient_name', 'doctor_name')
-    readonly_fields = ('created_at', 'report_preview', 'report_data_preview')
+    autocomplete_fields = ('template',)
+    readonly_fields = ('created_at', 'report_preview', 'report_data_preview', 'plantilla', 'version',
+                       'template_version', 'content_hash',
+                       'pdf_status', 'pdf_source_hash', 'pdf_renderer_version')
     fieldsets = (
         ('Información del Informe', {
-            'fields': ('title', 'template', 'patient_name', 'doctor_name', 'created_by', 'created_at', 'version')
+            'fields': ('title', 'template', 'plantilla', 'patient_name', 'doctor_name', 'created_by', 'created_at',
+                       'version')
         }),
         ('Contenido', {
             'fields': ('report_content', 'report_preview'),
@@ -111,17 +130,18 @@ class GeneratedReportAdmin(admin.ModelAdmin):
             'classes': ('collapse',),
         }),
         ('Archivo PDF', {
-            'fields': ('pdf_file',),
+            'fields': ('pdf_file', 'pdf_status', 'pdf_source_hash', 'pdf_renderer_version'),
         }),
     )
 
     def template_link(self, obj):
         if obj.template:
-            url = reverse('admin:dental_reports_reporttemplate_change', args=[obj.template.id])
+            url = reverse('admin:dental_reports_reporttemplate_change', args=[obj.template_id])
             return format_html('<a href="{}">{}</a>', url, obj.template.name)
         return "N/A"
 
     template_link.short_description = "Plantilla"
+    template_link.admin_order_field = 'template__name'
 
     def pdf_download(self, obj):
         if obj.pdf_file:
@@ -131,10 +151,14 @@ class GeneratedReportAdmin(admin.ModelAdmin):
     pdf_download.short_description = "PDF"
 
     def report_preview(self, obj):
-        if obj.report_content:
+        try:
+            content = report_html(obj)
+        except RenderMismatch as e:
+            return str(e)
+        if content:
             return format_html(
                 '<div style="border: 1px solid #ddd; padding: 10px; max-height: 300px; overflow-y: auto;">{}</div>',
-                obj.report_content)
+                content)
         return "Sin contenido"
 
     report_preview.short_description = "Vista previa del informe"
@@ -161,10 +185,14 @@ class DentalClinicAdmin(admin.ModelAdmin):
         }),
     )
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(num_dentists=Count('dentists'))
+
     def dentist_count(self, obj):
-        return obj.dentists.count()
+        return obj.num_dentists
 
     dentist_count.short_description = "Núm. Dentistas"
+    dentist_count.admin_order_field = 'num_dentists'
 
 
 class ClinicFilter(admin.SimpleListFilter):
@@ -172,8 +200,9 @@ class ClinicFilter(admin.SimpleListFilter):
     parameter_name = 'clinic'
 
     def lookups(self, request, model_admin):
-        clinics = DentalClinic.objects.all()
-        return [(clinic.id, clinic.name) for clinic in clinics]
+        # Sólo las clínicas con dentistas, y sólo las columnas que se muestran
+        return (DentalClinic.objects.filter(dentists__isnull=False).distinct()
+                .order_by('name').values_list('id', 'name'))
 
     def queryset(self, request, queryset):
         if self.value():
@@ -185,7 +214,9 @@ class ClinicFilter(admin.SimpleListFilter):
 class DentistContactAdmin(admin.ModelAdmin):
     list_display = ('full_name_display', 'email', 'phone', 'clinic_link', 'is_active')
     list_filter = ('is_active', ClinicFilter)
+    list_select_related = ('clinic',)
     search_fields = ('first_name', 'last_name', 'email', 'phone')
+    autocomplete_fields = ('clinic',)
     fieldsets = (
         ('Información Personal', {
             'fields': (('first_name', 'last_name'), 'email', 'phone', 'address')
@@ -202,11 +233,50 @@ class DentistContactAdmin(admin.ModelAdmin):
 
     def clinic_link(self, obj):
         if obj.clinic:
-            url = reverse('admin:dental_reports_dentalclinic_change', args=[obj.clinic.id])
+            url = reverse('admin:dental_reports_dentalclinic_change', args=[obj.clinic_id])
             return format_html('<a href="{}">{}</a>', url, obj.clinic.name)
         return "Sin clínica"
 
     clinic_link.short_description = "Clínica"
+    clinic_link.admin_order_field = 'clinic__name'
+
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'to_email', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('to_email', 'subject')
+    readonly_fields = ('report', 'dentist', 'created_by', 'created_at', 'sent_at', 'attempts', 'last_error')
+    actions = ['retry_now']
+
+    def retry_now(self, request, queryset):
+        updated = queryset.exclude(status=OutboundEmail.STATUS_SENT).update(
+            status=OutboundEmail.STATUS_PENDING, next_attempt_at=timezone.now(), attempts=0)
+        self.message_user(request, f"{updated} correos vueltos a poner en cola.")
+
+    retry_now.short_description = "Reintentar ahora"
+
+
+@admin.register(ReportArchive)
+class ReportArchiveAdmin(admin.ModelAdmin):
+    list_display = ('name', 'created_by', 'report_count', 'status', 'created_at', 'status_changed_at')
+    list_filter = ('status',)
+    list_select_related = ('created_by',)
+    search_fields = ('name', 'created_by__username')
+    readonly_fields = ('report_ids', 'file', 'created_by', 'created_at', 'status_changed_at', 'error')
+    actions = ['rebuild']
+
+    def report_count(self, obj):
+        return len(obj.report_ids or [])
+
+    report_count.short_description = "Informes"
+
+    def rebuild(self, request, queryset):
+        updated = queryset.exclude(status=ReportArchive.STATUS_BUILDING).update(
+            status=ReportArchive.STATUS_PENDING, status_changed_at=timezone.now(), error='')
+        self.message_user(request, f"{updated} archivos ZIP vueltos a poner en cola.")
+
+    rebuild.short_description = "Volver a generar"
 
 
 # Personalizar el sitio de administración
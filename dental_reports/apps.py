@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+
+
+class DentalReportsConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'dental_reports'
+    verbose_name = "Informes Dentales"
+
+    def ready(self):
+        # Registrar los receptores de señales
+        from . import signals  # noqa: F401
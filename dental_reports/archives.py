@@ -0,0 +1,207 @@
+# dental_reports/archives.py
+"""
+Descarga de varios informes en un archivo ZIP.
+
+El ZIP se genera en streaming: cada PDF se lee del almacenamiento por bloques
+y los bytes comprimidos se entregan en cuanto están listos, sin reunir nunca
+todos los archivos en memoria. Las selecciones pequeñas con todos sus PDF
+disponibles se descargan directamente; el resto se encola como ReportArchive
+y lo genera `manage.py build_report_archives`, que renderiza antes los PDF
+que falten con el pool de procesos.
+"""
+import logging
+import tempfile
+import time
+import zipfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.utils import timezone
+
+from .jobs import create_render_pool, open_report_pdf, render_reports, report_pdf_filename
+from .models import GeneratedReport, ReportArchive
+
+logger = logging.getLogger(__name__)
+
+# Máximo de informes que se descargan directamente, sin trabajo en segundo plano
+DEFAULT_ZIP_STREAM_LIMIT = 50
+# Máximo de informes de una descarga
+DEFAULT_ZIP_MAX_REPORTS = 5000
+
+ZIP_READ_CHUNK_SIZE = 64 * 1024
+
+# Tiempo tras el cual un ZIP en estado 'building' se considera abandonado
+STALE_BUILDING_AFTER = timedelta(minutes=30)
+
+
+def zip_stream_limit():
+    return getattr(settings, 'DENTAL_REPORTS_ZIP_STREAM_LIMIT', DEFAULT_ZIP_STREAM_LIMIT)
+
+
+def zip_max_reports():
+    return getattr(settings, 'DENTAL_REPORTS_ZIP_MAX_REPORTS', DEFAULT_ZIP_MAX_REPORTS)
+
+
+class _ZipBuffer:
+    """Destino no posicionable para ZipFile: acumula lo escrito hasta que se recoge"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iter_zip(entries, chunk_size=ZIP_READ_CHUNK_SIZE):
+    """
+    Genera un ZIP por bloques
+
+    Args:
+        entries: Iterable de tuplas (nombre en el ZIP, función sin argumentos que
+                 abre el archivo de origen en modo binario o devuelve None)
+    """
+    buffer = _ZipBuffer()
+    # Los PDF ya van comprimidos: el nivel 1 apenas pierde tamaño y es mucho más rápido
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=1) as archive:
+        for name, opener in entries:
+            source = opener()
+            if source is None:
+                logger.warning(f"{name}: PDF no disponible, se omite del ZIP")
+                continue
+            with source, archive.open(name, 'w', force_zip64=True) as target:
+                for chunk in iter(lambda: source.read(chunk_size), b''):
+                    target.write(chunk)
+                    data = buffer.drain()
+                    if data:
+                        yield data
+            data = buffer.drain()
+            if data:
+                yield data
+    data = buffer.drain()
+    if data:
+        yield data
+
+
+def report_zip_name(report):
+    # El id delante evita nombres repetidos (mismo paciente y plantilla)
+    return f"{report.pk}_{report_pdf_filename(report)}"
+
+
+def report_zip_entries(reports, render=False):
+    """Entradas de iter_zip para los PDF de los informes"""
+    for report in reports:
+        yield report_zip_name(report), (lambda report=report: open_report_pdf(report, render=render))
+
+
+def has_available_pdf(report):
+    """True si el PDF del informe se puede leer sin renderizarlo"""
+    pdf_file = open_report_pdf(report, render=False)
+    if pdf_file is None:
+        return False
+    pdf_file.close()
+    return True
+
+
+def archive_queryset(report_ids):
+    return (GeneratedReport.objects.filter(id__in=report_ids)
+            .select_related('template').order_by('-created_at', '-id'))
+
+
+def can_stream(reports):
+    """Una selección se descarga directamente si es pequeña y no hay que renderizar ningún PDF"""
+    return len(reports) <= zip_stream_limit() and all(has_available_pdf(report) for report in reports)
+
+
+def create_archive(report_ids, user, name=None):
+    """Encola la generación de un ZIP con los informes indicados"""
+    return ReportArchive.objects.create(
+        name=name or f"informes_{timezone.now():%Y%m%d_%H%M}",
+        report_ids=list(report_ids),
+        created_by=user,
+    )
+
+
+def set_archive_status(archive, status, error=''):
+    archive.status = status
+    archive.error = error
+    archive.status_changed_at = timezone.now()
+    archive.save(update_fields=['status', 'error', 'status_changed_at'])
+
+
+def claim_archive():
+    """Reclama el ZIP pendiente más antiguo, o None si no hay ninguno"""
+    for archive_id in (ReportArchive.objects.filter(status=ReportArchive.STATUS_PENDING)
+                       .order_by('created_at').values_list('id', flat=True)[:5]):
+        if ReportArchive.objects.filter(id=archive_id, status=ReportArchive.STATUS_PENDING).update(
+                status=ReportArchive.STATUS_BUILDING, status_changed_at=timezone.now()):
+            return ReportArchive.objects.get(id=archive_id)
+    return None
+
+
+def requeue_stale_archives(older_than=STALE_BUILDING_AFTER):
+    return ReportArchive.objects.filter(
+        status=ReportArchive.STATUS_BUILDING,
+        status_changed_at__lt=timezone.now() - older_than,
+    ).update(status=ReportArchive.STATUS_PENDING, status_changed_at=timezone.now())
+
+
+def build_archive(archive, pool):
+    """Renderiza los PDF que falten y guarda el ZIP en el almacenamiento"""
+    reports = list(archive_queryset(archive.report_ids))
+
+    missing = [report.pk for report in reports if not has_available_pdf(report)]
+    if missing:
+        ready, failed = render_reports(pool, missing)
+        logger.info(f"ZIP {archive.pk}: {ready} PDF generados, {failed} con error")
+        reports = list(archive_queryset(archive.report_ids))
+
+    # El ZIP se escribe en un archivo temporal y se sube después, sin pasar por memoria
+    with tempfile.TemporaryFile() as tmp:
+        for chunk in iter_zip(report_zip_entries(reports)):
+            tmp.write(chunk)
+        tmp.seek(0)
+        archive.file.save(f"{archive.name}.zip", File(tmp), save=False)
+
+    archive.status = ReportArchive.STATUS_READY
+    archive.error = ''
+    archive.status_changed_at = timezone.now()
+    archive.save(update_fields=['file', 'status', 'error', 'status_changed_at'])
+
+
+def process_next_archive(pool):
+    """Genera el siguiente ZIP pendiente. Devuelve False si no había ninguno"""
+    archive = claim_archive()
+    if archive is None:
+        return False
+    try:
+        build_archive(archive, pool)
+    except Exception as e:
+        logger.error(f"Error al generar el ZIP {archive.pk}: {e}")
+        set_archive_status(archive, ReportArchive.STATUS_FAILED, str(e))
+    return True
+
+
+def run_archive_worker(processes=None, poll_interval=5.0, once=False):
+    """Bucle principal del trabajador de archivos ZIP"""
+    pool = create_render_pool(processes)
+    try:
+        while True:
+            requeue_stale_archives()
+            processed = process_next_archive(pool)
+            if once and not processed:
+                break
+            if not processed:
+                time.sleep(poll_interval)
+    finally:
+        pool.close()
+        pool.join()
@@ -0,0 +1,255 @@
+# dental_reports/assets.py
+"""
+Resolución de los recursos (imágenes, hojas de estilo) enlazados desde los PDF.
+
+xhtml2pdf llama a link_callback por cada recurso de cada renderizado. Las
+URLs de /media/ y /static/ se resuelven con la API de almacenamiento y los
+finders de Django (funciona sin STATIC_ROOT) y el resultado se memoriza por
+proceso; la fecha de modificación del archivo se vuelve a comprobar como
+mucho cada pocos segundos.
+
+Las imágenes (logos, firmas...) se decodifican y reducen una sola vez y se
+guardan como URI data: listas para incrustar, de modo que un renderizado con
+imágenes ya vistas no toca el disco.
+"""
+import base64
+from collections import OrderedDict, namedtuple
+from io import BytesIO
+import logging
+import mimetypes
+import os
+import threading
+import time
+from urllib.parse import unquote, urlsplit
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Segundos durante los que una ruta resuelta se da por buena sin volver a mirar el disco
+DEFAULT_ASSET_RECHECK_INTERVAL = 5.0
+# Lado mayor, en píxeles, de las imágenes incrustadas (~18 cm a 170 ppp)
+DEFAULT_PDF_IMAGE_MAX_SIZE = 1200
+# Memoria máxima de las imágenes preparadas, por proceso
+DEFAULT_PDF_IMAGE_CACHE_BYTES = 32 * 1024 * 1024
+
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp', '.tif', '.tiff'}
+
+ResolvedAsset = namedtuple('ResolvedAsset', ['path', 'mtime', 'checked_at'])
+
+
+def _relative_to(path, url_prefix):
+    """Nombre del recurso dentro de url_prefix, o None si la ruta no empieza por él"""
+    if not url_prefix:
+        return None
+    prefix = url_prefix.lstrip('/')
+    path = path.lstrip('/')
+    if prefix and path.startswith(prefix):
+        return path[len(prefix):]
+    return None
+
+
+def _storage_file_path(storage, name):
+    try:
+        path = storage.path(name)
+    except (NotImplementedError, SuspiciousFileOperation):
+        return None
+    return path if os.path.isfile(path) else None
+
+
+def find_asset_path(uri):
+    """
+    Ruta local de un recurso de /media/ o /static/
+
+    Returns:
+        Ruta absoluta, o None si la URI no es local o el archivo no existe
+    """
+    path = unquote(urlsplit(uri).path)
+
+    name = _relative_to(path, settings.MEDIA_URL)
+    if name is not None:
+        return _storage_file_path(default_storage, name)
+
+    name = _relative_to(path, settings.STATIC_URL)
+    if name is not None:
+        if getattr(settings, 'STATIC_ROOT', None):
+            found = _storage_file_path(staticfiles_storage, name)
+            if found:
+                return found
+        # Sin collectstatic (o sin STATIC_ROOT): buscar en las carpetas static de las apps
+        try:
+            return finders.find(name)
+        except SuspiciousFileOperation:
+            return None
+    return None
+
+
+def is_local_asset(uri):
+    path = unquote(urlsplit(uri).path)
+    return (_relative_to(path, settings.MEDIA_URL) is not None
+            or _relative_to(path, settings.STATIC_URL) is not None)
+
+
+def prepare_image(path, max_size):
+    """
+    Decodifica una imagen, la reduce si supera max_size y la devuelve como URI data:
+
+    Las imágenes JPEG o PNG que no hace falta reducir se incrustan tal cual.
+
+    Returns:
+        String con la URI data: o None si Pillow no puede abrir la imagen
+    """
+    try:
+        with Image.open(path) as image:
+            source_format = image.format
+            if max(image.size) <= max_size and source_format in ('JPEG', 'PNG'):
+                with open(path, 'rb') as f:
+                    data = f.read()
+                mimetype = Image.MIME[source_format]
+            else:
+                image.thumbnail((max_size, max_size))
+                has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+                buffer = BytesIO()
+                if has_alpha or image.mode in ('P', '1', 'L'):
+                    # Logos y firmas: PNG conserva la transparencia y los bordes nítidos
+                    image.save(buffer, 'PNG')
+                    mimetype = 'image/png'
+                else:
+                    image.convert('RGB').save(buffer, 'JPEG', quality=90)
+                    mimetype = 'image/jpeg'
+                data = buffer.getvalue()
+    except (OSError, ValueError) as e:
+        logger.warning(f'No se pudo preparar la imagen {path}: {e}')
+        return None
+    return f"data:{mimetype};base64,{base64.b64encode(data).decode('ascii')}"
+
+
+class AssetResolver:
+    """
+    Resuelve las URIs de los recursos de los PDF, memorizando rutas e imágenes
+
+    Las rutas se guardan con su fecha de modificación: si el archivo cambia,
+    la imagen preparada deja de coincidir y se vuelve a preparar.
+    """
+
+    def __init__(self, recheck_interval=None, image_max_size=None, image_cache_bytes=None):
+        self._recheck_interval = recheck_interval
+        self._image_max_size = image_max_size
+        self._image_cache_bytes = image_cache_bytes
+        self._paths = {}
+        self._images = OrderedDict()
+        self._images_size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def recheck_interval(self):
+        if self._recheck_interval is not None:
+            return self._recheck_interval
+        return getattr(settings, 'DENTAL_REPORTS_ASSET_RECHECK_INTERVAL', DEFAULT_ASSET_RECHECK_INTERVAL)
+
+    @property
+    def image_max_size(self):
+        if self._image_max_size is not None:
+            return self._image_max_size
+        return getattr(settings, 'DENTAL_REPORTS_PDF_IMAGE_MAX_SIZE', DEFAULT_PDF_IMAGE_MAX_SIZE)
+
+    @property
+    def image_cache_bytes(self):
+        if self._image_cache_bytes is not None:
+            return self._image_cache_bytes
+        return getattr(settings, 'DENTAL_REPORTS_PDF_IMAGE_CACHE_BYTES', DEFAULT_PDF_IMAGE_CACHE_BYTES)
+
+    def resolve(self, uri):
+        """Ruta local y fecha de modificación de una URI (path None si no existe)"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._paths.get(uri)
+        if entry is not None and now - entry.checked_at < self.recheck_interval:
+            return entry
+
+        path = find_asset_path(uri)
+        mtime = None
+        if path is not None:
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except OSError:
+                path = None
+        if path is None and (entry is None or entry.path is not None):
+            # Sólo se avisa la primera vez, no en cada renderizado
+            logger.warning(f'Media URI {uri} no encontrado')
+
+        entry = ResolvedAsset(path, mtime, now)
+        with self._lock:
+            self._paths[uri] = entry
+        return entry
+
+    def embeddable_image(self, path, mtime):
+        """URI data: de una imagen ya preparada, preparándola sólo si no está en caché"""
+        key = (path, mtime, self.image_max_size)
+        with self._lock:
+            data_uri = self._images.get(key)
+            if data_uri is not None:
+                self._images.move_to_end(key)
+                self.hits += 1
+                return data_uri
+            self.misses += 1
+
+        # Decodificar fuera del lock para no bloquear al resto de hilos
+        data_uri = prepare_image(path, self.image_max_size)
+        if data_uri is None or len(data_uri) > self.image_cache_bytes:
+            return data_uri
+
+        with self._lock:
+            if key not in self._images:
+                self._images[key] = data_uri
+                self._images_size += len(data_uri)
+            while self._images_size > self.image_cache_bytes:
+                _, evicted = self._images.popitem(last=False)
+                self._images_size -= len(evicted)
+        return data_uri
+
+    def link_callback(self, uri, rel=None):
+        """
+        Traduce una URI del HTML a lo que recibe xhtml2pdf: una URI data: para
+        las imágenes locales, la ruta del archivo para el resto de recursos
+        locales y la URI original para los externos o inexistentes
+        """
+        if uri.startswith('data:') or not is_local_asset(uri):
+            return uri
+
+        entry = self.resolve(uri)
+        if entry.path is None:
+            return uri
+
+        extension = os.path.splitext(entry.path)[1].lower()
+        if extension in IMAGE_EXTENSIONS or (mimetypes.guess_type(entry.path)[0] or '').startswith('image/'):
+            return self.embeddable_image(entry.path, entry.mtime) or entry.path
+        return entry.path
+
+    def clear(self):
+        with self._lock:
+            self._paths.clear()
+            self._images.clear()
+            self._images_size = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'paths': len(self._paths),
+                'images': len(self._images),
+                'image_bytes': self._images_size,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+asset_resolver = AssetResolver()
@@ -0,0 +1,678 @@
+# dental_reports/benchmarks.py
+"""
+Benchmarks de las rutas críticas de generación de informes.
+
+Se ejecutan con `manage.py run_benchmarks`, que puede guardar los resultados
+en JSON (con percentiles y datos del entorno) y compararlos con los de una
+versión anterior para detectar regresiones.
+
+Los benchmarks de base de datos crean sus datos dentro de una transacción que
+se deshace al terminar y usan una caché en memoria propia, de modo que no
+dejan rastro ni en la base de datos ni en la caché configurada.
+"""
+from contextlib import contextmanager
+from importlib import import_module
+from io import BytesIO
+import os
+import platform
+import random
+import statistics
+import tempfile
+import threading
+import time
+
+import django
+from django import forms
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connection, connections, transaction
+from django.template import Context, Template
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.text import slugify
+from PIL import Image, ImageDraw
+from xhtml2pdf import pisa
+
+from DentalReportsProject.database import sqlite_options
+
+from .assets import asset_resolver
+from .dashboard import build_dashboard, reconcile_counters
+from .fields_schema import DENTITIONS, schema_fields
+from .forms import DynamicReportForm
+from .management.commands.create_default_templates import DEFAULT_TEMPLATES
+from .models import GeneratedReport, ReportTemplate
+from .queries import encode_cursor
+from .rendering import build_report_context, render_report_html
+from .utils import (
+    PDF_BASE_CSS, PDF_PAGE_CSS, PDF_RENDERER_VERSION, XHTML2PDF_VERSION, PdfRenderer, generate_pdf_from_html,
+    get_pdf_renderer, link_callback,
+)
+
+
+SAMPLE_REPORT_HTML = """
+<h1>INFORME DE ENDODONCIA</h1>
+<p><strong>Paciente:</strong> Juan Pérez</p>
+<p><strong>Médico:</strong> Dra. Laura Martínez</p>
+<h2>Diagnóstico</h2>
+<p>Pulpitis irreversible en el diente 36.</p>
+<table>
+    <tr><th>Pieza</th><th>Tratamiento</th></tr>
+    <tr><td>36</td><td>Endodoncia unirradicular</td></tr>
+</table>
+"""
+
+
+def time_callable(func, repeat=20, warmup=2):
+    """Ejecuta func repetidamente y devuelve la duración de cada llamada en segundos"""
+    for _ in range(warmup):
+        func()
+
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def percentile(ordered, fraction):
+    """Percentil (interpolación lineal) de una lista ya ordenada"""
+    position = (len(ordered) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize(samples):
+    """Resumen en milisegundos de una lista de duraciones"""
+    ordered = sorted(samples)
+    return {
+        'n': len(samples),
+        'mean_ms': statistics.fmean(samples) * 1000,
+        'median_ms': statistics.median(samples) * 1000,
+        'min_ms': ordered[0] * 1000,
+        'p90_ms': percentile(ordered, 0.90) * 1000,
+        'p95_ms': percentile(ordered, 0.95) * 1000,
+        'p99_ms': percentile(ordered, 0.99) * 1000,
+        'max_ms': ordered[-1] * 1000,
+    }
+
+
+def count_queries(func):
+    """Número de consultas SQL que hace una llamada a func"""
+    with CaptureQueriesContext(connection) as queries:
+        func()
+    return len(queries.captured_queries)
+
+
+def _legacy_styled_html(html_content):
+    """Documento tal y como se construía antes en cada llamada, con la hoja de estilos incrustada"""
+    return f"""
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <meta charset="UTF-8">
+        <title>Informe Dental</title>
+        <style>
+            {PDF_PAGE_CSS}
+            {PDF_BASE_CSS}
+        </style>
+    </head>
+    <body>
+        {html_content}
+        <div class="footer">
+            <span class="page-number"></span>
+        </div>
+    </body>
+    </html>
+    """
+
+
+def _legacy_render(html_content):
+    result = BytesIO()
+    pisa.pisaDocument(BytesIO(_legacy_styled_html(html_content).encode("UTF-8")), result,
+                      link_callback=link_callback, encoding='utf-8')
+    return result.getvalue()
+
+
+def bench_pdf_shell(repeat=20, **options):
+    """
+    Construcción del documento y renderizado: f-string por llamada frente al
+    PdfRenderer compartido (get_pdf_renderer) y frente a uno nuevo en cada llamada
+    """
+    renderer = get_pdf_renderer()
+    return {
+        'legacy_build': summarize(time_callable(lambda: _legacy_styled_html(SAMPLE_REPORT_HTML), repeat * 50)),
+        'renderer_per_call_build': summarize(time_callable(
+            lambda: PdfRenderer().build_html(SAMPLE_REPORT_HTML), repeat * 50)),
+        'renderer_build': summarize(time_callable(lambda: renderer.build_html(SAMPLE_REPORT_HTML), repeat * 50)),
+        'legacy_render': summarize(time_callable(lambda: _legacy_render(SAMPLE_REPORT_HTML), repeat)),
+        'renderer_render': summarize(time_callable(lambda: renderer.render_bytes(SAMPLE_REPORT_HTML), repeat)),
+    }
+
+
+SAMPLE_FIELDS_SCHEMA = {
+    'fields': [
+        {'name': 'diente', 'label': 'Diente', 'type': 'text', 'required': True},
+        {'name': 'diagnostico', 'label': 'Diagnóstico', 'type': 'textarea', 'required': True},
+        {'name': 'procedimiento', 'label': 'Procedimiento', 'type': 'select',
+         'options': ['Endodoncia', 'Obturación', 'Extracción', 'Corona']},
+        {'name': 'longitud', 'label': 'Longitud de trabajo (mm)', 'type': 'number'},
+        {'name': 'proxima_cita', 'label': 'Próxima cita', 'type': 'date'},
+        {'name': 'requiere_cirugia', 'label': 'Requiere cirugía', 'type': 'checkbox'},
+        {'name': 'observaciones', 'label': 'Observaciones', 'type': 'textarea'},
+    ]
+}
+
+SAMPLE_FORM_DATA = {
+    'patient_name': 'Juan Pérez',
+    'doctor_name': 'Dra. Laura Martínez',
+    'diente': '36',
+    'diagnostico': 'Pulpitis irreversible',
+    'procedimiento': 'Endodoncia',
+    'longitud': '21.5',
+    'proxima_cita': '2025-06-01',
+    'requiere_cirugia': '',
+    'observaciones': 'Sin incidencias',
+}
+
+
+class _LegacyDynamicReportForm(forms.Form):
+    """DynamicReportForm tal y como era antes: los campos se creaban en cada instancia"""
+    patient_name = forms.CharField(label="Nombre del paciente", required=True)
+    doctor_name = forms.CharField(label="Nombre del doctor", required=True)
+
+    def __init__(self, *args, **kwargs):
+        template = kwargs.pop('template', None)
+        super().__init__(*args, **kwargs)
+        for field_config in template.fields_schema.get('fields', []):
+            field_name = field_config.get('name')
+            field_label = field_config.get('label', field_name)
+            field_type = field_config.get('type', 'text')
+            field_required = field_config.get('required', False)
+            field_help = field_config.get('help_text', '')
+            if field_type == 'text':
+                self.fields[field_name] = forms.CharField(label=field_label, required=field_required,
+                                                          help_text=field_help)
+            elif field_type == 'textarea':
+                self.fields[field_name] = forms.CharField(label=field_label, required=field_required,
+                                                          help_text=field_help,
+                                                          widget=forms.Textarea(attrs={'rows': 3}))
+            elif field_type == 'number':
+                self.fields[field_name] = forms.FloatField(label=field_label, required=field_required,
+                                                           help_text=field_help)
+            elif field_type == 'date':
+                self.fields[field_name] = forms.DateField(label=field_label, required=field_required,
+                                                          help_text=field_help,
+                                                          widget=forms.DateInput(attrs={'type': 'date'}))
+            elif field_type == 'select' and field_config.get('options'):
+                self.fields[field_name] = forms.ChoiceField(
+                    label=field_label, required=field_required, help_text=field_help,
+                    choices=[(option, option) for option in field_config['options']])
+            elif field_type == 'checkbox':
+                self.fields[field_name] = forms.BooleanField(label=field_label, required=False,
+                                                             help_text=field_help)
+
+
+def bench_report_form(repeat=20, **options):
+    """Instanciación y validación del formulario dinámico: campos por petición frente a clase cacheada"""
+    # Plantilla sin guardar con pk: no hace falta base de datos
+    template = ReportTemplate(pk=1, name='Benchmark', fields_schema=SAMPLE_FIELDS_SCHEMA)
+
+    def legacy():
+        form = _LegacyDynamicReportForm(SAMPLE_FORM_DATA, template=template)
+        assert form.is_valid(), form.errors
+
+    def cached():
+        form = DynamicReportForm(SAMPLE_FORM_DATA, template=template)
+        assert form.is_valid(), form.errors
+
+    results = {
+        'legacy_form': summarize(time_callable(legacy, repeat * 50)),
+        'cached_form_class': summarize(time_callable(cached, repeat * 50)),
+    }
+
+    # Formularios de las plantillas predefinidas
+    for template in default_templates():
+        data = sample_form_data(template.fields_schema)
+
+        def build_and_validate(template=template, data=data):
+            form = DynamicReportForm(data, template=template)
+            assert form.is_valid(), form.errors
+
+        results[f'{slugify(template.name)}.form'] = summarize(time_callable(build_and_validate, repeat * 50))
+    return results
+
+
+def sample_value(config):
+    """Valor válido de ejemplo para un campo del esquema"""
+    field_type = config.get('type', 'text')
+    if field_type == 'textarea':
+        return 'Paciente asintomático. Se recomienda control radiográfico en seis meses. ' * 3
+    if field_type == 'number':
+        return '12'
+    if field_type == 'date':
+        return '2025-06-01'
+    if field_type == 'select':
+        return config['options'][0]
+    if field_type == 'checkbox':
+        return 'on'
+    if field_type == 'multiselect':
+        return config['options'][:2]
+    if field_type == 'teeth':
+        return DENTITIONS[config.get('dentition', 'permanent')][:3]
+    if field_type == 'rows':
+        return '\n'.join(' | '.join('1' if column.get('type') == 'number' else
+                                     '2025-06-01' if column.get('type') == 'date' else 'valor'
+                                     for column in config['columns'])
+                         for _ in range(3))
+    return 'Texto de ejemplo'
+
+
+def sample_form_data(fields_schema):
+    """Datos de formulario válidos para un esquema de campos"""
+    data = {'patient_name': 'Juan Pérez', 'doctor_name': 'Dra. Laura Martínez'}
+    for config in schema_fields(fields_schema):
+        data[config['name']] = sample_value(config)
+    return data
+
+
+def default_templates():
+    """Plantillas predefinidas (create_default_templates) sin guardar, con pk para la caché"""
+    now = timezone.now()
+    return [
+        ReportTemplate(pk=-(index + 1), name=definition['name'], html_content=definition['html_content'],
+                       fields_schema=definition['fields_schema'], updated_at=now)
+        for index, definition in enumerate(DEFAULT_TEMPLATES)
+    ]
+
+
+def bench_default_templates(repeat=20, **options):
+    """Compilación y renderizado de las plantillas predefinidas: sin caché frente a plantilla compilada"""
+    results = {}
+    for template in default_templates():
+        form = DynamicReportForm(sample_form_data(template.fields_schema), template=template)
+        assert form.is_valid(), form.errors
+        context_data = build_report_context(template, form.cleaned_data)
+        slug = slugify(template.name)
+
+        results[f'{slug}.compile_render'] = summarize(time_callable(
+            lambda: Template(template.html_content).render(Context(context_data)), repeat * 50))
+        results[f'{slug}.cached_render'] = summarize(time_callable(
+            lambda: render_report_html(template, context_data), repeat * 50))
+    return results
+
+
+# Páginas de los documentos del benchmark de PDF
+PDF_PAGE_COUNTS = (1, 10, 50)
+
+PDF_PAGE_BREAK = '<div style="page-break-before: always"></div>'
+
+
+def _benchmark_images():
+    """Logo (JPEG grande) y firma (PNG con transparencia) guardados en MEDIA_ROOT"""
+    logo = Image.linear_gradient('L').resize((2400, 800)).convert('RGB')
+    logo_buffer = BytesIO()
+    logo.save(logo_buffer, 'JPEG', quality=90)
+
+    signature = Image.new('RGBA', (1600, 400), (255, 255, 255, 0))
+    ImageDraw.Draw(signature).line([(50, 300), (400, 80), (800, 320), (1500, 60)], fill=(20, 20, 80, 255), width=12)
+    signature_buffer = BytesIO()
+    signature.save(signature_buffer, 'PNG')
+
+    return [
+        settings.MEDIA_URL + default_storage.save('benchmarks/logo.jpg', ContentFile(logo_buffer.getvalue())),
+        settings.MEDIA_URL + default_storage.save('benchmarks/firma.png', ContentFile(signature_buffer.getvalue())),
+    ]
+
+
+def pdf_document(pages, image_urls=()):
+    """Contenido de un informe de `pages` páginas, con las imágenes indicadas en cada una"""
+    images = ''.join(f'<img src="{url}" width="200">' for url in image_urls)
+    return PDF_PAGE_BREAK.join(images + SAMPLE_REPORT_HTML for _ in range(pages))
+
+
+@contextmanager
+def temporary_media():
+    """MEDIA_ROOT temporal, con la caché de recursos de los PDF vacía"""
+    with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+        asset_resolver.clear()
+        try:
+            yield
+        finally:
+            asset_resolver.clear()
+
+
+def bench_pdf(repeat=20, **options):
+    """generate_pdf_from_html con documentos de 1, 10 y 50 páginas, con y sin imágenes"""
+    results = {}
+    with temporary_media():
+        image_urls = _benchmark_images()
+        for pages in PDF_PAGE_COUNTS:
+            # Los documentos largos tardan segundos: menos repeticiones
+            samples = max(3, repeat // pages)
+            for suffix, urls in (('', ()), ('_images', image_urls)):
+                html_content = pdf_document(pages, urls)
+                summary = summarize(time_callable(lambda: generate_pdf_from_html(html_content), samples, warmup=1))
+                summary['pages'] = pages
+                results[f'pages_{pages}{suffix}'] = summary
+    return results
+
+
+# Filas de informes con las que se mide el listado
+REPORT_LIST_SIZES = (10_000, 100_000)
+# Filas de informes con las que se mide el panel de inicio
+DASHBOARD_ROWS = 10_000
+
+BENCHMARK_FIRST_NAMES = ['Ana', 'Luis', 'María', 'Carlos', 'Lucía', 'Javier', 'Elena', 'Pablo', 'Sara', 'Diego']
+BENCHMARK_LAST_NAMES = ['García', 'Martínez', 'López', 'Sánchez', 'Pérez', 'Gómez', 'Fernández', 'Ruiz']
+
+BULK_BATCH_SIZE = 2000
+
+
+@contextmanager
+def scratch_database():
+    """
+    Transacción que se deshace al terminar, con una caché en memoria aislada
+
+    Los datos creados dentro (y las invalidaciones de caché pendientes de
+    on_commit) se descartan.
+    """
+    benchmark_cache = {'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'dental-reports-benchmarks',
+    }}
+    with override_settings(CACHES=benchmark_cache):
+        with transaction.atomic():
+            try:
+                yield
+            finally:
+                transaction.set_rollback(True)
+                cache.clear()
+
+
+def create_benchmark_data():
+    """Usuario y plantillas predefinidas (guardadas) para los benchmarks de base de datos"""
+    user = User.objects.create(username=f'benchmark-{time.time_ns()}')
+    templates = [
+        ReportTemplate.objects.create(name=definition['name'], description=definition['description'],
+                                      html_content=definition['html_content'],
+                                      fields_schema=definition['fields_schema'], created_by=user)
+        for definition in DEFAULT_TEMPLATES
+    ]
+    return user, templates
+
+
+def create_benchmark_reports(user, templates, count, start=0, seed=0):
+    """Crea `count` informes con bulk_create (sin señales ni PDF)"""
+    rng = random.Random(seed + start)
+    batch = []
+    for number in range(start, start + count):
+        template = templates[number % len(templates)]
+        patient_name = f"{rng.choice(BENCHMARK_FIRST_NAMES)} {rng.choice(BENCHMARK_LAST_NAMES)} {number}"
+        batch.append(GeneratedReport(
+            template=template,
+            patient_name=patient_name,
+            doctor_name='Dra. Laura Martínez',
+            title=f"Informe para {patient_name} - {template.name}",
+            report_content=SAMPLE_REPORT_HTML,
+            form_data=SAMPLE_FORM_DATA,
+            created_by=user,
+            pdf_status=GeneratedReport.PDF_READY,
+        ))
+        if len(batch) >= BULK_BATCH_SIZE:
+            GeneratedReport.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        GeneratedReport.objects.bulk_create(batch)
+
+
+def view_request(view, path, user, params=None):
+    """Llama a una vista con una petición GET construida a mano (sin middleware)"""
+    request = RequestFactory().get(path, params or {})
+    request.user = user
+    request.session = import_module(settings.SESSION_ENGINE).SessionStore()
+    request._messages = FallbackStorage(request)
+    response = view(request)
+    assert response.status_code == 200, response.status_code
+    return response
+
+
+def bench_report_list(repeat=20, sizes=None, **options):
+    """Listado de informes (primera página, filtros y página profunda) con 10.000 y 100.000 filas"""
+    from .views import report_list
+
+    path = reverse('dental_reports:report_list')
+    results = {}
+    with scratch_database():
+        user, templates = create_benchmark_data()
+        created = 0
+        for size in sorted(sizes or REPORT_LIST_SIZES):
+            create_benchmark_reports(user, templates, size - created, start=created)
+            created = size
+
+            middle = GeneratedReport.objects.filter(created_by=user).order_by('-created_at', '-id')[size // 2]
+            cases = {
+                'first_page': {},
+                'template_filter': {'template': str(templates[0].pk)},
+                'patient_prefix': {'patient': 'Ana'},
+                'month': {'month': timezone.localdate().strftime('%Y-%m')},
+                'deep_page': {'after': encode_cursor(middle)},
+            }
+            for case, params in cases.items():
+                def call(params=params):
+                    view_request(report_list, path, user, params)
+
+                summary = summarize(time_callable(call, repeat))
+                summary['queries'] = count_queries(call)
+                summary['rows'] = size
+                results[f'rows_{size}.{case}'] = summary
+    return results
+
+
+def bench_home(repeat=20, **options):
+    """Consultas del panel de inicio: construcción del panel y vista con la caché fría y caliente"""
+    from .views import home
+
+    path = reverse('dental_reports:home')
+    results = {}
+    with scratch_database():
+        user, templates = create_benchmark_data()
+        create_benchmark_reports(user, templates, DASHBOARD_ROWS)
+        reconcile_counters()
+
+        def cold():
+            cache.clear()
+            view_request(home, path, user)
+
+        def warm():
+            view_request(home, path, user)
+
+        for case, func in (('build_dashboard', build_dashboard), ('view_cold', cold), ('view_warm', warm)):
+            warm()
+            summary = summarize(time_callable(func, repeat))
+            summary['queries'] = count_queries(func)
+            results[case] = summary
+    return results
+
+
+# Escritores y lectores simultáneos del benchmark de escritura concurrente
+CONCURRENT_WRITERS = 8
+CONCURRENT_READERS = 2
+
+
+@contextmanager
+def temporary_sqlite_database(alias, options):
+    """Base de datos SQLite temporal registrada como `alias`, con las OPTIONS indicadas"""
+    with tempfile.TemporaryDirectory() as directory:
+        # configure_settings completa los valores por defecto y exige la base de datos 'default'
+        connections.settings[alias] = connections.configure_settings({
+            DEFAULT_DB_ALIAS: connections.settings[DEFAULT_DB_ALIAS],
+            alias: {
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': os.path.join(directory, f'{alias}.sqlite3'),
+                'OPTIONS': options,
+            },
+        })[alias]
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute('CREATE TABLE benchmark_writes ('
+                               'id INTEGER PRIMARY KEY AUTOINCREMENT, writer INTEGER, payload TEXT)')
+            connections[alias].close()
+            yield alias
+        finally:
+            connections[alias].close()
+            del connections.settings[alias]
+
+
+def _run_writer(alias, writer, writes, barrier, latencies, errors):
+    try:
+        barrier.wait()
+        for _ in range(writes):
+            start = time.perf_counter()
+            try:
+                # Leer y después escribir en la misma transacción, como al crear un informe
+                with transaction.atomic(using=alias), connections[alias].cursor() as cursor:
+                    cursor.execute('SELECT COUNT(*) FROM benchmark_writes WHERE writer = %s', [writer])
+                    cursor.execute('INSERT INTO benchmark_writes (writer, payload) VALUES (%s, %s)',
+                                   [writer, SAMPLE_REPORT_HTML])
+            except OperationalError:
+                errors.append(writer)
+                continue
+            latencies.append(time.perf_counter() - start)
+    finally:
+        connections[alias].close()
+
+
+def _run_reader(alias, done, barrier, latencies, errors):
+    try:
+        barrier.wait()
+        while not done.is_set():
+            start = time.perf_counter()
+            try:
+                with connections[alias].cursor() as cursor:
+                    cursor.execute('SELECT id, payload FROM benchmark_writes ORDER BY id DESC LIMIT 50')
+                    cursor.fetchall()
+            except OperationalError:
+                errors.append(None)
+                continue
+            latencies.append(time.perf_counter() - start)
+    finally:
+        connections[alias].close()
+
+
+def measure_concurrent_writes(alias, writers, writes_per_writer, readers):
+    """Lanza escritores y lectores simultáneos contra `alias` y resume latencias y errores"""
+    barrier = threading.Barrier(writers + readers)
+    done = threading.Event()
+    write_latencies, write_errors, read_latencies, read_errors = [], [], [], []
+
+    reader_threads = [
+        threading.Thread(target=_run_reader, args=(alias, done, barrier, read_latencies, read_errors))
+        for _ in range(readers)
+    ]
+    writer_threads = [
+        threading.Thread(target=_run_writer,
+                         args=(alias, writer, writes_per_writer, barrier, write_latencies, write_errors))
+        for writer in range(writers)
+    ]
+    start = time.perf_counter()
+    for thread in reader_threads + writer_threads:
+        thread.start()
+    for thread in writer_threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    done.set()
+    for thread in reader_threads:
+        thread.join()
+
+    summary = summarize(write_latencies) if write_latencies else {'n': 0}
+    summary.update({
+        'writers': writers,
+        'errors': len(write_errors),
+        'writes_per_second': round(len(write_latencies) / elapsed, 1),
+        'reads': len(read_latencies),
+        'read_errors': len(read_errors),
+        'read_p95_ms': percentile(sorted(read_latencies), 0.95) * 1000 if read_latencies else None,
+    })
+    return summary
+
+
+def bench_concurrent_writes(repeat=20, **options):
+    """
+    Prueba de carga de escritura en SQLite: configuración por defecto de Django
+    frente a la de DentalReportsProject.database (WAL, IMMEDIATE, busy_timeout)
+
+    SQLite admite un solo escritor a la vez en los dos casos; la diferencia es
+    que con la configuración ajustada los escritores esperan su turno en lugar
+    de fallar con "database is locked", y los lectores no se bloquean.
+    """
+    writes_per_writer = max(repeat * 5, 20)
+    results = {}
+    for case, sqlite_config in (('django_defaults', {}), ('wal_immediate', sqlite_options())):
+        with temporary_sqlite_database(f'benchmark_{case}', sqlite_config) as alias:
+            results[case] = measure_concurrent_writes(alias, CONCURRENT_WRITERS, writes_per_writer,
+                                                      CONCURRENT_READERS)
+    return results
+
+
+BENCHMARKS = {
+    'concurrent_writes': bench_concurrent_writes,
+    'default_templates': bench_default_templates,
+    'home': bench_home,
+    'pdf': bench_pdf,
+    'pdf_shell': bench_pdf_shell,
+    'report_form': bench_report_form,
+    'report_list': bench_report_list,
+}
+
+
+def environment():
+    """Datos del entorno en el que se han tomado las medidas"""
+    return {
+        'timestamp': timezone.now().isoformat(),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'xhtml2pdf': XHTML2PDF_VERSION,
+        'pdf_renderer': PDF_RENDERER_VERSION,
+        'database': connection.vendor,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def run_benchmarks(names=None, repeat=20, **options):
+    """
+    Ejecuta los benchmarks indicados (todos por defecto)
+
+    Returns:
+        Diccionario {'environment': {...}, 'results': {benchmark: {caso: resumen}}}
+    """
+    results = {}
+    for name in names or sorted(BENCHMARKS):
+        results[name] = BENCHMARKS[name](repeat=repeat, **options)
+    return {'environment': environment(), 'results': results}
+
+
+def compare_results(baseline, current, metric='median_ms', tolerance=0.2):
+    """
+    Casos que han empeorado más de `tolerance` (fracción) respecto a una ejecución anterior
+
+    Returns:
+        Lista de tuplas (benchmark, caso, valor anterior, valor actual)
+    """
+    regressions = []
+    for name, cases in current['results'].items():
+        for case, summary in cases.items():
+            previous = baseline.get('results', {}).get(name, {}).get(case)
+            if not previous or metric not in previous or metric not in summary:
+                continue
+            if summary[metric] > previous[metric] * (1 + tolerance):
+                regressions.append((name, case, previous[metric], summary[metric]))
+    return regressions
@@ -0,0 +1,173 @@
+# dental_reports/cache.py
+"""
+Capa de caché de la aplicación sobre la caché por defecto de Django.
+
+Las claves se agrupan en espacios de nombres ('templates', 'clinics'...). Cada
+espacio tiene una versión guardada en la propia caché que se guarda junto a
+cada entrada: invalidar un espacio es cambiar su versión, sin tener que
+localizar ni borrar sus entradas (se descartan al leerlas o caducan solas).
+La versión y la entrada se leen juntas con `get_many`, en un solo viaje a la
+caché.
+
+Los aciertos y fallos se cuentan por espacio de nombres en cada proceso;
+`cache_stats()` devuelve la tasa de aciertos.
+"""
+from functools import wraps
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+DEFAULT_VIEW_CACHE_TIMEOUT = 600
+
+# Espacios de nombres usados por la aplicación
+NAMESPACES = ('dashboard', 'templates', 'categories', 'clinics', 'dentists', 'renders')
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def _version_key(namespace):
+    return f'ns:{namespace}:version'
+
+
+def namespace_version(namespace):
+    """Versión actual de un espacio de nombres (se crea si no existe)"""
+    version = cache.get(_version_key(namespace))
+    if version is None:
+        # Una marca de tiempo, no un contador: si la versión se pierde (desalojo,
+        # reinicio) la nueva nunca coincide con la de entradas antiguas
+        cache.add(_version_key(namespace), time.time_ns(), None)
+        version = cache.get(_version_key(namespace))
+    return version
+
+
+def make_key(namespace, *parts):
+    """Clave de una entrada dentro de un espacio de nombres (la versión va en el valor)"""
+    raw = ':'.join(str(part) for part in parts)
+    if len(raw) > 150:
+        raw = hashlib.sha256(raw.encode('utf-8')).hexdigest()
+    return f'ns:{namespace}:entry:{raw}'
+
+
+def _get_versioned(namespace, key):
+    """
+    Lee a la vez la versión del espacio de nombres y la entrada `key`
+
+    Returns:
+        (versión actual, valor) con valor None si no hay entrada o es de una versión anterior
+    """
+    version_key = _version_key(namespace)
+    found = cache.get_many([version_key, key])
+    version = found.get(version_key)
+    if version is None:
+        return namespace_version(namespace), None
+    entry = found.get(key)
+    if not isinstance(entry, tuple) or len(entry) != 2 or entry[0] != version:
+        return version, None
+    return version, entry[1]
+
+
+def invalidate(*namespaces):
+    """Invalida todas las entradas de los espacios de nombres dados al confirmar la transacción"""
+    def bump():
+        cache.set_many({_version_key(namespace): time.time_ns() for namespace in namespaces}, None)
+    transaction.on_commit(bump)
+
+
+def record(namespace, hit):
+    with _stats_lock:
+        stats = _stats.setdefault(namespace, [0, 0])
+        stats[0 if hit else 1] += 1
+
+
+def cache_stats():
+    """Aciertos, fallos y tasa de aciertos por espacio de nombres (de este proceso)"""
+    with _stats_lock:
+        snapshot = {namespace: tuple(values) for namespace, values in _stats.items()}
+    result = {}
+    for namespace, (hits, misses) in sorted(snapshot.items()):
+        total = hits + misses
+        result[namespace] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': hits / total if total else 0.0,
+        }
+    return result
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+def get_or_set(namespace, key, default, timeout=None):
+    """
+    Devuelve el valor cacheado o lo calcula con `default()` y lo guarda
+
+    Args:
+        namespace: Espacio de nombres
+        key: Clave (o tupla de partes de la clave) dentro del espacio
+        default: Función sin argumentos que calcula el valor
+        timeout: Segundos de validez (None = el TIMEOUT de la caché)
+    """
+    parts = key if isinstance(key, tuple) else (key,)
+    full_key = make_key(namespace, *parts)
+    version, value = _get_versioned(namespace, full_key)
+    record(namespace, value is not None)
+    if value is None:
+        value = default()
+        if timeout is None:
+            cache.set(full_key, (version, value))
+        else:
+            cache.set(full_key, (version, value), timeout)
+    return value
+
+
+def _has_pending_messages(request):
+    # len() no marca los mensajes como leídos
+    storage = getattr(request, '_messages', None)
+    return storage is not None and len(storage) > 0
+
+
+def cached_view(namespace, timeout=None):
+    """
+    Cachea la respuesta de una vista de sólo lectura dentro de un espacio de nombres
+
+    La clave incluye el usuario, la URL completa (con los filtros GET) y la
+    cookie CSRF, porque las páginas con formularios llevan un token que deriva
+    de ella. No se cachean las peticiones con mensajes pendientes ni las
+    respuestas que no sean 200.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or _has_pending_messages(request):
+                return view_func(request, *args, **kwargs)
+
+            csrf_cookie = request.COOKIES.get(settings.CSRF_COOKIE_NAME, '')
+            key = make_key(
+                namespace, 'view', view_func.__name__, request.user.pk or 'anon',
+                hashlib.sha256(csrf_cookie.encode('utf-8')).hexdigest()[:16],
+                request.get_full_path(),
+            )
+            version, response = _get_versioned(namespace, key)
+            record(namespace, response is not None)
+            if response is not None:
+                return response
+
+            response = view_func(request, *args, **kwargs)
+            # Si la vista acaba de generar la cookie CSRF, la clave de la próxima petición será otra
+            if (response.status_code == 200 and not response.streaming
+                    and not request.META.get('CSRF_COOKIE_NEEDS_UPDATE')):
+                cache_timeout = timeout
+                if cache_timeout is None:
+                    cache_timeout = getattr(settings, 'DENTAL_REPORTS_VIEW_CACHE_TIMEOUT',
+                                            DEFAULT_VIEW_CACHE_TIMEOUT)
+                cache.set(key, (version, response), cache_timeout)
+            return response
+        return wrapper
+    return decorator
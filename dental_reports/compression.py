@@ -0,0 +1,396 @@
+# dental_reports/compression.py
+"""
+Almacenamiento comprimido de los campos grandes de los informes.
+
+GeneratedReport.report_content y form_data se guardan en una columna binaria
+con una cabecera de 7 bytes seguida de los datos:
+
+    MAGIC (2) | códec (1: n = sin comprimir, z = zlib, s = zstd) | id de diccionario (4)
+
+El códec se elige con DENTAL_REPORTS_COMPRESSION_CODEC ('auto' usa zstd si
+el paquete `zstandard` está instalado y zlib si no). Los textos por debajo de
+DENTAL_REPORTS_COMPRESSION_MIN_BYTES se guardan sin comprimir.
+
+La mayor parte del HTML de un informe es el marcado de su plantilla, que se
+repite en miles de filas. Comprimir cada fila por separado no aprovecha esa
+repetición, así que se puede entrenar un diccionario por plantilla
+(`manage.py compress_reports --train`) a partir de sus últimos informes: la
+compresión de cada informe pasa entonces a costar, sobre todo, lo que tiene
+de distinto. Los diccionarios no se modifican ni se borran nunca (las filas
+los referencian por id); reentrenar crea uno nuevo.
+
+Las filas anteriores (texto sin cabecera) se siguen leyendo tal cual y
+`manage.py compress_reports` las reescribe por lotes. Estos campos no admiten
+búsquedas en SQL sobre su contenido (icontains, claves de JSON...): para eso
+están el índice de búsqueda y ReportFieldValue.
+"""
+import functools
+import json
+import struct
+import threading
+import time
+import zlib
+
+from django.apps import apps
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+MAGIC = b'\xddR'  # 0xdd 0x52 no es UTF-8 válido: no se confunde con un texto antiguo
+HEADER = struct.Struct('>2scI')
+CODEC_NONE = b'n'
+CODEC_ZLIB = b'z'
+CODEC_ZSTD = b's'
+CODEC_NAMES = {'none': CODEC_NONE, 'zlib': CODEC_ZLIB, 'zstd': CODEC_ZSTD}
+
+DEFAULT_COMPRESSION_CODEC = 'auto'
+DEFAULT_COMPRESSION_MIN_BYTES = 256
+DEFAULT_COMPRESSION_DICT_SIZE = 64 * 1024
+
+# zlib sólo usa los últimos 32 KB de un diccionario
+ZLIB_MAX_DICT_SIZE = 32 * 1024
+
+# Segundos que cada proceso recuerda qué diccionario usar con cada plantilla
+ACTIVE_DICTIONARY_TIMEOUT = 60
+
+
+class EncodedValue(bytes):
+    """Valor ya codificado (cabecera + datos) que se guarda tal cual"""
+
+
+def default_codec():
+    name = getattr(settings, 'DENTAL_REPORTS_COMPRESSION_CODEC', DEFAULT_COMPRESSION_CODEC)
+    if name == 'auto':
+        return CODEC_ZSTD if zstandard is not None else CODEC_ZLIB
+    if name not in CODEC_NAMES:
+        raise ValueError(f"Códec de compresión desconocido: {name!r}")
+    if name == 'zstd' and zstandard is None:
+        raise RuntimeError("DENTAL_REPORTS_COMPRESSION_CODEC = 'zstd' requiere el paquete zstandard")
+    return CODEC_NAMES[name]
+
+
+def compression_level(codec):
+    level = getattr(settings, 'DENTAL_REPORTS_COMPRESSION_LEVEL', None)
+    if level is not None:
+        return level
+    return 9 if codec == CODEC_ZLIB else 6
+
+
+def min_bytes():
+    return getattr(settings, 'DENTAL_REPORTS_COMPRESSION_MIN_BYTES', DEFAULT_COMPRESSION_MIN_BYTES)
+
+
+# --- Diccionarios ---------------------------------------------------------
+
+@functools.lru_cache(maxsize=256)
+def load_dictionary(dictionary_id):
+    """(códec, datos) de un diccionario; son inmutables, así que se cachean sin caducidad"""
+    CompressionDictionary = apps.get_model('dental_reports', 'CompressionDictionary')
+    row = CompressionDictionary.objects.filter(pk=dictionary_id).values_list('codec', 'data').first()
+    if row is None:
+        raise LookupError(f"No existe el diccionario de compresión {dictionary_id}")
+    codec, data = row
+    data = bytes(data)
+    if codec.encode() == CODEC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("Hace falta el paquete zstandard para leer datos comprimidos con zstd")
+        return CODEC_ZSTD, zstandard.ZstdCompressionDict(data)
+    return CODEC_ZLIB, data
+
+
+_active_dictionaries = {}
+_active_lock = threading.Lock()
+
+
+def active_dictionary_id(template_id, codec):
+    """Id del diccionario más reciente de la plantilla para el códec, o None"""
+    if not template_id or codec == CODEC_NONE:
+        return None
+    if not getattr(settings, 'DENTAL_REPORTS_COMPRESSION_DICTIONARIES', True):
+        return None
+
+    key = (template_id, codec)
+    now = time.monotonic()
+    with _active_lock:
+        cached = _active_dictionaries.get(key)
+    if cached is not None and cached[1] > now:
+        return cached[0]
+
+    CompressionDictionary = apps.get_model('dental_reports', 'CompressionDictionary')
+    dictionary_id = (CompressionDictionary.objects
+                     .filter(template_id=template_id, codec=codec.decode())
+                     .order_by('-id').values_list('id', flat=True).first())
+    with _active_lock:
+        _active_dictionaries[key] = (dictionary_id, now + ACTIVE_DICTIONARY_TIMEOUT)
+    return dictionary_id
+
+
+def forget_active_dictionaries():
+    with _active_lock:
+        _active_dictionaries.clear()
+
+
+def build_dictionary_data(samples, codec, size=None):
+    """
+    Datos de un diccionario entrenado con textos de ejemplo
+
+    Con zstd se entrena un diccionario de verdad (si hay suficientes ejemplos);
+    con zlib, o si el entrenamiento falla, el diccionario es el final de los
+    ejemplos concatenados, que contiene el marcado que se repite.
+    """
+    size = size or getattr(settings, 'DENTAL_REPORTS_COMPRESSION_DICT_SIZE', DEFAULT_COMPRESSION_DICT_SIZE)
+    encoded = [sample.encode('utf-8') for sample in samples if sample]
+    if not encoded:
+        return b''
+    if codec == CODEC_ZSTD:
+        try:
+            return zstandard.train_dictionary(size, encoded).as_bytes()
+        except zstandard.ZstdError:
+            pass
+    else:
+        size = min(size, ZLIB_MAX_DICT_SIZE)
+    # Los datos más útiles de un diccionario zlib van al final
+    return b''.join(reversed(encoded))[-size:]
+
+
+# --- Codificación ---------------------------------------------------------
+
+def encode_bytes(data, codec=None, dictionary_id=None):
+    """Cabecera + datos (comprimidos si compensa)"""
+    codec = default_codec() if codec is None else codec
+    if codec == CODEC_NONE or len(data) < min_bytes():
+        return EncodedValue(HEADER.pack(MAGIC, CODEC_NONE, 0) + data)
+
+    level = compression_level(codec)
+    dictionary = load_dictionary(dictionary_id)[1] if dictionary_id else None
+    if codec == CODEC_ZSTD:
+        compressed = zstandard.ZstdCompressor(level=level, dict_data=dictionary).compress(data)
+    else:
+        compressor = zlib.compressobj(level, zdict=dictionary) if dictionary else zlib.compressobj(level)
+        compressed = compressor.compress(data) + compressor.flush()
+
+    if len(compressed) >= len(data):
+        return EncodedValue(HEADER.pack(MAGIC, CODEC_NONE, 0) + data)
+    return EncodedValue(HEADER.pack(MAGIC, codec, dictionary_id or 0) + compressed)
+
+
+def decode_bytes(value):
+    """Datos originales de un valor guardado (con o sin cabecera)"""
+    value = bytes(value)
+    if value[:2] != MAGIC or len(value) < HEADER.size:
+        return value
+    _, codec, dictionary_id = HEADER.unpack_from(value)
+    payload = value[HEADER.size:]
+    if codec == CODEC_NONE:
+        return payload
+
+    dictionary = load_dictionary(dictionary_id)[1] if dictionary_id else None
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("Hace falta el paquete zstandard para leer datos comprimidos con zstd")
+        return zstandard.ZstdDecompressor(dict_data=dictionary).decompress(payload)
+    if codec == CODEC_ZLIB:
+        decompressor = zlib.decompressobj(zdict=dictionary) if dictionary else zlib.decompressobj()
+        return decompressor.decompress(payload) + decompressor.flush()
+    raise ValueError(f"Códec de compresión desconocido: {codec!r}")
+
+
+def stored_format(value):
+    """(códec, id de diccionario) de un valor guardado; (None, None) si es anterior a la compresión"""
+    if value is None or isinstance(value, str):
+        return None, None
+    value = bytes(value)
+    if value[:2] != MAGIC or len(value) < HEADER.size:
+        return None, None
+    _, codec, dictionary_id = HEADER.unpack_from(value)
+    return codec, dictionary_id or None
+
+
+# --- Campos de modelo -----------------------------------------------------
+
+class CompressedFieldMixin:
+    """
+    Columna binaria con el valor comprimido
+
+    Args:
+        dictionary_from: Nombre de la ForeignKey a ReportTemplate cuyo
+            diccionario se usa al guardar (None: sin diccionario)
+    """
+
+    def __init__(self, *args, dictionary_from=None, **kwargs):
+        self.dictionary_from = dictionary_from
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.dictionary_from:
+            kwargs['dictionary_from'] = self.dictionary_from
+        return name, path, args, kwargs
+
+    def get_internal_type(self):
+        return 'BinaryField'
+
+    def to_bytes(self, value):
+        raise NotImplementedError
+
+    def from_bytes(self, data):
+        raise NotImplementedError
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return None
+        if isinstance(value, str):
+            # Filas anteriores a la compresión (SQLite conserva el texto tal cual)
+            return self.from_text(value)
+        return self.from_bytes(decode_bytes(value))
+
+    def from_text(self, text):
+        return text
+
+    def encode(self, value, template_id=None):
+        """Valor listo para guardar, con el diccionario de la plantilla si lo hay"""
+        if value is None or isinstance(value, EncodedValue):
+            return value
+        codec = default_codec()
+        return encode_bytes(self.to_bytes(value), codec, active_dictionary_id(template_id, codec))
+
+    def pre_save(self, model_instance, add):
+        value = super().pre_save(model_instance, add)
+        template_id = getattr(model_instance, f'{self.dictionary_from}_id') if self.dictionary_from else None
+        return self.encode(value, template_id)
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if value is None or hasattr(value, 'as_sql'):
+            return value
+        return connection.Database.Binary(self.encode(value))
+
+    def value_to_string(self, obj):
+        return self.value_from_object(obj)
+
+
+class CompressedTextField(CompressedFieldMixin, models.TextField):
+    """TextField guardado comprimido"""
+
+    def to_bytes(self, value):
+        return str(value).encode('utf-8')
+
+    def from_bytes(self, data):
+        return data.decode('utf-8')
+
+    def get_prep_value(self, value):
+        # TextField.get_prep_value convertiría el valor ya codificado en str
+        return value
+
+
+class CompressedJSONField(CompressedFieldMixin, models.JSONField):
+    """JSONField guardado comprimido (como JSON compacto)"""
+
+    def to_bytes(self, value):
+        return json.dumps(value, cls=self.encoder or DjangoJSONEncoder, separators=(',', ':'),
+                          ensure_ascii=False).encode('utf-8')
+
+    def from_bytes(self, data):
+        return json.loads(data, cls=self.decoder)
+
+    def from_text(self, text):
+        return json.loads(text, cls=self.decoder)
+
+    def get_prep_value(self, value):
+        return value
+
+
+# --- Entrenamiento y recompresión ------------------------------------------
+
+def train_template_dictionary(template_id, samples=200, min_samples=10, codec=None):
+    """
+    Entrena un diccionario nuevo con los últimos informes de una plantilla
+
+    Returns:
+        El CompressionDictionary creado, o None si la plantilla tiene menos
+        de min_samples informes
+    """
+    GeneratedReport = apps.get_model('dental_reports', 'GeneratedReport')
+    CompressionDictionary = apps.get_model('dental_reports', 'CompressionDictionary')
+    codec = default_codec() if codec is None else codec
+    if codec == CODEC_NONE:
+        return None
+
+    contents = list(GeneratedReport.objects.filter(template_id=template_id)
+                    .order_by('-id').values_list('report_content', flat=True)[:samples])
+    if len(contents) < max(min_samples, 1):
+        return None
+    data = build_dictionary_data(contents, codec)
+    if not data:
+        return None
+
+    dictionary = CompressionDictionary.objects.create(
+        template_id=template_id, codec=codec.decode(), data=data, sample_count=len(contents))
+    forget_active_dictionaries()
+    return dictionary
+
+
+def _raw_size(value):
+    if value is None:
+        return 0
+    return len(value.encode('utf-8')) if isinstance(value, str) else len(value)
+
+
+def _is_stored_as(raw, encoded):
+    return raw is not None and not isinstance(raw, str) and bytes(raw) == encoded
+
+
+def recompress_reports(batch_size=500, template_id=None):
+    """
+    Reescribe report_content y form_data de los informes con el códec y el
+    diccionario actuales, por lotes y sin lanzar señales
+
+    Sólo se escriben las filas cuyo valor guardado cambia, así que repetirlo
+    es barato y se puede interrumpir en cualquier momento.
+
+    Returns:
+        (informes revisados, informes reescritos, bytes antes, bytes después)
+    """
+    GeneratedReport = apps.get_model('dental_reports', 'GeneratedReport')
+    content_field = GeneratedReport._meta.get_field('report_content')
+    data_field = GeneratedReport._meta.get_field('form_data')
+
+    # Los valores tal como están guardados, sin pasar por los campos comprimidos
+    reports = GeneratedReport.objects.annotate(
+        raw_content=models.ExpressionWrapper(models.F('report_content'), output_field=models.BinaryField()),
+        raw_data=models.ExpressionWrapper(models.F('form_data'), output_field=models.BinaryField()),
+    ).order_by('id')
+    if template_id:
+        reports = reports.filter(template_id=template_id)
+
+    checked = rewritten = size_before = size_after = 0
+    last_id = 0
+    while True:
+        rows = list(reports.filter(id__gt=last_id)
+                    .values_list('id', 'template_id', 'raw_content', 'raw_data')[:batch_size])
+        if not rows:
+            break
+        last_id = rows[-1][0]
+
+        changed = []
+        for report_id, report_template_id, raw_content, raw_data in rows:
+            content = content_field.from_db_value(raw_content, None, None)
+            data = data_field.from_db_value(raw_data, None, None)
+            new_content = content_field.encode(content, report_template_id)
+            new_data = data_field.encode(data)
+
+            size_before += _raw_size(raw_content) + _raw_size(raw_data)
+            size_after += _raw_size(new_content) + _raw_size(new_data)
+            if _is_stored_as(raw_content, new_content) and _is_stored_as(raw_data, new_data):
+                continue
+            changed.append(GeneratedReport(id=report_id, report_content=new_content, form_data=new_data))
+
+        if changed:
+            GeneratedReport.objects.bulk_update(changed, ['report_content', 'form_data'])
+        checked += len(rows)
+        rewritten += len(changed)
+    return checked, rewritten, size_before, size_after
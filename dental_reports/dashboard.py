@@ -0,0 +1,226 @@
+# dental_reports/dashboard.py
+"""
+Estadísticas del panel de inicio.
+
+Los totales se guardan desnormalizados en DashboardCounter y las señales los
+mantienen al día; `reconcile_counters` los recalcula desde las tablas. El panel
+completo (contadores y elementos recientes) se guarda en la caché como una
+sola entrada que se invalida al crear o eliminar objetos, de modo que la
+vista de inicio cuesta una lectura de caché.
+"""
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from . import cache
+from .models import DashboardCounter, DentalClinic, DentistContact, GeneratedReport, ReportTemplate
+
+DEFAULT_DASHBOARD_CACHE_TIMEOUT = 300
+RECENT_ITEMS = 5
+
+# Grupo de contadores -> (modelo, campo por el que se desglosa o None)
+COUNTER_GROUPS = {
+    'templates': (ReportTemplate, None),
+    'reports': (GeneratedReport, 'created_by'),
+    'clinics': (DentalClinic, None),
+    'dentists': (DentistContact, 'clinic'),
+}
+
+# Campos cuyos cambios no se muestran en el panel (p. ej. el estado del PDF)
+IGNORED_UPDATE_FIELDS = {'pdf_file', 'pdf_status', 'pdf_status_changed_at', 'pdf_error',
+                         'pdf_source_hash', 'pdf_renderer_version'}
+
+
+def counter_group(model):
+    """Devuelve (grupo, campo de desglose) de un modelo contado, o (None, None)"""
+    for group, (counted_model, breakdown) in COUNTER_GROUPS.items():
+        if counted_model is model:
+            return group, breakdown
+    return None, None
+
+
+def breakdown_name(group, field, value):
+    return f'{group}:{field}:{value}'
+
+
+def breakdown_value(instance, field):
+    return getattr(instance, instance._meta.get_field(field).attname)
+
+
+def counter_names(instance, value=None):
+    """Contadores afectados por un objeto: el total y, si lo hay, su desglose"""
+    group, breakdown = counter_group(type(instance))
+    if group is None:
+        return []
+    names = [group]
+    if breakdown:
+        value = breakdown_value(instance, breakdown) if value is None else value
+        if value is not None:
+            names.append(breakdown_name(group, breakdown, value))
+    return names
+
+
+def count_for_name(name):
+    """Valor real de un contador, calculado desde su tabla"""
+    group, _, rest = name.partition(':')
+    model, breakdown = COUNTER_GROUPS[group]
+    if not rest:
+        return model.objects.count()
+    field, _, value = rest.partition(':')
+    return model.objects.filter(**{model._meta.get_field(field).attname: value}).count()
+
+
+def compute_counters():
+    """Recalcula todos los contadores (totales y desgloses) desde las tablas"""
+    values = {}
+    for group, (model, breakdown) in COUNTER_GROUPS.items():
+        values[group] = model.objects.count()
+        if breakdown:
+            attname = model._meta.get_field(breakdown).attname
+            rows = (model.objects.filter(**{f'{attname}__isnull': False})
+                    .values(attname).annotate(total=Count('pk')).order_by())
+            for row in rows:
+                values[breakdown_name(group, breakdown, row[attname])] = row['total']
+    return values
+
+
+def reconcile_counters():
+    """
+    Sincroniza DashboardCounter con los totales reales
+
+    Returns:
+        Diccionario {nombre: valor correcto} con los contadores que se han corregido
+    """
+    values = compute_counters()
+    now = timezone.now()
+    corrected = {}
+
+    with transaction.atomic():
+        existing = {counter.name: counter for counter in DashboardCounter.objects.select_for_update()}
+        to_create, to_update = [], []
+        for name, value in values.items():
+            counter = existing.pop(name, None)
+            if counter is None:
+                to_create.append(DashboardCounter(name=name, value=value))
+            elif counter.value != value:
+                counter.value = value
+                counter.updated_at = now
+                to_update.append(counter)
+            else:
+                continue
+            corrected[name] = value
+
+        # Desgloses que ya no tienen objetos (usuario o clínica sin elementos)
+        stale = [counter for counter in existing.values() if counter.value]
+        corrected.update((counter.name, 0) for counter in stale)
+        DashboardCounter.objects.filter(pk__in=[counter.pk for counter in existing.values()]).delete()
+
+        DashboardCounter.objects.bulk_create(to_create)
+        DashboardCounter.objects.bulk_update(to_update, ['value', 'updated_at'])
+
+    invalidate_dashboard()
+    return corrected
+
+
+def adjust_counters(deltas):
+    """
+    Suma `deltas` ({nombre: incremento}) a los contadores, de forma atómica en la BD
+
+    Un contador que aún no existe se crea con su valor real, calculado desde la tabla.
+    """
+    for name, delta in deltas.items():
+        if not delta:
+            continue
+        if DashboardCounter.objects.filter(name=name).update(value=F('value') + delta, updated_at=timezone.now()):
+            continue
+        try:
+            with transaction.atomic():
+                DashboardCounter.objects.create(name=name, value=count_for_name(name))
+        except IntegrityError:
+            # Otro proceso lo acaba de crear: basta con aplicar el incremento
+            DashboardCounter.objects.filter(name=name).update(value=F('value') + delta)
+    invalidate_dashboard()
+
+
+def record_created(instances):
+    """Cuenta objetos recién creados (también los de bulk_create, que no emite señales)"""
+    deltas = {}
+    for instance in instances:
+        for name in counter_names(instance):
+            deltas[name] = deltas.get(name, 0) + 1
+    adjust_counters(deltas)
+
+
+def record_deleted(instance):
+    adjust_counters({name: -1 for name in counter_names(instance)})
+    drop_breakdowns(instance)
+
+
+def drop_breakdowns(instance):
+    """Elimina los desgloses por un objeto borrado (p. ej. los dentistas de una clínica)"""
+    names = [
+        breakdown_name(group, breakdown, instance.pk)
+        for group, (model, breakdown) in COUNTER_GROUPS.items()
+        if breakdown and model._meta.get_field(breakdown).related_model is type(instance)
+    ]
+    if names:
+        DashboardCounter.objects.filter(name__in=names).delete()
+
+
+def record_reassigned(instance, old_value):
+    """Mueve un objeto de un desglose a otro (p. ej. un dentista que cambia de clínica)"""
+    group, breakdown = counter_group(type(instance))
+    new_value = breakdown_value(instance, breakdown)
+    if old_value == new_value:
+        return
+    deltas = {}
+    if old_value is not None:
+        deltas[breakdown_name(group, breakdown, old_value)] = -1
+    if new_value is not None:
+        deltas[breakdown_name(group, breakdown, new_value)] = 1
+    adjust_counters(deltas)
+
+
+def invalidate_dashboard():
+    """Descarta el panel cacheado cuando se confirme la transacción en curso"""
+    cache.invalidate('dashboard')
+
+
+def build_dashboard():
+    """Calcula el panel: todos los contadores y los elementos más recientes"""
+    counters = dict(DashboardCounter.objects.values_list('name', 'value'))
+    if any(group not in counters for group in COUNTER_GROUPS):
+        # Primera ejecución: inicializar los contadores
+        reconcile_counters()
+        counters = dict(DashboardCounter.objects.values_list('name', 'value'))
+
+    return {
+        'counters': counters,
+        'recent_templates': list(
+            ReportTemplate.objects.filter(is_active=True).select_related('category')
+            .defer('html_content', 'fields_schema').order_by('-created_at')[:RECENT_ITEMS]
+        ),
+        'recent_reports': list(
+            GeneratedReport.objects.select_related('template')
+            .defer('report_content', 'form_data', 'template__html_content', 'template__fields_schema')
+            .order_by('-created_at')[:RECENT_ITEMS]
+        ),
+    }
+
+
+def get_dashboard():
+    """Panel de inicio, desde la caché si está disponible"""
+    timeout = getattr(settings, 'DENTAL_REPORTS_DASHBOARD_CACHE_TIMEOUT', DEFAULT_DASHBOARD_CACHE_TIMEOUT)
+    return cache.get_or_set('dashboard', 'snapshot', build_dashboard, timeout)
+
+
+def counter_breakdown(dashboard, group):
+    """Desglose de un grupo como {id: valor}, p. ej. dentistas por clínica"""
+    _, breakdown = COUNTER_GROUPS[group]
+    prefix = breakdown_name(group, breakdown, '')
+    return {
+        int(name[len(prefix):]): value
+        for name, value in dashboard['counters'].items()
+        if name.startswith(prefix)
+    }
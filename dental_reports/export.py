@@ -0,0 +1,123 @@
+# dental_reports/export.py
+"""
+Exportación de informes a CSV o JSONL en streaming.
+
+Las filas se leen con .iterator() sobre values_list (sin instanciar modelos ni
+cargar report_content) y se escriben una a una, de modo que la memoria usada
+no depende del número de informes exportados.
+"""
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .fields_schema import schema_fields
+from .models import ReportTemplate
+
+EXPORT_CHUNK_SIZE = 2000
+
+# (columna, campo de la consulta)
+BASE_COLUMNS = [
+    ('id', 'id'),
+    ('titulo', 'title'),
+    ('plantilla_id', 'template_id'),
+    ('plantilla', 'template__name'),
+    ('paciente', 'patient_name'),
+    ('doctor', 'doctor_name'),
+    ('creado_por', 'created_by__username'),
+    ('fecha', 'created_at'),
+    ('estado_pdf', 'pdf_status'),
+    ('version', 'version'),
+]
+
+# Prefijo de las columnas que salen de form_data
+FORM_DATA_PREFIX = 'datos.'
+
+# Claves de form_data que ya tienen su propia columna
+SKIPPED_FORM_DATA_KEYS = {'patient_name', 'doctor_name'}
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+
+def form_data_keys(queryset):
+    """
+    Claves de form_data que aparecen en los informes, en orden estable
+
+    Se obtienen de los esquemas de las plantillas implicadas; sólo los
+    informes sin plantilla requieren recorrer su form_data.
+    """
+    template_ids = queryset.order_by().values_list('template_id', flat=True).distinct()
+    keys = {}
+    for fields_schema in ReportTemplate.objects.filter(id__in=template_ids).order_by('id') \
+            .values_list('fields_schema', flat=True):
+        for config in schema_fields(fields_schema):
+            if isinstance(config, dict) and config.get('name'):
+                keys.setdefault(config['name'], None)
+
+    orphans = queryset.filter(template__isnull=True).values_list('form_data', flat=True)
+    for form_data in orphans.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        if isinstance(form_data, dict):
+            for key in form_data:
+                keys.setdefault(key, None)
+
+    return [key for key in keys if key not in SKIPPED_FORM_DATA_KEYS]
+
+
+def export_columns(queryset):
+    """Nombres de columna de la exportación: las fijas más una por clave de form_data"""
+    data_keys = form_data_keys(queryset)
+    return [name for name, _ in BASE_COLUMNS] + [FORM_DATA_PREFIX + key for key in data_keys], data_keys
+
+
+def iter_export_rows(queryset, data_keys, chunk_size=EXPORT_CHUNK_SIZE):
+    """Genera cada informe como lista de valores en el orden de export_columns"""
+    fields = [field for _, field in BASE_COLUMNS] + ['form_data']
+    rows = queryset.order_by('-created_at', '-id').values_list(*fields)
+    for row in rows.iterator(chunk_size=chunk_size):
+        form_data = row[-1] if isinstance(row[-1], dict) else {}
+        yield list(row[:-1]) + [form_data.get(key) for key in data_keys]
+
+
+def csv_cell(value):
+    """Valor de una celda CSV: listas de texto unidas con '; ', estructuras como JSON"""
+    if value is None:
+        return ''
+    if isinstance(value, list) and all(isinstance(item, (str, int, float)) for item in value):
+        return '; '.join(str(item) for item in value)
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, ensure_ascii=False, cls=DjangoJSONEncoder)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+class Echo:
+    """Objeto tipo archivo que devuelve lo escrito en lugar de guardarlo"""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """Genera la exportación CSV línea a línea"""
+    columns, data_keys = export_columns(queryset)
+    writer = csv.writer(Echo())
+    yield writer.writerow(columns)
+    for row in iter_export_rows(queryset, data_keys, chunk_size):
+        yield writer.writerow([csv_cell(value) for value in row])
+
+
+def iter_jsonl(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """Genera la exportación JSONL: un objeto JSON por línea con las mismas claves que el CSV"""
+    columns, data_keys = export_columns(queryset)
+    for row in iter_export_rows(queryset, data_keys, chunk_size):
+        yield json.dumps(dict(zip(columns, row)), ensure_ascii=False, cls=DjangoJSONEncoder) + '\n'
+
+
+def iter_export(queryset, export_format='csv', chunk_size=EXPORT_CHUNK_SIZE):
+    if export_format == 'jsonl':
+        return iter_jsonl(queryset, chunk_size)
+    return iter_csv(queryset, chunk_size)
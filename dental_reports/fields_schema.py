@@ -0,0 +1,275 @@
+# dental_reports/fields_schema.py
+"""
+Esquema de los campos dinámicos de las plantillas (ReportTemplate.fields_schema).
+
+    {"fields": [{"name": "diagnostico", "label": "Diagnóstico", "type": "textarea",
+                 "required": true, "help_text": "", "options": [...]}, ...]}
+
+El esquema se valida al guardar la plantilla (`validate_fields_schema`) y los
+campos de formulario se construyen a partir de él con `build_form_field`.
+"""
+import json
+
+from django import forms
+from django.core.exceptions import ValidationError
+
+
+# Numeración FDI de las piezas dentales, por cuadrantes
+PERMANENT_TEETH = [f'{quadrant}{tooth}' for quadrant in (1, 2, 3, 4) for tooth in range(1, 9)]
+PRIMARY_TEETH = [f'{quadrant}{tooth}' for quadrant in (5, 6, 7, 8) for tooth in range(1, 6)]
+DENTITIONS = {
+    'permanent': PERMANENT_TEETH,
+    'primary': PRIMARY_TEETH,
+    'mixed': PERMANENT_TEETH + PRIMARY_TEETH,
+}
+
+# Tipos que admiten las columnas de un campo de filas repetidas
+ROW_COLUMN_TYPES = ('text', 'number', 'date')
+
+# Separador de columnas en el formato de texto de las filas repetidas
+ROW_SEPARATOR = '|'
+
+
+class MultipleValuesField(forms.MultipleChoiceField):
+    """MultipleChoiceField que acepta también una cadena separada por comas (p. ej. desde un CSV)"""
+
+    def to_python(self, value):
+        if isinstance(value, str):
+            value = [item.strip() for item in value.split(',') if item.strip()]
+        return super().to_python(value)
+
+
+class MultipleValuesWidget(forms.CheckboxSelectMultiple):
+
+    def value_from_datadict(self, data, files, name):
+        value = super().value_from_datadict(data, files, name)
+        # En un dict normal (no QueryDict) la lista puede venir como una sola cadena
+        if isinstance(value, str):
+            return [item.strip() for item in value.split(',') if item.strip()]
+        return value
+
+
+class ToothChartField(MultipleValuesField):
+    """Selección de piezas dentales (numeración FDI). El valor limpio respeta el orden del odontograma"""
+
+    def __init__(self, dentition='permanent', **kwargs):
+        self.teeth = DENTITIONS[dentition]
+        kwargs.setdefault('widget', MultipleValuesWidget(attrs={'class': 'tooth-chart'}))
+        super().__init__(choices=[(tooth, tooth) for tooth in self.teeth], **kwargs)
+
+    def clean(self, value):
+        selected = set(super().clean(value))
+        return [tooth for tooth in self.teeth if tooth in selected]
+
+
+class RepeatedRowsField(forms.Field):
+    """
+    Tabla de filas repetidas con columnas tipadas
+
+    Acepta una lista JSON de objetos o texto con una fila por línea y las
+    columnas separadas por '|'. El valor limpio es una lista de diccionarios.
+    """
+    widget = forms.Textarea(attrs={'rows': 4, 'class': 'repeated-rows'})
+
+    def __init__(self, columns, max_rows=None, **kwargs):
+        super().__init__(**kwargs)
+        self.max_rows = max_rows
+        # Los campos de cada columna se construyen una vez, con la clase del formulario
+        self.columns = [
+            (column['name'], build_form_field({**column, 'required': False}))
+            for column in columns
+        ]
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return []
+        if isinstance(value, list):
+            return value
+        value = value.strip()
+        if value.startswith('['):
+            try:
+                rows = json.loads(value)
+            except json.JSONDecodeError:
+                raise ValidationError("Las filas no tienen un formato JSON válido.", code='invalid')
+            if not isinstance(rows, list):
+                raise ValidationError("Las filas deben ser una lista.", code='invalid')
+            return rows
+        names = [name for name, _ in self.columns]
+        return [
+            dict(zip(names, (cell.strip() for cell in line.split(ROW_SEPARATOR))))
+            for line in value.splitlines() if line.strip()
+        ]
+
+    def validate(self, value):
+        if self.required and not value:
+            raise ValidationError(self.error_messages['required'], code='required')
+        if self.max_rows and len(value) > self.max_rows:
+            raise ValidationError(f"Como máximo se admiten {self.max_rows} filas.", code='max_rows')
+
+    def clean(self, value):
+        rows = self.to_python(value)
+        self.validate(rows)
+        cleaned = []
+        for number, row in enumerate(rows, start=1):
+            if not isinstance(row, dict):
+                raise ValidationError(f"La fila {number} no es válida.", code='invalid')
+            cleaned_row = {}
+            for name, field in self.columns:
+                try:
+                    cleaned_row[name] = field.clean(row.get(name))
+                except ValidationError as e:
+                    raise ValidationError(f"Fila {number}, {field.label or name}: {' '.join(e.messages)}",
+                                          code='invalid')
+            cleaned.append(cleaned_row)
+        return cleaned
+
+    def prepare_value(self, value):
+        if isinstance(value, list):
+            names = [name for name, _ in self.columns]
+            return '\n'.join(
+                f' {ROW_SEPARATOR} '.join(str(row.get(name, '') or '') for name in names)
+                for row in value if isinstance(row, dict)
+            )
+        return value
+
+
+def _text(config, common):
+    return forms.CharField(**common)
+
+
+def _textarea(config, common):
+    return forms.CharField(widget=forms.Textarea(attrs={'rows': 3}), **common)
+
+
+def _number(config, common):
+    return forms.FloatField(**common)
+
+
+def _date(config, common):
+    return forms.DateField(widget=forms.DateInput(attrs={'type': 'date'}), **common)
+
+
+def _select(config, common):
+    return forms.ChoiceField(choices=[(option, option) for option in config['options']], **common)
+
+
+def _checkbox(config, common):
+    # Los checkboxes no pueden ser required
+    return forms.BooleanField(**{**common, 'required': False})
+
+
+def _multiselect(config, common):
+    return MultipleValuesField(choices=[(option, option) for option in config['options']],
+                               widget=MultipleValuesWidget, **common)
+
+
+def _teeth(config, common):
+    return ToothChartField(dentition=config.get('dentition', 'permanent'), **common)
+
+
+def _rows(config, common):
+    return RepeatedRowsField(columns=config['columns'], max_rows=config.get('max_rows'), **common)
+
+
+# Tipo de campo -> constructor del campo de formulario
+FIELD_BUILDERS = {
+    'text': _text,
+    'textarea': _textarea,
+    'number': _number,
+    'date': _date,
+    'select': _select,
+    'checkbox': _checkbox,
+    'multiselect': _multiselect,
+    'teeth': _teeth,
+    'rows': _rows,
+}
+
+# Campos fijos de DynamicReportForm que el esquema no puede redefinir
+RESERVED_FIELD_NAMES = ('patient_name', 'doctor_name')
+
+
+def schema_fields(fields_schema):
+    """Lista de configuraciones de campo del esquema (vacía si el esquema no es válido)"""
+    fields = fields_schema.get('fields', []) if isinstance(fields_schema, dict) else []
+    return fields if isinstance(fields, list) else []
+
+
+def build_form_field(config):
+    """Campo de formulario para una configuración de campo ya validada"""
+    return FIELD_BUILDERS[config.get('type', 'text')](config, {
+        'label': config.get('label', config['name']),
+        'required': config.get('required', False),
+        'help_text': config.get('help_text', ''),
+    })
+
+
+def field_config_errors(config, column=False, strict_names=True):
+    """
+    Errores de una configuración de campo (o de una columna de filas repetidas)
+
+    Con strict_names=False se admite cualquier nombre no vacío, como hacían
+    las plantillas guardadas antes de validar el esquema.
+    """
+    if not isinstance(config, dict):
+        return ["Cada campo debe ser un objeto."]
+
+    errors = []
+    name = config.get('name')
+    field_type = config.get('type', 'text')
+    if not name or not isinstance(name, str) or (strict_names and not name.isidentifier()):
+        errors.append(f"Nombre de campo no válido: {name!r} (use letras, números y guiones bajos).")
+        name = repr(name)
+
+    allowed_types = ROW_COLUMN_TYPES if column else FIELD_BUILDERS
+    if field_type not in allowed_types:
+        errors.append(f"Campo {name}: tipo desconocido {field_type!r}.")
+    elif field_type in ('select', 'multiselect'):
+        options = config.get('options')
+        if not options or not isinstance(options, list):
+            errors.append(f"Campo {name}: debe tener una lista de opciones.")
+    elif field_type == 'teeth' and config.get('dentition', 'permanent') not in DENTITIONS:
+        errors.append(f"Campo {name}: dentición desconocida {config.get('dentition')!r}.")
+    elif field_type == 'rows':
+        columns = config.get('columns')
+        if not columns or not isinstance(columns, list):
+            errors.append(f"Campo {name}: debe definir sus columnas.")
+        else:
+            for column_config in columns:
+                errors.extend(f"Campo {name}: {error}"
+                              for error in field_config_errors(column_config, column=True, strict_names=strict_names))
+        max_rows = config.get('max_rows')
+        if max_rows is not None and (not isinstance(max_rows, int) or max_rows < 1):
+            errors.append(f"Campo {name}: max_rows debe ser un entero positivo.")
+    return errors
+
+
+def validate_fields_schema(fields_schema):
+    """
+    Valida el esquema de campos de una plantilla
+
+    Raises:
+        ValidationError con la lista de errores encontrados
+    """
+    if not isinstance(fields_schema, dict):
+        raise ValidationError("El esquema de campos debe ser un objeto JSON.")
+    fields = fields_schema.get('fields', [])
+    if not isinstance(fields, list):
+        raise ValidationError("La clave 'fields' debe ser una lista.")
+
+    errors = []
+    seen = set()
+    for config in fields:
+        errors.extend(field_config_errors(config))
+        name = config.get('name') if isinstance(config, dict) else None
+        if name in RESERVED_FIELD_NAMES:
+            errors.append(f"El nombre de campo {name!r} está reservado.")
+        elif name in seen:
+            errors.append(f"El campo {name!r} está repetido.")
+        seen.add(name)
+    if errors:
+        raise ValidationError(errors)
+
+
+def is_valid_field_config(config):
+    """True si la configuración de campo es utilizable (para esquemas guardados antes de validarse)"""
+    return not field_config_errors(config, strict_names=False)
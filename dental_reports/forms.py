@@ -1,8 +1,12 @@
 # dental_reports/forms.py
+from collections import OrderedDict
+import hashlib
 import json
+import threading
 
 from django import forms
 
+from .fields_schema import build_form_field, is_valid_field_config, schema_fields, validate_fields_schema
 from .models import ReportTemplate, TemplateCategory, DentalClinic, DentistContact
 
 
@@ -26,11 +30,14 @@ class TemplateForm(forms.ModelForm):
             self.fields['fields_json'].initial = json.dumps(self.instance.fields_schema)
 
     def clean_fields_json(self):
-        fields_json = self.cleaned_data.get('fields_json', '{}')
+        fields_json = self.cleaned_data.get('fields_json') or '{}'
         try:
-            return json.loads(fields_json)
-        except:
-            return {}
+            fields_schema = json.loads(fields_json)
+        except json.JSONDecodeError:
+            raise forms.ValidationError("El esquema de campos no es un JSON válido.")
+        # Validar aquí y no en cada petición que use el formulario del informe
+        validate_fields_schema(fields_schema)
+        return fields_schema
 
     def save(self, commit=True):
         template = super().save(commit=False)
@@ -47,70 +54,79 @@ class TemplateForm(forms.ModelForm):
 
 
 class DynamicReportForm(forms.Form):
-    """Formulario dinámico generado a partir de una plantilla"""
+    """
+    Formulario dinámico generado a partir de una plantilla
+
+    `DynamicReportForm(data, template=plantilla)` devuelve una instancia de la
+    subclase construida para el esquema de la plantilla (ver report_form_class),
+    de modo que los campos no se crean de nuevo en cada petición.
+    """
     patient_name = forms.CharField(label="Nombre del paciente", required=True)
     doctor_name = forms.CharField(label="Nombre del doctor", required=True)
 
-    def __init__(self, *args, **kwargs):
-        template = kwargs.pop('template', None)
+    def __new__(cls, *args, template=None, **kwargs):
+        if template is not None and cls is DynamicReportForm:
+            cls = report_form_class(template)
+        return super().__new__(cls)
+
+    def __init__(self, *args, template=None, **kwargs):
         super().__init__(*args, **kwargs)
 
-        if template:
-            # Obtener la estructura de campos
-            fields_schema = template.fields_schema
-            fields = fields_schema.get('fields', []) if isinstance(fields_schema, dict) else []
-
-            # Crear campos dinámicamente
-            for field_config in fields:
-                field_name = field_config.get('name')
-                field_label = field_config.get('label', field_name)
-                field_type = field_config.get('type', 'text')
-                field_required = field_config.get('required', False)
-                field_options = field_config.get('options', [])
-                field_help = field_config.get('help_text', '')
-
-                # Crear el campo según su tipo
-                if field_name:
-                    if field_type == 'text':
-                        self.fields[field_name] = forms.CharField(
-                            label=field_label,
-                            required=field_required,
-                            help_text=field_help,
-                        )
-                    elif field_type == 'textarea':
-                        self.fields[field_name] = forms.CharField(
-                            label=field_label,
-                            required=field_required,
-                            help_text=field_help,
-                            widget=forms.Textarea(attrs={'rows': 3})
-                        )
-                    elif field_type == 'number':
-                        self.fields[field_name] = forms.FloatField(
-                            label=field_label,
-                            required=field_required,
-                            help_text=field_help,
-                        )
-                    elif field_type == 'date':
-                        self.fields[field_name] = forms.DateField(
-                            label=field_label,
-                            required=field_required,
-                            help_text=field_help,
-                            widget=forms.DateInput(attrs={'type': 'date'})
-                        )
-                    elif field_type == 'select' and field_options:
-                        choices = [(option, option) for option in field_options]
-                        self.fields[field_name] = forms.ChoiceField(
-                            label=field_label,
-                            required=field_required,
-                            help_text=field_help,
-                            choices=choices
-                        )
-                    elif field_type == 'checkbox':
-                        self.fields[field_name] = forms.BooleanField(
-                            label=field_label,
-                            required=False,  # Los checkboxes no pueden ser required
-                            help_text=field_help,
-                        )
+
+def fields_schema_key(fields_schema):
+    """Hash estable del esquema de campos"""
+    raw = json.dumps(fields_schema, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def build_report_form_class(fields_schema, name='DynamicReportForm'):
+    """Subclase de DynamicReportForm con un campo declarado por cada campo válido del esquema"""
+    declared = {
+        config['name']: build_form_field(config)
+        for config in schema_fields(fields_schema)
+        if is_valid_field_config(config)
+    }
+    declared['__module__'] = __name__
+    return type(DynamicReportForm)(name, (DynamicReportForm,), declared)
+
+
+class ReportFormClassCache:
+    """Caché LRU de las clases de formulario, por (id de plantilla, hash del esquema)"""
+
+    def __init__(self, max_size=256):
+        self.max_size = max_size
+        self._classes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, template):
+        if template.pk is None:
+            return build_report_form_class(template.fields_schema)
+
+        key = (template.pk, fields_schema_key(template.fields_schema))
+        with self._lock:
+            form_class = self._classes.get(key)
+            if form_class is not None:
+                self._classes.move_to_end(key)
+                return form_class
+
+        form_class = build_report_form_class(template.fields_schema, name=f'ReportForm{template.pk}')
+        with self._lock:
+            self._classes[key] = form_class
+            while len(self._classes) > self.max_size:
+                self._classes.popitem(last=False)
+        return form_class
+
+    def clear(self):
+        with self._lock:
+            self._classes.clear()
+
+
+report_form_classes = ReportFormClassCache()
+
+
+def report_form_class(template):
+    """Clase de formulario (cacheada) para los campos dinámicos de una plantilla"""
+    return report_form_classes.get(template)
 
 
 class DentalClinicForm(forms.ModelForm):
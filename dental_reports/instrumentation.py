@@ -0,0 +1,292 @@
+# dental_reports/instrumentation.py
+"""
+Medición de tiempos por petición.
+
+InstrumentationMiddleware abre un registro por petición en el que se acumulan
+las consultas SQL (número y tiempo, con execute_wrapper), el renderizado de
+plantillas, el de los PDF (tiempo y tamaño) y el envío de correos. Al terminar:
+
+- los tiempos se devuelven en la cabecera Server-Timing,
+- se escribe una línea JSON en el log `dental_reports.requests` (INFO si la
+  petición supera DENTAL_REPORTS_SLOW_REQUEST_MS, DEBUG si no),
+- y se acumulan en histogramas por vista que devuelve `metrics_snapshot()`.
+
+Las medidas tomadas fuera de una petición (trabajadores de PDF y de correo)
+sólo alimentan los histogramas de operaciones del proceso. Como las
+estadísticas de la caché, los histogramas son de cada proceso.
+"""
+import bisect
+from contextlib import ExitStack, contextmanager
+import contextvars
+import json
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.backends.django import DjangoTemplates
+
+logger = logging.getLogger('dental_reports.requests')
+
+DEFAULT_SLOW_REQUEST_MS = 500
+
+# Límites superiores (ms) de los intervalos de los histogramas
+HISTOGRAM_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# Métricas de la cabecera Server-Timing y su descripción
+SERVER_TIMING_METRICS = {
+    'db': 'Base de datos',
+    'tpl': 'Plantillas',
+    'pdf': 'PDF',
+    'email': 'Correo',
+}
+
+
+class RequestMetrics:
+    """Tiempos acumulados durante una petición"""
+    __slots__ = ('started', 'durations', 'counts', 'values', 'active')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.durations = {}
+        self.counts = {}
+        self.values = {}
+        # Métricas que se están midiendo ahora: las llamadas anidadas no se suman dos veces
+        self.active = set()
+
+    def add(self, name, seconds):
+        self.durations[name] = self.durations.get(name, 0.0) + seconds
+        self.counts[name] = self.counts.get(name, 0) + 1
+
+    def add_value(self, name, value):
+        self.values[name] = self.values.get(name, 0) + value
+
+    def as_dict(self):
+        record = {}
+        for name, seconds in self.durations.items():
+            record[f'{name}_ms'] = round(seconds * 1000, 3)
+            record[f'{name}_count'] = self.counts[name]
+        record.update(self.values)
+        return record
+
+
+_current = contextvars.ContextVar('dental_reports_request_metrics', default=None)
+
+
+class Histogram:
+    """Histograma de duraciones con intervalos fijos"""
+
+    def __init__(self):
+        self.buckets = [0] * (len(HISTOGRAM_BUCKETS_MS) + 1)
+        self.count = 0
+        self.sum_ms = 0.0
+
+    def observe(self, ms):
+        self.buckets[bisect.bisect_left(HISTOGRAM_BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.sum_ms += ms
+
+    def as_dict(self):
+        # Recuentos acumulados (le = "menor o igual que"), como en Prometheus
+        cumulative, total = {}, 0
+        for limit, count in zip(HISTOGRAM_BUCKETS_MS + ('+Inf',), self.buckets):
+            total += count
+            cumulative[str(limit)] = total
+        return {
+            'count': self.count,
+            'sum_ms': round(self.sum_ms, 3),
+            'mean_ms': round(self.sum_ms / self.count, 3) if self.count else 0.0,
+            'le_ms': cumulative,
+        }
+
+
+_stats_lock = threading.Lock()
+_view_stats = {}
+_operation_stats = {}
+
+
+def _observe_operation(name, ms):
+    with _stats_lock:
+        histogram = _operation_stats.get(name)
+        if histogram is None:
+            histogram = _operation_stats[name] = Histogram()
+        histogram.observe(ms)
+
+
+def record_request(view_name, metrics, total_seconds):
+    """Añade una petición terminada a los histogramas de su vista"""
+    with _stats_lock:
+        stats = _view_stats.get(view_name)
+        if stats is None:
+            stats = _view_stats[view_name] = {'histograms': {}, 'queries': 0, 'max_queries': 0}
+        histograms = stats['histograms']
+        for name, seconds in (('total', total_seconds), *metrics.durations.items()):
+            histogram = histograms.get(name)
+            if histogram is None:
+                histogram = histograms[name] = Histogram()
+            histogram.observe(seconds * 1000)
+        queries = metrics.counts.get('db', 0)
+        stats['queries'] += queries
+        stats['max_queries'] = max(stats['max_queries'], queries)
+
+
+def metrics_snapshot():
+    """Histogramas por vista y por operación de este proceso"""
+    with _stats_lock:
+        return {
+            'buckets_ms': list(HISTOGRAM_BUCKETS_MS),
+            'views': {
+                view_name: {
+                    'queries': stats['queries'],
+                    'max_queries': stats['max_queries'],
+                    **{name: histogram.as_dict() for name, histogram in sorted(stats['histograms'].items())},
+                }
+                for view_name, stats in sorted(_view_stats.items())
+            },
+            'operations': {name: histogram.as_dict() for name, histogram in sorted(_operation_stats.items())},
+        }
+
+
+def reset_metrics():
+    with _stats_lock:
+        _view_stats.clear()
+        _operation_stats.clear()
+
+
+def record_timing(name, seconds):
+    """Suma una duración a la petición en curso (si la hay) y al histograma de la operación"""
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.add(name, seconds)
+    _observe_operation(name, seconds * 1000)
+
+
+def record_value(name, value):
+    """Suma un valor (p. ej. bytes de PDF generados) a la petición en curso"""
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.add_value(name, value)
+
+
+@contextmanager
+def timed(name):
+    """Mide el bloque como operación `name`. Los bloques anidados de la misma métrica cuentan una vez"""
+    metrics = _current.get()
+    if metrics is not None and name in metrics.active:
+        yield
+        return
+
+    if metrics is not None:
+        metrics.active.add(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if metrics is not None:
+            metrics.active.discard(name)
+        record_timing(name, time.perf_counter() - start)
+
+
+def _db_wrapper(metrics):
+    def wrapper(execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            metrics.add('db', time.perf_counter() - start)
+    return wrapper
+
+
+def server_timing_header(metrics, total_seconds):
+    entries = []
+    for name, description in SERVER_TIMING_METRICS.items():
+        if name in metrics.durations:
+            if name == 'db':
+                description = f"{description} ({metrics.counts['db']} consultas)"
+            entries.append(f'{name};dur={metrics.durations[name] * 1000:.1f};desc="{description}"')
+    entries.append(f'total;dur={total_seconds * 1000:.1f}')
+    return ', '.join(entries)
+
+
+class InstrumentationMiddleware:
+    """
+    Mide cada petición: consultas SQL, plantillas, PDF y correo
+
+    Se desactiva con DENTAL_REPORTS_INSTRUMENTATION = False y la cabecera
+    Server-Timing con DENTAL_REPORTS_SERVER_TIMING = False.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'DENTAL_REPORTS_INSTRUMENTATION', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.server_timing = getattr(settings, 'DENTAL_REPORTS_SERVER_TIMING', True)
+        self.slow_request_ms = getattr(settings, 'DENTAL_REPORTS_SLOW_REQUEST_MS', DEFAULT_SLOW_REQUEST_MS)
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            with ExitStack() as stack:
+                wrapper = _db_wrapper(metrics)
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(wrapper))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+
+        total_seconds = time.perf_counter() - metrics.started
+        resolver_match = getattr(request, 'resolver_match', None)
+        view_name = resolver_match.view_name if resolver_match else 'sin_vista'
+        record_request(view_name, metrics, total_seconds)
+
+        if self.server_timing:
+            response['Server-Timing'] = server_timing_header(metrics, total_seconds)
+        self.log_request(request, response, view_name, metrics, total_seconds)
+        return response
+
+    def log_request(self, request, response, view_name, metrics, total_seconds):
+        total_ms = total_seconds * 1000
+        level = logging.INFO if total_ms >= self.slow_request_ms else logging.DEBUG
+        if not logger.isEnabledFor(level):
+            return
+        record = {
+            'view': view_name,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'total_ms': round(total_ms, 3),
+            **metrics.as_dict(),
+        }
+        logger.log(level, json.dumps(record), extra={'request_metrics': record})
+
+
+class _TimedTemplate:
+    """Plantilla del motor de Django cuyo renderizado se mide como 'tpl'"""
+
+    def __init__(self, template):
+        self._template = template
+
+    def __getattr__(self, name):
+        return getattr(self._template, name)
+
+    def render(self, context=None, request=None):
+        with timed('tpl'):
+            return self._template.render(context, request)
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """
+    Motor DjangoTemplates que mide el tiempo de renderizado de las páginas
+
+    Se configura en TEMPLATES['BACKEND']. Las plantillas incluidas desde otra
+    (include, crispy...) se miden dentro de la que las incluye.
+    """
+
+    def from_string(self, template_code):
+        return _TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return _TimedTemplate(super().get_template(template_name))
@@ -0,0 +1,369 @@
+# dental_reports/jobs.py
+"""
+Cola de renderizado de PDFs respaldada por la base de datos.
+
+Los informes con pdf_status='pending' forman la cola. Un proceso trabajador
+(`manage.py run_pdf_worker`) los reclama, reparte el HTML entre un pool de
+procesos que ejecutan xhtml2pdf y guarda los PDF resultantes.
+
+Cada informe guarda su PDF junto con la huella del documento del que salió
+(pdf_source_hash, la misma clave que la caché de PDFs) y la versión del
+renderizador. Un PDF sólo se vuelve a generar si falta o si alguno de los dos
+ha cambiado (`pdf_is_stale`); la descarga de un PDF obsoleto lo regenera y lo
+guarda, y `manage.py backfill_report_pdfs` completa los que falten en paralelo.
+"""
+import logging
+import multiprocessing
+import os
+import time
+from datetime import timedelta
+
+from django import db
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import GeneratedReport
+from .pdf_cache import (
+    CachedPdf, get_or_render_pdf, is_cached_pdf_path, pdf_cache_key, release_cached_pdf, store_pdf
+)
+from .rendering import RenderMismatch, report_html
+from .utils import PDF_RENDERER_VERSION, build_pdf_html
+
+logger = logging.getLogger(__name__)
+
+# Tiempo tras el cual un trabajo en estado 'rendering' se considera abandonado
+STALE_RENDERING_AFTER = timedelta(minutes=10)
+
+
+def report_pdf_filename(report):
+    """Nombre de archivo del PDF de un informe"""
+    if report.template:
+        template_name = report.template.name
+    elif report.plantilla:
+        template_name = report.plantilla.nombre
+    else:
+        template_name = 'informe'
+    return f"informe_{report.patient_name.replace(' ', '_')}_{template_name.replace(' ', '_')}.pdf"
+
+
+def report_pdf_key(report):
+    """Huella del documento del que se genera el PDF de un informe (clave de la caché de PDFs)"""
+    return pdf_cache_key(build_pdf_html(report_html(report)))
+
+
+def pdf_is_stale(report, key=None):
+    """True si el informe no tiene PDF guardado o éste no corresponde a su contenido actual"""
+    if not report.pdf_file or report.pdf_renderer_version != PDF_RENDERER_VERSION:
+        return True
+    return report.pdf_source_hash != (key or report_pdf_key(report))
+
+
+def stale_pdf_filter():
+    """
+    Informes cuyo PDF está obsoleto según la base de datos (sin PDF, sin huella
+    o de otra versión del renderizador)
+
+    Los cambios de contenido sólo se detectan comparando la huella (pdf_is_stale).
+    """
+    return (Q(pdf_file='') | Q(pdf_file__isnull=True) | Q(pdf_source_hash='')
+            | ~Q(pdf_renderer_version=PDF_RENDERER_VERSION))
+
+
+def ensure_report_pdf(report):
+    """
+    Devuelve el PDF guardado del informe, generándolo y guardándolo antes si está obsoleto
+
+    Returns:
+        Archivo abierto en modo binario o None si no se pudo generar el PDF (falló
+        xhtml2pdf o el informe renderizado bajo demanda no coincide con su huella)
+    """
+    try:
+        html = report_html(report)
+    except RenderMismatch as e:
+        set_pdf_status(report, GeneratedReport.PDF_FAILED, str(e))
+        return None
+    key = pdf_cache_key(build_pdf_html(html))
+    if not pdf_is_stale(report, key):
+        return report.pdf_file.storage.open(report.pdf_file.name, 'rb')
+
+    cached_pdf = get_or_render_pdf(html)
+    if cached_pdf is None:
+        set_pdf_status(report, GeneratedReport.PDF_FAILED, "Error al generar el PDF")
+        return None
+    store_report_pdf(report, cached_pdf)
+    return report.pdf_file.storage.open(report.pdf_file.name, 'rb')
+
+
+def open_report_pdf(report, render=True):
+    """
+    Abre en modo binario el PDF actual de un informe
+
+    Con render=True el PDF se genera y se guarda si está obsoleto. Con
+    render=False sólo se devuelve si ya existe, guardado en el informe o en la
+    caché de PDFs.
+
+    Returns:
+        Archivo abierto o None si el PDF no está disponible
+    """
+    if render:
+        return ensure_report_pdf(report)
+    try:
+        key = report_pdf_key(report)
+    except RenderMismatch:
+        return None
+    if not pdf_is_stale(report, key) and report.pdf_file.storage.exists(report.pdf_file.name):
+        return report.pdf_file.storage.open(report.pdf_file.name, 'rb')
+    cached_pdf = CachedPdf(key)
+    return cached_pdf.open() if cached_pdf.exists() else None
+
+
+def set_pdf_status(report, status, error=''):
+    """Actualiza el estado del PDF de un informe ya guardado"""
+    report.pdf_status = status
+    report.pdf_error = error
+    report.pdf_status_changed_at = timezone.now()
+    report.save(update_fields=['pdf_status', 'pdf_error', 'pdf_status_changed_at'])
+
+
+def enqueue_report_pdf(report):
+    """Pone en cola la generación del PDF de un informe"""
+    set_pdf_status(report, GeneratedReport.PDF_PENDING)
+
+
+def claim_reports(report_ids):
+    """
+    Pasa a 'rendering' los informes indicados que sigan pendientes.
+
+    La actualización condicional por fila garantiza que dos trabajadores
+    no reclamen el mismo informe. Devuelve los ids reclamados.
+    """
+    claimed = []
+    now = timezone.now()
+    for report_id in report_ids:
+        updated = GeneratedReport.objects.filter(
+            id=report_id, pdf_status=GeneratedReport.PDF_PENDING
+        ).update(pdf_status=GeneratedReport.PDF_RENDERING, pdf_status_changed_at=now, pdf_error='')
+        if updated:
+            claimed.append(report_id)
+    return claimed
+
+
+def claim_pending_reports(limit):
+    """Reclama hasta `limit` informes pendientes, los más antiguos primero"""
+    candidates = (GeneratedReport.objects
+                  .filter(pdf_status=GeneratedReport.PDF_PENDING)
+                  .order_by('created_at')
+                  .values_list('id', flat=True)[:limit])
+    return claim_reports(list(candidates))
+
+
+def requeue_stale_reports(older_than=STALE_RENDERING_AFTER):
+    """Devuelve a la cola los trabajos de un trabajador que murió a mitad"""
+    return GeneratedReport.objects.filter(
+        pdf_status=GeneratedReport.PDF_RENDERING,
+        pdf_status_changed_at__lt=timezone.now() - older_than,
+    ).update(pdf_status=GeneratedReport.PDF_PENDING, pdf_status_changed_at=timezone.now())
+
+
+def _render_in_worker(styled_html):
+    """
+    Renderiza un documento HTML a bytes PDF. Se ejecuta dentro de los procesos
+    del pool, que no tocan la base de datos.
+    """
+    from .utils import render_pdf_bytes
+
+    pdf_bytes = render_pdf_bytes(styled_html)
+    if pdf_bytes is None:
+        raise RuntimeError("xhtml2pdf no pudo convertir el informe")
+    return pdf_bytes
+
+
+def _init_pool_worker():
+    """Inicializa Django en los procesos hijo (necesario con el método 'spawn')"""
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+
+
+def create_render_pool(processes=None):
+    """Crea el pool de procesos de renderizado"""
+    # Las conexiones abiertas no deben heredarse en los procesos hijo
+    db.connections.close_all()
+    return multiprocessing.Pool(processes=processes or os.cpu_count() or 1,
+                                initializer=_init_pool_worker)
+
+
+def store_report_pdf(report, cached_pdf):
+    """
+    Apunta el informe al PDF de la caché y lo marca como listo
+
+    No se copian los bytes: los informes idénticos comparten el archivo de la
+    caché. El PDF anterior se borra después de guardar, de modo que el informe
+    nunca queda apuntando a un archivo inexistente: si era propio (anterior a la
+    caché), siempre; si era de la caché, cuando ya no lo usa ningún otro informe.
+    """
+    previous_name = report.pdf_file.name if report.pdf_file else None
+    report.pdf_file.name = cached_pdf.path
+    report.pdf_source_hash = cached_pdf.key
+    report.pdf_renderer_version = PDF_RENDERER_VERSION
+    report.pdf_status = GeneratedReport.PDF_READY
+    report.pdf_error = ''
+    report.pdf_status_changed_at = timezone.now()
+    report.save(update_fields=['pdf_file', 'pdf_source_hash', 'pdf_renderer_version',
+                               'pdf_status', 'pdf_error', 'pdf_status_changed_at'])
+
+    if previous_name and previous_name != report.pdf_file.name:
+        try:
+            if is_cached_pdf_path(previous_name):
+                release_cached_pdf(previous_name, report.pdf_file.storage)
+            else:
+                report.pdf_file.storage.delete(previous_name)
+        except Exception as e:
+            logger.warning(f"No se pudo eliminar el PDF anterior del informe {report.id}: {e}")
+
+
+def mark_pdf_ready(report, source_hash):
+    """Marca como listo un informe cuyo PDF guardado ya está al día"""
+    report.pdf_source_hash = source_hash
+    report.pdf_renderer_version = PDF_RENDERER_VERSION
+    report.pdf_status = GeneratedReport.PDF_READY
+    report.pdf_error = ''
+    report.pdf_status_changed_at = timezone.now()
+    report.save(update_fields=['pdf_source_hash', 'pdf_renderer_version',
+                               'pdf_status', 'pdf_error', 'pdf_status_changed_at'])
+
+
+def render_reports(pool, report_ids, timeout=300):
+    """
+    Renderiza en paralelo los PDF de los informes indicados
+
+    Returns:
+        Tupla (generados, fallidos)
+    """
+    reports = GeneratedReport.objects.filter(id__in=report_ids).select_related('template')
+
+    # Los PDF ya presentes en la caché no se vuelven a renderizar, y los
+    # informes idénticos del mismo lote comparten un único trabajo
+    in_flight = {}
+    tasks = []
+    ready, failed = 0, 0
+    for report in reports:
+        try:
+            styled_html = build_pdf_html(report_html(report))
+        except RenderMismatch as e:
+            set_pdf_status(report, GeneratedReport.PDF_FAILED, str(e))
+            failed += 1
+            continue
+        key = pdf_cache_key(styled_html)
+        if not pdf_is_stale(report, key):
+            # Otro proceso (o una descarga) ya lo generó
+            tasks.append((report, key, True))
+            continue
+        if key not in in_flight and not CachedPdf(key).exists():
+            in_flight[key] = pool.apply_async(_render_in_worker, (styled_html,))
+        tasks.append((report, key, False))
+
+    for report, key, fresh in tasks:
+        try:
+            if fresh:
+                mark_pdf_ready(report, key)
+            else:
+                if key in in_flight:
+                    cached_pdf = store_pdf(key, in_flight[key].get(timeout=timeout))
+                else:
+                    cached_pdf = CachedPdf(key)
+                store_report_pdf(report, cached_pdf)
+            ready += 1
+        except Exception as e:
+            logger.error(f"Error al generar el PDF del informe {report.id}: {e}")
+            set_pdf_status(report, GeneratedReport.PDF_FAILED, str(e))
+            failed += 1
+    return ready, failed
+
+
+def process_pending(pool, batch_size=20):
+    """Procesa un lote de la cola. Devuelve el número de informes procesados"""
+    report_ids = claim_pending_reports(batch_size)
+    if not report_ids:
+        return 0
+    ready, failed = render_reports(pool, report_ids)
+    logger.info(f"Lote de PDFs procesado: {ready} generados, {failed} con error")
+    return ready + failed
+
+
+def backfill_pdfs(pool, batch_size=100, verify=False):
+    """
+    Genera los PDF que falten o estén obsoletos, por lotes repartidos entre el pool
+
+    Sin verify sólo se consideran los informes que la base de datos marca como
+    obsoletos (stale_pdf_filter). Con verify se recalcula además la huella de
+    todos los informes para detectar cambios de contenido.
+
+    Returns:
+        Tupla (generados, fallidos)
+    """
+    if verify:
+        candidates = _iter_stale_by_hash(batch_size)
+    else:
+        candidates = (GeneratedReport.objects.filter(stale_pdf_filter())
+                      .order_by('id').values_list('id', flat=True).iterator(chunk_size=batch_size))
+
+    ready, failed = 0, 0
+    batch = []
+    for report_id in candidates:
+        batch.append(report_id)
+        if len(batch) >= batch_size:
+            batch_ready, batch_failed = _backfill_batch(pool, batch)
+            ready, failed, batch = ready + batch_ready, failed + batch_failed, []
+    if batch:
+        batch_ready, batch_failed = _backfill_batch(pool, batch)
+        ready, failed = ready + batch_ready, failed + batch_failed
+    return ready, failed
+
+
+def _iter_stale_by_hash(chunk_size):
+    """Ids de los informes con PDF obsoleto, comparando la huella de su contenido actual"""
+    # Todo lo que lee report_html, también para los informes renderizados bajo demanda
+    fields = ('id', 'report_content', 'pdf_file', 'pdf_source_hash', 'pdf_renderer_version', 'plantilla',
+              'template', 'template_version', 'content_hash', 'form_data', 'specialty_name', 'rendered_at')
+    reports = (GeneratedReport.objects.order_by('id').select_related('template__specialty')
+               .only(*fields, 'template__specialty__name', 'template__html_content', 'template__version'))
+    for report in reports.iterator(chunk_size=chunk_size):
+        try:
+            stale = pdf_is_stale(report)
+        except RenderMismatch:
+            # render_reports lo marcará como fallido
+            stale = True
+        if stale:
+            yield report.pk
+
+
+def _backfill_batch(pool, report_ids):
+    # Se encolan y reclaman como en la cola normal, para no pisar a run_pdf_worker
+    GeneratedReport.objects.filter(id__in=report_ids).exclude(
+        pdf_status=GeneratedReport.PDF_RENDERING
+    ).update(pdf_status=GeneratedReport.PDF_PENDING, pdf_status_changed_at=timezone.now())
+    claimed = claim_reports(report_ids)
+    if not claimed:
+        return 0, 0
+    ready, failed = render_reports(pool, claimed)
+    logger.info(f"Lote de PDFs completado: {ready} generados, {failed} con error")
+    return ready, failed
+
+
+def run_worker(processes=None, batch_size=20, poll_interval=2.0, once=False):
+    """Bucle principal del trabajador de PDFs"""
+    pool = create_render_pool(processes)
+    try:
+        while True:
+            requeue_stale_reports()
+            processed = process_pending(pool, batch_size)
+            if once and not processed:
+                break
+            if not processed:
+                time.sleep(poll_interval)
+    finally:
+        pool.close()
+        pool.join()
@@ -0,0 +1,271 @@
+# dental_reports/mail.py
+"""
+Bandeja de salida de correos con informes.
+
+Las vistas sólo encolan filas de OutboundEmail. Un proceso trabajador
+(`manage.py send_outbox`) las envía por lotes reutilizando una única conexión
+SMTP por lote y reintenta los fallos con espera exponencial. El PDF adjunto
+se codifica al construir cada mensaje, que se envía completo desde memoria.
+"""
+import base64
+import logging
+import smtplib
+import time
+from datetime import timedelta
+from email.mime.base import MIMEBase
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db.models import F
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.html import escape, strip_tags
+
+from .instrumentation import timed
+from .jobs import open_report_pdf, report_pdf_filename
+from .models import OutboundEmail
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ATTEMPTS = 5
+# Espera antes del primer reintento; se duplica en cada fallo hasta RETRY_MAX_DELAY
+RETRY_BASE_DELAY = timedelta(minutes=1)
+RETRY_MAX_DELAY = timedelta(hours=6)
+# Tiempo tras el cual un correo en estado 'sending' se considera abandonado
+STALE_SENDING_AFTER = timedelta(minutes=15)
+
+# Bytes leídos en cada bloque del adjunto: múltiplo de 57 para que cada bloque
+# produzca líneas base64 completas de 76 caracteres
+ATTACHMENT_CHUNK_SIZE = 57 * 1024
+
+
+def max_attempts():
+    return getattr(settings, 'DENTAL_REPORTS_EMAIL_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS)
+
+
+def retry_delay(attempts):
+    """Espera antes del siguiente intento tras `attempts` intentos fallidos"""
+    return min(RETRY_BASE_DELAY * (2 ** max(attempts - 1, 0)), RETRY_MAX_DELAY)
+
+
+def build_report_email(report, dentist, subject=None, message=None, template=None, created_by=None):
+    """Construye (sin guardar) el correo de un informe para un dentista"""
+    if not subject:
+        subject = f"Informe dental: {report.title}"
+
+    if template:
+        # Usar plantilla HTML para el email
+        html_content = render_to_string(f'dental_reports/email_templates/{template}.html', {
+            'report': report,
+            'dentist': dentist,
+            'message': message or ""
+        })
+        text_content = strip_tags(html_content)
+    else:
+        # Email simple sin plantilla HTML
+        text_content = message or f"Adjuntamos el informe dental {report.title} para el paciente {report.patient_name}."
+        html_content = f"<p>{escape(text_content)}</p>"
+
+    return OutboundEmail(
+        report=report,
+        dentist=dentist,
+        to_email=dentist.email,
+        subject=subject[:255],
+        body=text_content,
+        html_body=html_content,
+        created_by=created_by,
+    )
+
+
+def queue_report_email(report, dentist, subject=None, message=None, template=None, created_by=None):
+    """Encola el envío de un informe a un dentista"""
+    outbound = build_report_email(report, dentist, subject, message, template, created_by)
+    outbound.save()
+    return outbound
+
+
+def queue_report_emails(pairs, subject=None, message=None, template=None, created_by=None):
+    """
+    Encola de una vez el envío de muchos informes
+
+    Args:
+        pairs: Iterable de tuplas (informe, dentista)
+
+    Returns:
+        Lista de OutboundEmail creados
+    """
+    emails = [
+        build_report_email(report, dentist, subject, message, template, created_by)
+        for report, dentist in pairs
+        if dentist.email
+    ]
+    return OutboundEmail.objects.bulk_create(emails, batch_size=500)
+
+
+def queue_report_for_dentists(report, dentists, subject=None, message=None, template=None, created_by=None):
+    """Encola el envío de un informe a varios dentistas"""
+    return queue_report_emails(((report, dentist) for dentist in dentists),
+                               subject, message, template, created_by)
+
+
+def storage_attachment(file, filename, mimetype='application/pdf'):
+    """
+    Adjunto MIME con el contenido de un archivo del almacenamiento
+
+    El archivo se lee y se codifica en base64 por bloques, así que los bytes
+    originales nunca están completos en memoria, pero el texto base64 sí (un
+    tercio mayor que el PDF): el backend SMTP de Django serializa el mensaje
+    entero antes de enviarlo y no admite adjuntos en flujo.
+    """
+    maintype, subtype = mimetype.split('/', 1)
+    part = MIMEBase(maintype, subtype)
+    encoded = []
+    with file as f:
+        for chunk in iter(lambda: f.read(ATTACHMENT_CHUNK_SIZE), b''):
+            encoded.append(base64.encodebytes(chunk).decode('ascii'))
+    part.set_payload(''.join(encoded))
+    part['Content-Transfer-Encoding'] = 'base64'
+    part.add_header('Content-Disposition', 'attachment', filename=filename)
+    return part
+
+
+def build_message(outbound, connection=None):
+    """EmailMultiAlternatives listo para enviar, con el PDF del informe adjunto"""
+    email = EmailMultiAlternatives(
+        subject=outbound.subject,
+        body=outbound.body,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[outbound.to_email],
+        connection=connection,
+    )
+    if outbound.html_body:
+        email.attach_alternative(outbound.html_body, "text/html")
+    pdf_file = open_report_pdf(outbound.report)
+    if pdf_file is None:
+        raise RuntimeError(f"No se pudo generar el PDF del informe {outbound.report_id}")
+    email.attach(storage_attachment(pdf_file, report_pdf_filename(outbound.report)))
+    return email
+
+
+def claim_emails(limit):
+    """Reclama hasta `limit` correos pendientes cuyo próximo intento ya ha llegado"""
+    now = timezone.now()
+    candidates = list(OutboundEmail.objects
+                      .filter(status=OutboundEmail.STATUS_PENDING, next_attempt_at__lte=now)
+                      .order_by('next_attempt_at', 'id')
+                      .values_list('id', flat=True)[:limit])
+    claimed = []
+    for email_id in candidates:
+        # Actualización condicional: dos trabajadores nunca envían el mismo correo
+        if OutboundEmail.objects.filter(id=email_id, status=OutboundEmail.STATUS_PENDING).update(
+                status=OutboundEmail.STATUS_SENDING, next_attempt_at=now, attempts=F('attempts') + 1):
+            claimed.append(email_id)
+    return claimed
+
+
+def requeue_stale_emails(older_than=STALE_SENDING_AFTER):
+    """Devuelve a la cola los correos de un trabajador que murió a mitad de lote"""
+    return OutboundEmail.objects.filter(
+        status=OutboundEmail.STATUS_SENDING,
+        next_attempt_at__lt=timezone.now() - older_than,
+    ).update(status=OutboundEmail.STATUS_PENDING)
+
+
+def mark_sent(outbound):
+    outbound.status = OutboundEmail.STATUS_SENT
+    outbound.sent_at = timezone.now()
+    outbound.last_error = ''
+    outbound.save(update_fields=['status', 'sent_at', 'last_error'])
+
+
+def mark_failed(outbound, error):
+    """Programa un reintento con espera exponencial, o marca el correo como fallido"""
+    outbound.last_error = str(error)
+    if outbound.attempts >= max_attempts():
+        outbound.status = OutboundEmail.STATUS_FAILED
+    else:
+        outbound.status = OutboundEmail.STATUS_PENDING
+        outbound.next_attempt_at = timezone.now() + retry_delay(outbound.attempts)
+    outbound.save(update_fields=['status', 'next_attempt_at', 'last_error'])
+
+
+def fail_emails(emails, error):
+    """Programa el reintento de correos que no se llegaron a intentar enviar"""
+    for outbound in emails:
+        mark_failed(outbound, error)
+    return len(emails)
+
+
+def send_batch(email_ids, connection=None):
+    """
+    Envía los correos indicados (ya reclamados) con una única conexión
+
+    Si no se puede abrir (o reabrir) la conexión SMTP, los correos que quedan
+    del lote vuelven a la cola con espera exponencial en lugar de quedarse en
+    estado 'sending'.
+
+    Returns:
+        Tupla (enviados, fallidos)
+    """
+    emails = list(OutboundEmail.objects.filter(id__in=email_ids)
+                  .select_related('report', 'report__template').order_by('id'))
+    connection = connection or get_connection()
+    sent, failed = 0, 0
+
+    try:
+        connection.open()
+    except (OSError, smtplib.SMTPException) as e:
+        logger.warning(f"No se pudo conectar con el servidor de correo: {e}")
+        return sent, fail_emails(emails, e)
+
+    try:
+        for position, outbound in enumerate(emails):
+            try:
+                with timed('email'):
+                    build_message(outbound, connection).send()
+            except Exception as e:
+                logger.warning(f"Error al enviar el correo {outbound.id} a {outbound.to_email}: {e}")
+                mark_failed(outbound, e)
+                failed += 1
+                if isinstance(e, smtplib.SMTPServerDisconnected):
+                    # El servidor cerró la conexión: abrir otra para el resto del lote
+                    connection.close()
+                    try:
+                        connection.open()
+                    except (OSError, smtplib.SMTPException) as reopen_error:
+                        logger.warning(f"No se pudo reconectar con el servidor de correo: {reopen_error}")
+                        failed += fail_emails(emails[position + 1:], reopen_error)
+                        break
+                continue
+            mark_sent(outbound)
+            sent += 1
+    finally:
+        connection.close()
+    return sent, failed
+
+
+def process_outbox(batch_size=100, connection=None):
+    """Procesa un lote de la bandeja de salida. Devuelve el número de correos procesados"""
+    email_ids = claim_emails(batch_size)
+    if not email_ids:
+        return 0
+    sent, failed = send_batch(email_ids, connection)
+    logger.info(f"Lote de correos procesado: {sent} enviados, {failed} con error")
+    return sent + failed
+
+
+def run_outbox_worker(batch_size=100, poll_interval=5.0, once=False):
+    """Bucle principal del trabajador de correo"""
+    while True:
+        try:
+            requeue_stale_emails()
+            processed = process_outbox(batch_size)
+        except Exception:
+            # Un error inesperado (p. ej. de la base de datos) no debe parar el trabajador:
+            # los correos reclamados vuelven a la cola con requeue_stale_emails
+            logger.exception("Error en el trabajador de correo")
+            processed = 0
+        if once and not processed:
+            break
+        if not processed:
+            time.sleep(poll_interval)
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from dental_reports.jobs import backfill_pdfs, create_render_pool
+
+
+class Command(BaseCommand):
+    help = 'Genera en paralelo los PDF de los informes que no lo tienen o lo tienen obsoleto'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=None,
+                            help='Número de procesos de renderizado (por defecto, uno por CPU)')
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Informes repartidos entre el pool en cada lote')
+        parser.add_argument('--verify', action='store_true',
+                            help='Recalcular la huella de todos los informes para detectar '
+                                 'cambios de contenido (más lento)')
+
+    def handle(self, *args, **options):
+        pool = create_render_pool(options['processes'])
+        try:
+            ready, failed = backfill_pdfs(pool, batch_size=options['batch_size'], verify=options['verify'])
+        finally:
+            pool.close()
+            pool.join()
+
+        self.stdout.write(self.style.SUCCESS(f'PDFs generados: {ready}'))
+        if failed:
+            self.stdout.write(self.style.WARNING(f'PDFs con error: {failed}'))
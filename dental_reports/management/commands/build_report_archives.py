@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from dental_reports.archives import run_archive_worker
+
+
+class Command(BaseCommand):
+    help = 'Genera los archivos ZIP de informes pendientes, renderizando antes los PDF que falten'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=None,
+                            help='Número de procesos de renderizado (por defecto, uno por CPU)')
+        parser.add_argument('--poll-interval', type=float, default=5.0,
+                            help='Segundos de espera cuando no hay ZIP pendientes')
+        parser.add_argument('--once', action='store_true',
+                            help='Generar los ZIP pendientes y terminar en lugar de quedarse escuchando')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Iniciando el trabajador de archivos ZIP...')
+        try:
+            run_archive_worker(
+                processes=options['processes'],
+                poll_interval=options['poll_interval'],
+                once=options['once'],
+            )
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('Trabajador detenido'))
+            return
+        self.stdout.write(self.style.SUCCESS('No quedan archivos ZIP pendientes'))
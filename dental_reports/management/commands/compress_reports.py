@@ -0,0 +1,60 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from dental_reports.compression import recompress_reports, train_template_dictionary
+from dental_reports.models import GeneratedReport
+
+
+class Command(BaseCommand):
+    help = ('Comprime report_content y form_data de los informes existentes con el códec y los '
+            'diccionarios actuales (opcionalmente entrenando antes un diccionario por plantilla)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Informes procesados en cada lote')
+        parser.add_argument('--template', type=int,
+                            help='Procesar sólo los informes de esta plantilla')
+        parser.add_argument('--train', action='store_true',
+                            help='Entrenar antes un diccionario nuevo para cada plantilla')
+        parser.add_argument('--samples', type=int, default=200,
+                            help='Informes recientes con los que se entrena cada diccionario')
+        parser.add_argument('--min-samples', type=int, default=10,
+                            help='Plantillas con menos informes se quedan sin diccionario')
+        parser.add_argument('--vacuum', action='store_true',
+                            help='Ejecutar VACUUM al terminar (SQLite) para devolver el espacio liberado')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+
+        if options['train']:
+            template_ids = ([options['template']] if options['template'] else
+                            GeneratedReport.objects.exclude(template=None)
+                            .values_list('template_id', flat=True).distinct().order_by('template_id'))
+            trained = 0
+            for template_id in template_ids:
+                dictionary = train_template_dictionary(template_id, samples=options['samples'],
+                                                       min_samples=options['min_samples'])
+                if dictionary is not None:
+                    trained += 1
+                    self.stdout.write(f'  Plantilla {template_id}: diccionario #{dictionary.pk} '
+                                      f'({len(dictionary.data)} bytes, {dictionary.sample_count} informes)')
+            self.stdout.write(f'{trained} diccionarios entrenados')
+
+        checked, rewritten, before, after = recompress_reports(batch_size=options['batch_size'],
+                                                               template_id=options['template'])
+        elapsed = time.perf_counter() - started
+        ratio = before / after if after else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'{rewritten} de {checked} informes reescritos en {elapsed:.2f} s: '
+            f'{before / 1024:.0f} KB -> {after / 1024:.0f} KB ({ratio:.1f}x)'
+        ))
+
+        if options['vacuum']:
+            if connection.vendor == 'sqlite':
+                with connection.cursor() as cursor:
+                    cursor.execute('VACUUM')
+                self.stdout.write('Base de datos compactada (VACUUM)')
+            else:
+                self.stdout.write(self.style.WARNING('--vacuum sólo se aplica a SQLite'))
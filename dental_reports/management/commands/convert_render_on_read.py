@@ -0,0 +1,98 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from dental_reports.models import GeneratedReport
+from dental_reports.rendering import RenderMismatch, freeze_report, make_render_on_read, verify_render_on_read
+
+# Campos que cambian al convertir un informe en uno u otro sentido
+CONVERTED_FIELDS = ['report_content', 'template_version', 'specialty_name', 'rendered_at', 'content_hash']
+
+# Ids de informes que no coinciden que se muestran como máximo
+MAX_LISTED = 20
+
+
+def iter_batches(queryset, batch_size):
+    """Lotes de informes por orden de id (paginación por clave, sin OFFSET)"""
+    last_id = 0
+    while True:
+        batch = list(queryset.filter(id__gt=last_id).order_by('id')[:batch_size])
+        if not batch:
+            return
+        last_id = batch[-1].pk
+        yield batch
+
+
+class Command(BaseCommand):
+    help = ('Comprueba y convierte informes al renderizado bajo demanda (HTML generado al leerlo '
+            'desde form_data y la versión de su plantilla) o los devuelve a HTML guardado')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--convert', action='store_true',
+                            help='Convertir los informes cuyo HTML se reproduce byte a byte')
+        parser.add_argument('--freeze', action='store_true',
+                            help='Volver a guardar el HTML de los informes renderizados bajo demanda')
+        parser.add_argument('--batch-size', type=int, default=200,
+                            help='Informes procesados en cada lote')
+        parser.add_argument('--template', type=int,
+                            help='Procesar sólo los informes de esta plantilla')
+
+    def handle(self, *args, **options):
+        if options['convert'] and options['freeze']:
+            raise CommandError('--convert y --freeze son incompatibles')
+
+        started = time.perf_counter()
+        reports = GeneratedReport.objects.select_related('template__specialty')
+        if options['template']:
+            reports = reports.filter(template_id=options['template'])
+
+        if options['freeze']:
+            # Los que ya no dan su HTML original no se congelan con un HTML distinto
+            frozen, mismatched = 0, []
+            for batch in iter_batches(reports.filter(template_version__isnull=False), options['batch_size']):
+                done = []
+                for report in batch:
+                    try:
+                        freeze_report(report)
+                    except RenderMismatch:
+                        mismatched.append(report.pk)
+                    else:
+                        done.append(report)
+                GeneratedReport.objects.bulk_update(done, CONVERTED_FIELDS)
+                frozen += len(done)
+            self.stdout.write(self.style.SUCCESS(
+                f'{frozen} informes con HTML guardado de nuevo en {time.perf_counter() - started:.2f} s'))
+            self.check_mismatched(mismatched)
+            return
+
+        # Informes ya renderizados bajo demanda: ¿siguen dando el mismo HTML?
+        verified, mismatched = 0, []
+        for batch in iter_batches(reports.filter(template_version__isnull=False), options['batch_size']):
+            for report in batch:
+                verified += 1
+                if not verify_render_on_read(report):
+                    mismatched.append(report.pk)
+
+        # Informes con HTML guardado: ¿se reproducen byte a byte?
+        stored = convertible = 0
+        candidates = reports.filter(template_version__isnull=True, template__isnull=False, plantilla__isnull=True)
+        for batch in iter_batches(candidates, options['batch_size']):
+            converted = [report for report in batch if make_render_on_read(report)]
+            stored += len(batch)
+            convertible += len(converted)
+            if options['convert'] and converted:
+                GeneratedReport.objects.bulk_update(converted, CONVERTED_FIELDS)
+
+        action = 'convertidos' if options['convert'] else 'convertibles (usa --convert)'
+        self.stdout.write(f'{convertible} de {stored} informes con HTML guardado {action}')
+        self.stdout.write(f'{verified - len(mismatched)} de {verified} informes renderizados bajo demanda verificados')
+        self.stdout.write(f'Terminado en {time.perf_counter() - started:.2f} s')
+        self.check_mismatched(mismatched)
+
+    def check_mismatched(self, mismatched):
+        if mismatched:
+            listed = ', '.join(str(pk) for pk in mismatched[:MAX_LISTED])
+            raise CommandError(
+                f'{len(mismatched)} informes renderizados bajo demanda ya no coinciden con su huella '
+                f'(p. ej. cambió un filtro de plantilla o la configuración regional): {listed}'
+            )
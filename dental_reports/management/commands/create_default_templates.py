@@ -3,6 +3,320 @@ from django.contrib.auth.models import User
 from dental_reports.models import TemplateCategory, Specialty, ReportTemplate
 
 
+# Plantilla 1: Informe de Endodoncia Básico
+ENDODONCIA_HTML = """
+<div class="container report-container">
+    <div class="report-header">
+        <h2 class="text-center">INFORME DE ENDODONCIA</h2>
+        <hr>
+        <div class="row mt-4">
+            <div class="col-md-6">
+                <p><strong>Paciente:</strong> {{paciente.nombre}}</p>
+            </div>
+            <div class="col-md-6 text-end">
+                <p><strong>Fecha:</strong> {% now "d/m/Y" %}</p>
+            </div>
+        </div>
+        <div class="row">
+            <div class="col-md-6">
+                <p><strong>Médico:</strong> {{medico.nombre}}</p>
+            </div>
+        </div>
+    </div>
+
+    <div class="report-content mt-4">
+        <h4>Diente Tratado</h4>
+        <p>{{datos.diente}}</p>
+
+        <h4>Diagnóstico</h4>
+        <p>{{datos.diagnostico}}</p>
+
+        <h4>Procedimiento Realizado</h4>
+        <p>{{datos.procedimiento}}</p>
+
+        <h4>Observaciones</h4>
+        <p>{{datos.observaciones}}</p>
+    </div>
+
+    <div class="report-footer mt-5">
+        <div class="row">
+            <div class="col-md-6">
+                <p>Revisión recomendada en: {{datos.revision}} semanas</p>
+            </div>
+            <div class="col-md-6 text-end">
+                <p>____________________</p>
+                <p>Firma del especialista</p>
+            </div>
+        </div>
+    </div>
+</div>
+"""
+
+ENDODONCIA_FIELDS = {
+    "fields": [
+        {
+            "name": "diente",
+            "label": "Diente tratado (número)",
+            "type": "text",
+            "required": True
+        },
+        {
+            "name": "diagnostico",
+            "label": "Diagnóstico",
+            "type": "textarea",
+            "required": True
+        },
+        {
+            "name": "procedimiento",
+            "label": "Procedimiento realizado",
+            "type": "textarea",
+            "required": True
+        },
+        {
+            "name": "observaciones",
+            "label": "Observaciones",
+            "type": "textarea",
+            "required": False
+        },
+        {
+            "name": "revision",
+            "label": "Revisión recomendada (semanas)",
+            "type": "number",
+            "required": True
+        }
+    ]
+}
+
+
+# Plantilla 2: Informe de Periodoncia
+PERIODONCIA_HTML = """
+<div class="container report-container">
+    <div class="report-header">
+        <h2 class="text-center">INFORME DE PERIODONCIA</h2>
+        <hr>
+        <div class="row mt-4">
+            <div class="col-md-6">
+                <p><strong>Paciente:</strong> {{paciente.nombre}}</p>
+            </div>
+            <div class="col-md-6 text-end">
+                <p><strong>Fecha:</strong> {% now "d/m/Y" %}</p>
+            </div>
+        </div>
+        <div class="row">
+            <div class="col-md-6">
+                <p><strong>Médico:</strong> {{medico.nombre}}</p>
+            </div>
+        </div>
+    </div>
+
+    <div class="report-content mt-4">
+        <h4>Evaluación Periodontal</h4>
+        <p>{{datos.evaluacion}}</p>
+
+        <h4>Zonas Afectadas</h4>
+        <p>{{datos.zonas_afectadas}}</p>
+
+        <h4>Tratamiento Recomendado</h4>
+        <p>{{datos.tratamiento}}</p>
+
+        <h4>Instrucciones para el Paciente</h4>
+        <p>{{datos.instrucciones}}</p>
+
+        {% if datos.requiere_cirugia == "Sí" %}
+        <div class="alert alert-warning">
+            <h5>Requiere Intervención Quirúrgica</h5>
+            <p>{{datos.detalles_cirugia}}</p>
+        </div>
+        {% endif %}
+    </div>
+
+    <div class="report-footer mt-5">
+        <div class="row">
+            <div class="col-md-6">
+                <p>Próxima cita: {{datos.proxima_cita}}</p>
+            </div>
+            <div class="col-md-6 text-end">
+                <p>____________________</p>
+                <p>Firma del periodoncista</p>
+            </div>
+        </div>
+    </div>
+</div>
+"""
+
+PERIODONCIA_FIELDS = {
+    "fields": [
+        {
+            "name": "evaluacion",
+            "label": "Evaluación periodontal",
+            "type": "textarea",
+            "required": True
+        },
+        {
+            "name": "zonas_afectadas",
+            "label": "Zonas afectadas",
+            "type": "textarea",
+            "required": True
+        },
+        {
+            "name": "tratamiento",
+            "label": "Tratamiento recomendado",
+            "type": "textarea",
+            "required": True
+        },
+        {
+            "name": "instrucciones",
+            "label": "Instrucciones para el paciente",
+            "type": "textarea",
+            "required": True
+        },
+        {
+            "name": "requiere_cirugia",
+            "label": "¿Requiere intervención quirúrgica?",
+            "type": "select",
+            "options": ["No", "Sí"],
+            "required": True
+        },
+        {
+            "name": "detalles_cirugia",
+            "label": "Detalles de la cirugía (si aplica)",
+            "type": "textarea",
+            "required": False
+        },
+        {
+            "name": "proxima_cita",
+            "label": "Fecha próxima cita",
+            "type": "date",
+            "required": True
+        }
+    ]
+}
+
+
+# Plantilla 3: Informe Dental General
+GENERAL_HTML = """
+<div class="container report-container">
+    <div class="report-header">
+        <h2 class="text-center">INFORME DENTAL</h2>
+        <hr>
+        <div class="row mt-4">
+            <div class="col-md-6">
+                <p><strong>Paciente:</strong> {{paciente.nombre}}</p>
+            </div>
+            <div class="col-md-6 text-end">
+                <p><strong>Fecha:</strong> {% now "d/m/Y" %}</p>
+            </div>
+        </div>
+        <div class="row">
+            <div class="col-md-6">
+                <p><strong>Médico:</strong> {{medico.nombre}}</p>
+            </div>
+        </div>
+    </div>
+
+    <div class="report-content mt-4">
+        <h4>Motivo de la Consulta</h4>
+        <p>{{datos.motivo}}</p>
+
+        <h4>Examen Clínico</h4>
+        <p>{{datos.examen_clinico}}</p>
+
+        <h4>Diagnóstico</h4>
+        <p>{{datos.diagnostico}}</p>
+
+        <h4>Plan de Tratamiento</h4>
+        <p>{{datos.plan_tratamiento}}</p>
+
+        <h4>Presupuesto Estimado</h4>
+        <p>{{datos.presupuesto}} €</p>
+    </div>
+
+    <div class="report-footer mt-5">
+        <div class="row">
+            <div class="col-md-6">
+                <p><strong>Teléfono para citas:</strong> {{datos.telefono_citas}}</p>
+            </div>
+            <div class="col-md-6 text-end">
+                <p>____________________</p>
+                <p>Firma del dentista</p>
+            </div>
+        </div>
+    </div>
+</div>
+"""
+
+GENERAL_FIELDS = {
+    "fields": [
+        {
+            "name": "motivo",
+            "label": "Motivo de la consulta",
+            "type": "textarea",
+            "required": True
+        },
+        {
+            "name": "examen_clinico",
+            "label": "Examen clínico",
+            "type": "textarea",
+            "required": True
+        },
+        {
+            "name": "diagnostico",
+            "label": "Diagnóstico",
+            "type": "textarea",
+            "required": True
+        },
+        {
+            "name": "plan_tratamiento",
+            "label": "Plan de tratamiento",
+            "type": "textarea",
+            "required": True
+        },
+        {
+            "name": "presupuesto",
+            "label": "Presupuesto estimado (€)",
+            "type": "number",
+            "required": True
+        },
+        {
+            "name": "telefono_citas",
+            "label": "Teléfono para citas",
+            "type": "text",
+            "required": True
+        }
+    ]
+}
+
+
+# Plantillas predefinidas. 'category' y 'specialty' son los nombres de las
+# creadas por el comando; también las usan los benchmarks (dental_reports.benchmarks)
+DEFAULT_TEMPLATES = [
+    {
+        'name': "Informe de Endodoncia Básico",
+        'category': "Endodoncia",
+        'specialty': "Endodoncia",
+        'description': "Plantilla básica para informes de tratamiento de endodoncia",
+        'html_content': ENDODONCIA_HTML,
+        'fields_schema': ENDODONCIA_FIELDS,
+    },
+    {
+        'name': "Informe de Periodoncia",
+        'category': "Periodoncia",
+        'specialty': "Periodoncia",
+        'description': "Plantilla para informes de evaluación y tratamiento periodontal",
+        'html_content': PERIODONCIA_HTML,
+        'fields_schema': PERIODONCIA_FIELDS,
+    },
+    {
+        'name': "Informe Dental General",
+        'category': "Informe General",
+        'specialty': None,  # Sin especialidad específica
+        'description': "Plantilla general para informes dentales",
+        'html_content': GENERAL_HTML,
+        'fields_schema': GENERAL_FIELDS,
+    },
+]
+
+
 class Command(BaseCommand):
     help = 'Crea plantillas predefinidas de informes dentales'
 
@@ -58,336 +372,25 @@ class Command(BaseCommand):
             self.stdout.write(self.style.WARNING('No se encontró un usuario administrador'))
             admin_user = None
 
-        # Plantilla 1: Informe de Endodoncia Básico
-        template1_html = """
-        <div class="container report-container">
-            <div class="report-header">
-                <h2 class="text-center">INFORME DE ENDODONCIA</h2>
-                <hr>
-                <div class="row mt-4">
-                    <div class="col-md-6">
-                        <p><strong>Paciente:</strong> {{paciente.nombre}}</p>
-                    </div>
-                    <div class="col-md-6 text-end">
-                        <p><strong>Fecha:</strong> {% now "d/m/Y" %}</p>
-                    </div>
-                </div>
-                <div class="row">
-                    <div class="col-md-6">
-                        <p><strong>Médico:</strong> {{medico.nombre}}</p>
-                    </div>
-                </div>
-            </div>
-
-            <div class="report-content mt-4">
-                <h4>Diente Tratado</h4>
-                <p>{{datos.diente}}</p>
-
-                <h4>Diagnóstico</h4>
-                <p>{{datos.diagnostico}}</p>
-
-                <h4>Procedimiento Realizado</h4>
-                <p>{{datos.procedimiento}}</p>
-
-                <h4>Observaciones</h4>
-                <p>{{datos.observaciones}}</p>
-            </div>
-
-            <div class="report-footer mt-5">
-                <div class="row">
-                    <div class="col-md-6">
-                        <p>Revisión recomendada en: {{datos.revision}} semanas</p>
-                    </div>
-                    <div class="col-md-6 text-end">
-                        <p>____________________</p>
-                        <p>Firma del especialista</p>
-                    </div>
-                </div>
-            </div>
-        </div>
-        """
-
-        template1_fields = {
-            "fields": [
-                {
-                    "name": "diente",
-                    "label": "Diente tratado (número)",
-                    "type": "text",
-                    "required": True
-                },
-                {
-                    "name": "diagnostico",
-                    "label": "Diagnóstico",
-                    "type": "textarea",
-                    "required": True
-                },
-                {
-                    "name": "procedimiento",
-                    "label": "Procedimiento realizado",
-                    "type": "textarea",
-                    "required": True
-                },
-                {
-                    "name": "observaciones",
-                    "label": "Observaciones",
-                    "type": "textarea",
-                    "required": False
-                },
-                {
-                    "name": "revision",
-                    "label": "Revisión recomendada (semanas)",
-                    "type": "number",
-                    "required": True
-                }
-            ]
-        }
-
-        template1, created = ReportTemplate.objects.get_or_create(
-            name="Informe de Endodoncia Básico",
-            defaults={
-                "category": endodoncia,
-                "specialty": esp_endodoncia,
-                "description": "Plantilla básica para informes de tratamiento de endodoncia",
-                "html_content": template1_html,
-                "fields_schema": template1_fields,
-                "created_by": admin_user,
-                "is_active": True,
-                "is_public": True
-            }
-        )
-
-        if created:
-            self.stdout.write(self.style.SUCCESS('Plantilla "Informe de Endodoncia Básico" creada'))
-
-        # Plantilla 2: Informe de Periodoncia
-        template2_html = """
-        <div class="container report-container">
-            <div class="report-header">
-                <h2 class="text-center">INFORME DE PERIODONCIA</h2>
-                <hr>
-                <div class="row mt-4">
-                    <div class="col-md-6">
-                        <p><strong>Paciente:</strong> {{paciente.nombre}}</p>
-                    </div>
-                    <div class="col-md-6 text-end">
-                        <p><strong>Fecha:</strong> {% now "d/m/Y" %}</p>
-                    </div>
-                </div>
-                <div class="row">
-                    <div class="col-md-6">
-                        <p><strong>Médico:</strong> {{medico.nombre}}</p>
-                    </div>
-                </div>
-            </div>
-
-            <div class="report-content mt-4">
-                <h4>Evaluación Periodontal</h4>
-                <p>{{datos.evaluacion}}</p>
-
-                <h4>Zonas Afectadas</h4>
-                <p>{{datos.zonas_afectadas}}</p>
-
-                <h4>Tratamiento Recomendado</h4>
-                <p>{{datos.tratamiento}}</p>
-
-                <h4>Instrucciones para el Paciente</h4>
-                <p>{{datos.instrucciones}}</p>
-
-                {% if datos.requiere_cirugia == "Sí" %}
-                <div class="alert alert-warning">
-                    <h5>Requiere Intervención Quirúrgica</h5>
-                    <p>{{datos.detalles_cirugia}}</p>
-                </div>
-                {% endif %}
-            </div>
-
-            <div class="report-footer mt-5">
-                <div class="row">
-                    <div class="col-md-6">
-                        <p>Próxima cita: {{datos.proxima_cita}}</p>
-                    </div>
-                    <div class="col-md-6 text-end">
-                        <p>____________________</p>
-                        <p>Firma del periodoncista</p>
-                    </div>
-                </div>
-            </div>
-        </div>
-        """
-
-        template2_fields = {
-            "fields": [
-                {
-                    "name": "evaluacion",
-                    "label": "Evaluación periodontal",
-                    "type": "textarea",
-                    "required": True
-                },
-                {
-                    "name": "zonas_afectadas",
-                    "label": "Zonas afectadas",
-                    "type": "textarea",
-                    "required": True
-                },
-                {
-                    "name": "tratamiento",
-                    "label": "Tratamiento recomendado",
-                    "type": "textarea",
-                    "required": True
-                },
-                {
-                    "name": "instrucciones",
-                    "label": "Instrucciones para el paciente",
-                    "type": "textarea",
-                    "required": True
-                },
-                {
-                    "name": "requiere_cirugia",
-                    "label": "¿Requiere intervención quirúrgica?",
-                    "type": "select",
-                    "options": ["No", "Sí"],
-                    "required": True
-                },
-                {
-                    "name": "detalles_cirugia",
-                    "label": "Detalles de la cirugía (si aplica)",
-                    "type": "textarea",
-                    "required": False
-                },
-                {
-                    "name": "proxima_cita",
-                    "label": "Fecha próxima cita",
-                    "type": "date",
-                    "required": True
+        categories = {category.name: category for category in (endodoncia, periodoncia, general)}
+        specialties = {specialty.name: specialty for specialty in (esp_endodoncia, esp_periodoncia)}
+
+        for definition in DEFAULT_TEMPLATES:
+            template, created = ReportTemplate.objects.get_or_create(
+                name=definition['name'],
+                defaults={
+                    "category": categories[definition['category']],
+                    "specialty": specialties.get(definition['specialty']),
+                    "description": definition['description'],
+                    "html_content": definition['html_content'],
+                    "fields_schema": definition['fields_schema'],
+                    "created_by": admin_user,
+                    "is_active": True,
+                    "is_public": True
                 }
-            ]
-        }
-
-        template2, created = ReportTemplate.objects.get_or_create(
-            name="Informe de Periodoncia",
-            defaults={
-                "category": periodoncia,
-                "specialty": esp_periodoncia,
-                "description": "Plantilla para informes de evaluación y tratamiento periodontal",
-                "html_content": template2_html,
-                "fields_schema": template2_fields,
-                "created_by": admin_user,
-                "is_active": True,
-                "is_public": True
-            }
-        )
-
-        if created:
-            self.stdout.write(self.style.SUCCESS('Plantilla "Informe de Periodoncia" creada'))
-
-        # Plantilla 3: Informe Dental General
-        template3_html = """
-        <div class="container report-container">
-            <div class="report-header">
-                <h2 class="text-center">INFORME DENTAL</h2>
-                <hr>
-                <div class="row mt-4">
-                    <div class="col-md-6">
-                        <p><strong>Paciente:</strong> {{paciente.nombre}}</p>
-                    </div>
-                    <div class="col-md-6 text-end">
-                        <p><strong>Fecha:</strong> {% now "d/m/Y" %}</p>
-                    </div>
-                </div>
-                <div class="row">
-                    <div class="col-md-6">
-                        <p><strong>Médico:</strong> {{medico.nombre}}</p>
-                    </div>
-                </div>
-            </div>
-
-            <div class="report-content mt-4">
-                <h4>Motivo de la Consulta</h4>
-                <p>{{datos.motivo}}</p>
-
-                <h4>Examen Clínico</h4>
-                <p>{{datos.examen_clinico}}</p>
-
-                <h4>Diagnóstico</h4>
-                <p>{{datos.diagnostico}}</p>
+            )
 
-                <h4>Plan de Tratamiento</h4>
-                <p>{{datos.plan_tratamiento}}</p>
-
-                <h4>Presupuesto Estimado</h4>
-                <p>{{datos.presupuesto}} €</p>
-            </div>
-
-            <div class="report-footer mt-5">
-                <div class="row">
-                    <div class="col-md-6">
-                        <p><strong>Teléfono para citas:</strong> {{datos.telefono_citas}}</p>
-                    </div>
-                    <div class="col-md-6 text-end">
-                        <p>____________________</p>
-                        <p>Firma del dentista</p>
-                    </div>
-                </div>
-            </div>
-        </div>
-        """
-
-        template3_fields = {
-            "fields": [
-                {
-                    "name": "motivo",
-                    "label": "Motivo de la consulta",
-                    "type": "textarea",
-                    "required": True
-                },
-                {
-                    "name": "examen_clinico",
-                    "label": "Examen clínico",
-                    "type": "textarea",
-                    "required": True
-                },
-                {
-                    "name": "diagnostico",
-                    "label": "Diagnóstico",
-                    "type": "textarea",
-                    "required": True
-                },
-                {
-                    "name": "plan_tratamiento",
-                    "label": "Plan de tratamiento",
-                    "type": "textarea",
-                    "required": True
-                },
-                {
-                    "name": "presupuesto",
-                    "label": "Presupuesto estimado (€)",
-                    "type": "number",
-                    "required": True
-                },
-                {
-                    "name": "telefono_citas",
-                    "label": "Teléfono para citas",
-                    "type": "text",
-                    "required": True
-                }
-            ]
-        }
-
-        template3, created = ReportTemplate.objects.get_or_create(
-            name="Informe Dental General",
-            defaults={
-                "category": general,
-                "specialty": None,  # Sin especialidad específica
-                "description": "Plantilla general para informes dentales",
-                "html_content": template3_html,
-                "fields_schema": template3_fields,
-                "created_by": admin_user,
-                "is_active": True,
-                "is_public": True
-            }
-        )
-
-        if created:
-            self.stdout.write(self.style.SUCCESS('Plantilla "Informe Dental General" creada'))
+            if created:
+                self.stdout.write(self.style.SUCCESS(f'Plantilla "{definition["name"]}" creada'))
 
         self.stdout.write(self.style.SUCCESS('¡Plantillas predefinidas creadas con éxito!'))
@@ -0,0 +1,47 @@
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from dental_reports.export import EXPORT_CHUNK_SIZE, EXPORT_FORMATS, iter_export
+from dental_reports.queries import filter_reports
+
+
+class Command(BaseCommand):
+    help = 'Exporta los informes generados a CSV o JSONL, en streaming y con memoria constante'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(EXPORT_FORMATS), default='csv',
+                            help='Formato de salida')
+        parser.add_argument('--output', '-o',
+                            help='Archivo de salida (por defecto, la salida estándar)')
+        parser.add_argument('--template', type=int, help='Exportar sólo los informes de esta plantilla')
+        parser.add_argument('--patient', help='Nombre del paciente (empieza por...)')
+        parser.add_argument('--month', help='Exportar sólo los informes de un mes (AAAA-MM)')
+        parser.add_argument('--user', help='Exportar sólo los informes visibles para este usuario')
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE,
+                            help='Filas leídas de la base de datos en cada bloque')
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f"No existe el usuario {options['user']}")
+
+        reports = filter_reports(user=user, template_id=options['template'], patient_name=options['patient'],
+                                 month=options['month'])
+        lines = iter_export(reports, options['format'], chunk_size=options['chunk_size'])
+
+        if not options['output']:
+            for line in lines:
+                sys.stdout.write(line)
+            return
+
+        count = -1 if options['format'] == 'csv' else 0  # sin contar la cabecera del CSV
+        with open(options['output'], 'w', newline='', encoding='utf-8') as f:
+            for line in lines:
+                f.write(line)
+                count += 1
+        self.stderr.write(self.style.SUCCESS(f'{max(count, 0)} informes exportados a {options["output"]}'))
@@ -0,0 +1,183 @@
+import csv
+import hashlib
+import itertools
+import json
+import os
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from dental_reports.dashboard import record_created
+from dental_reports.forms import DynamicReportForm
+from dental_reports.jobs import claim_reports, create_render_pool, render_reports
+from dental_reports.models import BulkGenerationCheckpoint, GeneratedReport, ReportTemplate
+from dental_reports.projection import sync_report_fields
+from dental_reports.rendering import build_generated_report
+from dental_reports.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = ('Genera informes en lote a partir de un archivo CSV o JSONL con los datos del formulario. '
+            'Si se interrumpe, al volver a ejecutarlo continúa desde el último bloque guardado.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('template_id', type=int, help='Id de la plantilla de informe')
+        parser.add_argument('input_file', help='Archivo CSV (con cabecera) o JSONL con una fila por informe')
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help='Formato del archivo (por defecto, según la extensión)')
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='Informes insertados en cada transacción')
+        parser.add_argument('--user', help='Nombre de usuario que figurará como autor de los informes')
+        parser.add_argument('--processes', type=int, default=None,
+                            help='Procesos para generar los PDF (por defecto, uno por CPU)')
+        parser.add_argument('--no-pdf', action='store_true',
+                            help='No generar los PDF; quedan en cola para run_pdf_worker')
+        parser.add_argument('--restart', action='store_true',
+                            help='Ignorar el progreso guardado y empezar desde la primera fila')
+
+    def handle(self, *args, **options):
+        try:
+            template = ReportTemplate.objects.select_related('specialty').get(pk=options['template_id'])
+        except ReportTemplate.DoesNotExist:
+            raise CommandError(f"No existe la plantilla {options['template_id']}")
+
+        user = None
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f"No existe el usuario {options['user']}")
+
+        path = os.path.abspath(options['input_file'])
+        if not os.path.isfile(path):
+            raise CommandError(f"No se encuentra el archivo {path}")
+        file_format = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.json')) else 'csv')
+
+        checkpoint = self.get_checkpoint(template, path, restart=options['restart'])
+        if checkpoint.finished:
+            self.stdout.write(self.style.WARNING(
+                'Este archivo ya se procesó por completo. Usa --restart para generarlo de nuevo.'))
+            return
+
+        total = self.count_rows(path, file_format)
+        if checkpoint.rows_done:
+            self.stdout.write(f'Reanudando desde la fila {checkpoint.rows_done + 1} de {total}')
+
+        search_backend = get_search_backend()
+        pool = None if options['no_pdf'] else create_render_pool(options['processes'])
+        started = time.perf_counter()
+        rows_this_run = 0
+        pdfs_ready = pdfs_failed = 0
+
+        try:
+            with open(path, newline='', encoding='utf-8') as f:
+                rows = self.iter_rows(f, file_format)
+                rows = itertools.islice(rows, checkpoint.rows_done, None)
+
+                while True:
+                    chunk = list(itertools.islice(rows, options['chunk_size']))
+                    if not chunk:
+                        break
+
+                    first_row = checkpoint.rows_done + 1
+                    reports, invalid = self.build_reports(template, user, chunk, first_row)
+
+                    # Los informes y el progreso se guardan en la misma transacción,
+                    # así un fallo nunca duplica ni pierde filas al reanudar
+                    with transaction.atomic():
+                        GeneratedReport.objects.bulk_create(reports)
+                        # bulk_create no emite post_save: indexar, proyectar y contar explícitamente
+                        search_backend.index_reports([report for report in reports if report.pk])
+                        sync_report_fields(reports)
+                        record_created(reports)
+                        checkpoint.rows_done += len(chunk)
+                        checkpoint.created_count += len(reports)
+                        checkpoint.invalid_count += invalid
+                        checkpoint.save()
+
+                    if pool is not None:
+                        claimed = claim_reports([report.pk for report in reports if report.pk])
+                        ready, failed = render_reports(pool, claimed)
+                        pdfs_ready += ready
+                        pdfs_failed += failed
+
+                    rows_this_run += len(chunk)
+                    elapsed = time.perf_counter() - started
+                    self.stdout.write(
+                        f'Filas {checkpoint.rows_done}/{total} '
+                        f'({checkpoint.rows_done * 100 // max(total, 1)}%) - '
+                        f'{checkpoint.created_count} informes, {checkpoint.invalid_count} no válidas - '
+                        f'{rows_this_run / elapsed:.1f} filas/s'
+                    )
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+        checkpoint.finished = True
+        checkpoint.save(update_fields=['finished', 'updated_at'])
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Terminado: {checkpoint.created_count} informes creados, '
+            f'{checkpoint.invalid_count} filas no válidas.'
+        ))
+        self.stdout.write(
+            f'{rows_this_run} filas en {elapsed:.2f} s ({rows_this_run / elapsed if elapsed else 0:.1f} filas/s)'
+        )
+        if pool is not None:
+            self.stdout.write(f'PDFs: {pdfs_ready} generados, {pdfs_failed} con error')
+
+    def get_checkpoint(self, template, path, restart=False):
+        key = hashlib.sha256(f'{template.pk}:{path}'.encode('utf-8')).hexdigest()
+        checkpoint, created = BulkGenerationCheckpoint.objects.get_or_create(
+            key=key, defaults={'template': template, 'source': path}
+        )
+        if restart and not created:
+            checkpoint.rows_done = checkpoint.created_count = checkpoint.invalid_count = 0
+            checkpoint.finished = False
+            checkpoint.save()
+        return checkpoint
+
+    def iter_rows(self, f, file_format):
+        if file_format == 'csv':
+            yield from csv.DictReader(f)
+            return
+
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                raise CommandError(f'Línea {line_number} con JSON inválido: {e}')
+
+    def count_rows(self, path, file_format):
+        with open(path, newline='', encoding='utf-8') as f:
+            if file_format == 'csv':
+                return sum(1 for _ in csv.DictReader(f))
+            return sum(1 for line in f if line.strip())
+
+    def build_reports(self, template, user, rows, first_row):
+        """Valida las filas con DynamicReportForm y construye los informes (sin guardar)"""
+        reports = []
+        invalid = 0
+        now = timezone.now()
+
+        for row_number, row in enumerate(rows, start=first_row):
+            form = DynamicReportForm(row, template=template)
+            if not form.is_valid():
+                invalid += 1
+                errors = '; '.join(f"{field}: {' '.join(messages)}" for field, messages in form.errors.items())
+                self.stderr.write(f'Fila {row_number} no válida: {errors}')
+                continue
+
+            report = build_generated_report(template, form.cleaned_data, created_by=user)
+            report.pdf_status_changed_at = now
+            reports.append(report)
+
+        return reports, invalid
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from dental_reports.projection import rebuild_report_fields
+
+
+class Command(BaseCommand):
+    help = 'Regenera los valores de campo consultables (ReportFieldValue) a partir del form_data de los informes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Informes procesados en cada lote')
+        parser.add_argument('--template', type=int,
+                            help='Regenerar sólo los informes de esta plantilla (p. ej. tras cambiar su esquema)')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        total = rebuild_report_fields(batch_size=options['batch_size'], template_id=options['template'])
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(self.style.SUCCESS(f'{total} informes proyectados en {elapsed:.2f} s'))
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from dental_reports.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye el índice de búsqueda de texto completo de los informes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Informes indexados en cada lote')
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        self.stdout.write(f'Reconstruyendo el índice con {backend.__class__.__name__}...')
+
+        started = time.perf_counter()
+        total = backend.rebuild(batch_size=options['batch_size'])
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(self.style.SUCCESS(f'{total} informes indexados en {elapsed:.2f} s'))
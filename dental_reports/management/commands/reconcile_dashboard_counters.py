@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from dental_reports.dashboard import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = ('Recalcula los contadores del panel de inicio desde las tablas. '
+            'Conviene programarlo periódicamente (p. ej. con cron) para corregir desviaciones.')
+
+    def handle(self, *args, **options):
+        corrected = reconcile_counters()
+        if not corrected:
+            self.stdout.write(self.style.SUCCESS('Los contadores ya estaban al día'))
+            return
+
+        for name, value in sorted(corrected.items()):
+            self.stdout.write(f'{name} -> {value}')
+        self.stdout.write(self.style.SUCCESS(f'{len(corrected)} contadores corregidos'))
@@ -0,0 +1,77 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from dental_reports.benchmarks import BENCHMARKS, compare_results, run_benchmarks
+
+# Datos adicionales de algunos benchmarks: (clave, etiqueta)
+EXTRA_COLUMNS = [
+    ('queries', 'consultas'),
+    ('errors', 'errores'),
+    ('writes_per_second', 'escrituras/s'),
+    ('read_errors', 'errores de lectura'),
+]
+
+
+class Command(BaseCommand):
+    help = 'Ejecuta los benchmarks de generación de informes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', action='append', choices=sorted(BENCHMARKS),
+                            help='Ejecutar sólo los benchmarks indicados (se puede repetir)')
+        parser.add_argument('--repeat', type=int, default=20,
+                            help='Número de repeticiones de cada medición')
+        parser.add_argument('--rows', type=int, action='append',
+                            help='Filas de informes para report_list (se puede repetir; '
+                                 'por defecto 10000 y 100000)')
+        parser.add_argument('--json', metavar='RUTA',
+                            help="Guardar los resultados en JSON ('-' para la salida estándar)")
+        parser.add_argument('--baseline', metavar='RUTA',
+                            help='JSON de una ejecución anterior con el que comparar')
+        parser.add_argument('--metric', default='median_ms',
+                            choices=['mean_ms', 'median_ms', 'p90_ms', 'p95_ms', 'p99_ms'],
+                            help='Medida con la que se comparan los resultados')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Empeoramiento admitido respecto a --baseline (0.2 = 20%%)')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as f:
+                baseline = json.load(f)
+
+        to_stdout = options['json'] == '-'
+        report = run_benchmarks(options['only'], repeat=options['repeat'], sizes=options['rows'])
+
+        if not to_stdout:
+            for name, results in report['results'].items():
+                self.stdout.write(self.style.MIGRATE_HEADING(f'Benchmark: {name}'))
+                for case, summary in results.items():
+                    extras = ''.join(f" | {summary[key]} {label}" for key, label in EXTRA_COLUMNS
+                                     if key in summary)
+                    if not summary['n']:
+                        self.stdout.write(f"  {case:<40} sin muestras{extras}")
+                        continue
+                    self.stdout.write(
+                        f"  {case:<40} mediana {summary['median_ms']:9.3f} ms | "
+                        f"p95 {summary['p95_ms']:9.3f} ms | mín {summary['min_ms']:9.3f} ms "
+                        f"({summary['n']} muestras){extras}"
+                    )
+
+        if options['json']:
+            output = json.dumps(report, indent=2, ensure_ascii=False)
+            if to_stdout:
+                self.stdout.write(output)
+            else:
+                with open(options['json'], 'w', encoding='utf-8') as f:
+                    f.write(output + '\n')
+                self.stdout.write(self.style.SUCCESS(f"Resultados guardados en {options['json']}"))
+
+        if baseline is not None:
+            regressions = compare_results(baseline, report, options['metric'], options['tolerance'])
+            if regressions:
+                lines = [f"  {name}.{case}: {before:.3f} ms -> {after:.3f} ms"
+                         for name, case, before, after in regressions]
+                raise CommandError('Regresiones respecto a la ejecución anterior:\n' + '\n'.join(lines))
+            if not to_stdout:
+                self.stdout.write(self.style.SUCCESS('Sin regresiones respecto a la ejecución anterior'))
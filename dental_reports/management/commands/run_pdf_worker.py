@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from dental_reports.jobs import run_worker
+
+
+class Command(BaseCommand):
+    help = 'Procesa la cola de generación de PDFs con un pool de procesos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=None,
+                            help='Número de procesos de renderizado (por defecto, uno por CPU)')
+        parser.add_argument('--batch-size', type=int, default=20,
+                            help='Informes reclamados en cada lote')
+        parser.add_argument('--poll-interval', type=float, default=2.0,
+                            help='Segundos de espera cuando la cola está vacía')
+        parser.add_argument('--once', action='store_true',
+                            help='Vaciar la cola y terminar en lugar de quedarse escuchando')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Iniciando el trabajador de PDFs...')
+        try:
+            run_worker(
+                processes=options['processes'],
+                batch_size=options['batch_size'],
+                poll_interval=options['poll_interval'],
+                once=options['once'],
+            )
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('Trabajador detenido'))
+            return
+        self.stdout.write(self.style.SUCCESS('Cola de PDFs vacía'))
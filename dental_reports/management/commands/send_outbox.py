@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from dental_reports.mail import run_outbox_worker
+
+
+class Command(BaseCommand):
+    help = 'Envía los correos de la bandeja de salida por lotes, con una conexión SMTP por lote'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Correos enviados con cada conexión')
+        parser.add_argument('--poll-interval', type=float, default=5.0,
+                            help='Segundos de espera cuando no hay correos pendientes')
+        parser.add_argument('--once', action='store_true',
+                            help='Vaciar la bandeja y terminar en lugar de quedarse escuchando')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Iniciando el trabajador de correo...')
+        try:
+            run_outbox_worker(
+                batch_size=options['batch_size'],
+                poll_interval=options['poll_interval'],
+                once=options['once'],
+            )
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('Trabajador detenido'))
+            return
+        self.stdout.write(self.style.SUCCESS('Bandeja de salida vacía'))
@@ -0,0 +1,27 @@
+from datetime import timedelta
+import time
+
+from django.core.management.base import BaseCommand
+
+from dental_reports.pdf_cache import sweep_orphaned_pdfs
+
+
+class Command(BaseCommand):
+    help = ('Borra los PDF de la caché que ya no usa ningún informe. '
+            'Conviene programarlo periódicamente (p. ej. con cron).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-age', type=int, default=60,
+                            help='Minutos de antigüedad mínima de los archivos que se borran')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Archivos comprobados en cada consulta')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Sólo contar los PDF huérfanos, sin borrarlos')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        orphaned = sweep_orphaned_pdfs(min_age=timedelta(minutes=options['min_age']),
+                                       batch_size=options['batch_size'], dry_run=options['dry_run'])
+        action = 'encontrados' if options['dry_run'] else 'borrados'
+        self.stdout.write(self.style.SUCCESS(
+            f'{orphaned} PDF huérfanos {action} en {time.perf_counter() - started:.2f} s'))
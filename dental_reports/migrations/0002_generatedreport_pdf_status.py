@@ -0,0 +1,33 @@
+from django.db import migrations, models
+
+
+def mark_existing_pdfs_ready(apps, schema_editor):
+    """Los informes que ya tienen PDF no deben volver a la cola"""
+    GeneratedReport = apps.get_model('dental_reports', 'GeneratedReport')
+    GeneratedReport.objects.exclude(pdf_file='').exclude(pdf_file__isnull=True).update(pdf_status='ready')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dental_reports', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generatedreport',
+            name='pdf_status',
+            field=models.CharField(choices=[('pending', 'Pendiente'), ('rendering', 'Generando'), ('ready', 'Listo'), ('failed', 'Error')], db_index=True, default='pending', max_length=10, verbose_name='Estado del PDF'),
+        ),
+        migrations.AddField(
+            model_name='generatedreport',
+            name='pdf_status_changed_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Último cambio de estado del PDF'),
+        ),
+        migrations.AddField(
+            model_name='generatedreport',
+            name='pdf_error',
+            field=models.TextField(blank=True, verbose_name='Error al generar el PDF'),
+        ),
+        migrations.RunPython(mark_existing_pdfs_ready, migrations.RunPython.noop),
+    ]
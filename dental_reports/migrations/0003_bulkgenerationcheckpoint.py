@@ -0,0 +1,31 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dental_reports', '0002_generatedreport_pdf_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BulkGenerationCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True, verbose_name='Clave')),
+                ('source', models.CharField(max_length=500, verbose_name='Archivo de origen')),
+                ('rows_done', models.PositiveIntegerField(default=0, verbose_name='Filas procesadas')),
+                ('created_count', models.PositiveIntegerField(default=0, verbose_name='Informes creados')),
+                ('invalid_count', models.PositiveIntegerField(default=0, verbose_name='Filas no válidas')),
+                ('finished', models.BooleanField(default=False, verbose_name='Terminada')),
+                ('started_at', models.DateTimeField(auto_now_add=True, verbose_name='Inicio')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Última actualización')),
+                ('template', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bulk_checkpoints', to='dental_reports.reporttemplate', verbose_name='Plantilla')),
+            ],
+            options={
+                'verbose_name': 'Generación masiva',
+                'verbose_name_plural': 'Generaciones masivas',
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dental_reports', '0003_bulkgenerationcheckpoint'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='generatedreport',
+            index=models.Index(fields=['-created_at', '-id'], name='report_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='generatedreport',
+            index=models.Index(fields=['created_by', '-created_at', '-id'], name='report_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='generatedreport',
+            index=models.Index(fields=['template', '-created_at', '-id'], name='report_template_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='generatedreport',
+            index=models.Index(django.db.models.functions.text.Lower('patient_name'), name='report_patient_lower_idx'),
+        ),
+    ]
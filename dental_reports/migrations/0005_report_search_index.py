@@ -0,0 +1,64 @@
+from django.db import DatabaseError, migrations
+from django.utils.html import strip_tags
+
+# Copia de la definición de SQLiteFTS5Backend en el momento de esta migración
+# (las migraciones no deben depender del código actual de la aplicación)
+FTS_TABLE = 'dental_reports_report_fts'
+FTS_COLUMNS = ('title', 'patient_name', 'doctor_name', 'content', 'form_data')
+
+
+def fts5_available(schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return False
+    try:
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute('CREATE VIRTUAL TABLE IF NOT EXISTS temp.fts5_probe USING fts5(x)')
+            cursor.execute('DROP TABLE temp.fts5_probe')
+    except DatabaseError:
+        return False
+    return True
+
+
+def create_search_index(apps, schema_editor):
+    """Crea la tabla FTS5 (si la base de datos es SQLite con FTS5) e indexa los informes existentes"""
+    if not fts5_available(schema_editor):
+        return
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+        f"{', '.join(FTS_COLUMNS)}, tokenize='unicode61 remove_diacritics 2')"
+    )
+
+    GeneratedReport = apps.get_model('dental_reports', 'GeneratedReport')
+    reports = (GeneratedReport.objects.order_by('id')
+               .values_list('id', 'title', 'patient_name', 'doctor_name', 'report_content', 'form_data'))
+    insert = (f"INSERT INTO {FTS_TABLE} (rowid, {', '.join(FTS_COLUMNS)}) "
+              f"VALUES (%s, {', '.join(['%s'] * len(FTS_COLUMNS))})")
+    rows = []
+    with schema_editor.connection.cursor() as cursor:
+        for pk, title, patient_name, doctor_name, content, form_data in reports.iterator(chunk_size=500):
+            form_data = form_data if isinstance(form_data, dict) else {}
+            rows.append([
+                pk, title or '', patient_name or '', doctor_name or '', strip_tags(content or ''),
+                ' '.join(str(value) for value in form_data.values() if value not in (None, '')),
+            ])
+            if len(rows) >= 500:
+                cursor.executemany(insert, rows)
+                rows = []
+        if rows:
+            cursor.executemany(insert, rows)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dental_reports', '0004_generatedreport_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,34 @@
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dental_reports', '0007_outboundemail'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, verbose_name='Nombre')),
+                ('report_ids', models.JSONField(default=list, verbose_name='Informes')),
+                ('file', models.FileField(blank=True, upload_to='report_archives/', verbose_name='Archivo ZIP')),
+                ('status', models.CharField(choices=[('pending', 'Pendiente'), ('building', 'Generando'), ('ready', 'Listo'), ('failed', 'Error')], db_index=True, default='pending', max_length=10, verbose_name='Estado')),
+                ('status_changed_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Cambio de estado')),
+                ('error', models.TextField(blank=True, verbose_name='Error')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de creación')),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='report_archives', to=settings.AUTH_USER_MODEL, verbose_name='Creado por')),
+            ],
+            options={
+                'verbose_name': 'Descarga de informes',
+                'verbose_name_plural': 'Descargas de informes',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
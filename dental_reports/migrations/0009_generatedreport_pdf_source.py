@@ -0,0 +1,23 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dental_reports', '0008_reportarchive'),
+    ]
+
+    operations = [
+        # Los PDF ya guardados quedan sin huella: `manage.py backfill_report_pdfs`
+        # los comprueba y regenera sólo los que hayan cambiado
+        migrations.AddField(
+            model_name='generatedreport',
+            name='pdf_source_hash',
+            field=models.CharField(blank=True, max_length=64, verbose_name='Huella del contenido del PDF'),
+        ),
+        migrations.AddField(
+            model_name='generatedreport',
+            name='pdf_renderer_version',
+            field=models.CharField(blank=True, max_length=100, verbose_name='Versión del renderizador del PDF'),
+        ),
+    ]
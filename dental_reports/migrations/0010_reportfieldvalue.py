@@ -0,0 +1,36 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dental_reports', '0009_generatedreport_pdf_source'),
+    ]
+
+    operations = [
+        # Los informes existentes se proyectan con `manage.py rebuild_report_fields`
+        migrations.CreateModel(
+            name='ReportFieldValue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='Campo')),
+                ('field_type', models.CharField(max_length=20, verbose_name='Tipo')),
+                ('position', models.PositiveIntegerField(default=0, verbose_name='Posición')),
+                ('value_text', models.CharField(blank=True, max_length=255, verbose_name='Texto')),
+                ('value_number', models.FloatField(blank=True, null=True, verbose_name='Número')),
+                ('value_date', models.DateField(blank=True, null=True, verbose_name='Fecha')),
+                ('value_bool', models.BooleanField(blank=True, null=True, verbose_name='Sí/No')),
+                ('report', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='field_values', to='dental_reports.generatedreport', verbose_name='Informe')),
+            ],
+            options={
+                'verbose_name': 'Valor de campo de informe',
+                'verbose_name_plural': 'Valores de campos de informes',
+                'indexes': [
+                    models.Index(fields=['name', 'value_text', 'report'], name='report_field_text_idx'),
+                    models.Index(fields=['name', 'value_number', 'report'], name='report_field_number_idx'),
+                    models.Index(fields=['name', 'value_date', 'report'], name='report_field_date_idx'),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,56 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """Modelos del editor visual, que hasta ahora no tenían migración"""
+
+    dependencies = [
+        ('dental_reports', '0010_reportfieldvalue'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TipoBloque',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=50)),
+                ('icono', models.CharField(max_length=50)),
+                ('color', models.CharField(max_length=20)),
+                ('descripcion', models.TextField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='BloquePreconfigurado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=100)),
+                ('plantilla_html', models.TextField()),
+                ('configuracion_defecto', models.JSONField(default=dict)),
+                ('tipo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='dental_reports.tipobloque')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Plantilla',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=100)),
+                ('descripcion', models.TextField(blank=True, null=True)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_modificacion', models.DateTimeField(auto_now=True)),
+                ('contenido', models.JSONField(default=dict)),
+                ('creador', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Variable',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=50)),
+                ('etiqueta', models.CharField(max_length=100)),
+                ('descripcion', models.TextField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,38 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dental_reports', '0012_generatedreport_plantilla'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='plantilla',
+            name='revision',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='plantilla',
+            name='revision_snapshot',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='PlantillaCambio',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('revision', models.PositiveIntegerField()),
+                ('operaciones', models.JSONField()),
+                ('fecha', models.DateTimeField(auto_now_add=True)),
+                ('autor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('plantilla', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cambios', to='dental_reports.plantilla')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('plantilla', 'revision'), name='plantilla_cambio_revision_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,51 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dental_reports', '0013_plantilla_revisions'),
+    ]
+
+    operations = [
+        # Las versiones anteriores a esta migración no existen: la primera
+        # modificación de cada objeto guarda antes una instantánea de su estado
+        migrations.AddField(
+            model_name='reporttemplate',
+            name='version',
+            field=models.PositiveIntegerField(default=1, verbose_name='Versión'),
+        ),
+        migrations.CreateModel(
+            name='TemplateRevision',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField(verbose_name='Versión')),
+                ('is_snapshot', models.BooleanField(default=False, verbose_name='Instantánea')),
+                ('data', models.BinaryField(verbose_name='Datos comprimidos')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Fecha')),
+                ('template', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='revisions', to='dental_reports.reporttemplate', verbose_name='Plantilla')),
+            ],
+            options={
+                'verbose_name': 'Versión de plantilla',
+                'verbose_name_plural': 'Versiones de plantillas',
+                'constraints': [models.UniqueConstraint(fields=('template', 'version'), name='template_revision_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ReportRevision',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField(verbose_name='Versión')),
+                ('is_snapshot', models.BooleanField(default=False, verbose_name='Instantánea')),
+                ('data', models.BinaryField(verbose_name='Datos comprimidos')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Fecha')),
+                ('report', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='revisions', to='dental_reports.generatedreport', verbose_name='Informe')),
+            ],
+            options={
+                'verbose_name': 'Versión de informe',
+                'verbose_name_plural': 'Versiones de informes',
+                'constraints': [models.UniqueConstraint(fields=('report', 'version'), name='report_revision_unique')],
+            },
+        ),
+    ]
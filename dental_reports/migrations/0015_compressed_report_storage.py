@@ -0,0 +1,78 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+import dental_reports.compression
+
+
+def compress_columns(apps, schema_editor):
+    """
+    Pasa report_content y form_data a columnas binarias conservando los datos
+
+    Los valores existentes no se comprimen aquí (se siguen leyendo como texto):
+    `manage.py compress_reports` los reescribe por lotes.
+    """
+    GeneratedReport = apps.get_model('dental_reports', 'GeneratedReport')
+    table = schema_editor.quote_name(GeneratedReport._meta.db_table)
+
+    if schema_editor.connection.vendor == 'postgresql':
+        # La conversión por defecto (::bytea) interpreta las barras invertidas y no existe para jsonb
+        for column, source in (('report_content', 'report_content'), ('form_data', 'form_data::text')):
+            schema_editor.execute(
+                f"ALTER TABLE {table} ALTER COLUMN {schema_editor.quote_name(column)} "
+                f"TYPE bytea USING convert_to({source}, 'UTF8')"
+            )
+        return
+
+    new_fields = {
+        'report_content': dental_reports.compression.CompressedTextField(
+            dictionary_from='template', verbose_name='Contenido del informe'),
+        'form_data': dental_reports.compression.CompressedJSONField(verbose_name='Datos del formulario'),
+    }
+    for name, new_field in new_fields.items():
+        old_field = GeneratedReport._meta.get_field(name)
+        new_field.set_attributes_from_name(name)
+        new_field.model = GeneratedReport
+        schema_editor.alter_field(GeneratedReport, old_field, new_field)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dental_reports', '0014_revisions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompressionDictionary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('codec', models.CharField(choices=[('z', 'zlib'), ('s', 'zstd')], max_length=1, verbose_name='Códec')),
+                ('data', models.BinaryField(verbose_name='Datos')),
+                ('sample_count', models.PositiveIntegerField(default=0, verbose_name='Informes de ejemplo')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de creación')),
+                ('template', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='compression_dictionaries', to='dental_reports.reporttemplate', verbose_name='Plantilla')),
+            ],
+            options={
+                'verbose_name': 'Diccionario de compresión',
+                'verbose_name_plural': 'Diccionarios de compresión',
+                'indexes': [models.Index(fields=['template', 'codec', '-id'], name='compression_dict_active_idx')],
+            },
+        ),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='generatedreport',
+                    name='report_content',
+                    field=dental_reports.compression.CompressedTextField(dictionary_from='template', verbose_name='Contenido del informe'),
+                ),
+                migrations.AlterField(
+                    model_name='generatedreport',
+                    name='form_data',
+                    field=dental_reports.compression.CompressedJSONField(verbose_name='Datos del formulario'),
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(compress_columns, elidable=False),
+            ],
+        ),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dental_reports', '0015_compressed_report_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generatedreport',
+            name='template_version',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Versión de la plantilla'),
+        ),
+        migrations.AddField(
+            model_name='generatedreport',
+            name='content_hash',
+            field=models.CharField(blank=True, max_length=64, verbose_name='Huella del contenido'),
+        ),
+    ]
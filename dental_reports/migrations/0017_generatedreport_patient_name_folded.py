@@ -0,0 +1,42 @@
+from django.db import migrations, models
+
+import dental_reports.normalization
+
+
+def fill_patient_name_folded(apps, schema_editor):
+    GeneratedReport = apps.get_model('dental_reports', 'GeneratedReport')
+    reports = GeneratedReport.objects.only('id', 'patient_name').order_by('id')
+    batch = []
+    for report in reports.iterator(chunk_size=1000):
+        report.patient_name_folded = dental_reports.normalization.fold_text(report.patient_name)[:255]
+        batch.append(report)
+        if len(batch) >= 1000:
+            GeneratedReport.objects.bulk_update(batch, ['patient_name_folded'])
+            batch = []
+    if batch:
+        GeneratedReport.objects.bulk_update(batch, ['patient_name_folded'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dental_reports', '0016_generatedreport_render_on_read'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generatedreport',
+            name='patient_name_folded',
+            field=dental_reports.normalization.FoldedCopyField(default='', max_length=255, source='patient_name', verbose_name='Nombre del paciente normalizado'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_patient_name_folded, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='generatedreport',
+            name='report_patient_lower_idx',
+        ),
+        migrations.AddIndex(
+            model_name='generatedreport',
+            index=models.Index(fields=['patient_name_folded'], name='report_patient_folded_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+from django.db import migrations, models
+from django.utils.html import strip_tags
+
+import dental_reports.normalization
+
+
+def fill_search_text(apps, schema_editor):
+    """
+    Rellena search_text con los mismos campos que indexa search.report_search_document
+
+    Los informes renderizados bajo demanda no tienen report_content: de ellos
+    se indexan el resto de campos y form_data, y `manage.py rebuild_search_index`
+    añade el contenido renderizado.
+    """
+    GeneratedReport = apps.get_model('dental_reports', 'GeneratedReport')
+    reports = (GeneratedReport.objects.order_by('id')
+               .only('id', 'template_id', 'title', 'patient_name', 'doctor_name', 'report_content', 'form_data'))
+    batch = []
+    for report in reports.iterator(chunk_size=500):
+        form_data = report.form_data if isinstance(report.form_data, dict) else {}
+        report.search_text = dental_reports.normalization.fold_text('\n'.join([
+            report.title or '', report.patient_name or '', report.doctor_name or '',
+            strip_tags(report.report_content or ''),
+            ' '.join(str(value) for value in form_data.values() if value not in (None, '')),
+        ]))
+        batch.append(report)
+        if len(batch) >= 500:
+            GeneratedReport.objects.bulk_update(batch, ['search_text'])
+            batch = []
+    if batch:
+        GeneratedReport.objects.bulk_update(batch, ['search_text'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dental_reports', '0017_generatedreport_patient_name_folded'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generatedreport',
+            name='search_text',
+            field=models.TextField(blank=True, editable=False, verbose_name='Texto de búsqueda'),
+        ),
+        migrations.RunPython(fill_search_text, migrations.RunPython.noop),
+    ]
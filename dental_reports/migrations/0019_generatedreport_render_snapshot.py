@@ -0,0 +1,37 @@
+from django.db import migrations, models
+
+
+def fill_render_snapshot(apps, schema_editor):
+    """
+    Informes ya renderizados bajo demanda: la especialidad actual de su plantilla
+    y la fecha de creación como hora de {% now %}
+
+    Los que no coincidan así con su huella los señala `manage.py convert_render_on_read`.
+    """
+    ReportTemplate = apps.get_model('dental_reports', 'ReportTemplate')
+    GeneratedReport = apps.get_model('dental_reports', 'GeneratedReport')
+    converted = GeneratedReport.objects.filter(template_version__isnull=False)
+    converted.update(rendered_at=models.F('created_at'))
+    for template in ReportTemplate.objects.filter(specialty__isnull=False).select_related('specialty'):
+        converted.filter(template=template).update(specialty_name=template.specialty.name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dental_reports', '0018_generatedreport_search_text'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generatedreport',
+            name='specialty_name',
+            field=models.CharField(blank=True, max_length=100, verbose_name='Especialidad al generarlo'),
+        ),
+        migrations.AddField(
+            model_name='generatedreport',
+            name='rendered_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Fecha del renderizado'),
+        ),
+        migrations.RunPython(fill_render_snapshot, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+from django.db import migrations
+
+import dental_reports.normalization
+
+
+def fold_search_text(apps, schema_editor):
+    """
+    Quita los diacríticos de search_text, como hace el índice FTS5
+
+    search_text ya es texto normalizado: basta con volver a normalizarlo, sin
+    renderizar los informes otra vez.
+    """
+    GeneratedReport = apps.get_model('dental_reports', 'GeneratedReport')
+    batch = []
+    for report in GeneratedReport.objects.order_by('id').only('id', 'search_text').iterator(chunk_size=500):
+        folded = dental_reports.normalization.fold_search_text(report.search_text)
+        if folded == report.search_text:
+            continue
+        report.search_text = folded
+        batch.append(report)
+        if len(batch) >= 500:
+            GeneratedReport.objects.bulk_update(batch, ['search_text'])
+            batch = []
+    if batch:
+        GeneratedReport.objects.bulk_update(batch, ['search_text'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dental_reports', '0019_generatedreport_render_snapshot'),
+    ]
+
+    operations = [
+        migrations.RunPython(fold_search_text, migrations.RunPython.noop),
+    ]
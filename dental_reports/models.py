@@ -1,7 +1,13 @@
 # dental_reports/models.py
 
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+
+from .compression import CompressedJSONField, CompressedTextField
+from .fields_schema import validate_fields_schema
+from .normalization import FoldedCopyField
 
 
 class TemplateCategory(models.Model):
@@ -55,10 +61,19 @@ class ReportTemplate(models.Model):
     is_active = models.BooleanField(default=True, verbose_name="Activo")
     is_public = models.BooleanField(default=False, verbose_name="Público",
                                     help_text="Si es accesible para todos los usuarios")
+    # Se incrementa cada vez que cambia el contenido (ver TemplateRevision)
+    version = models.PositiveIntegerField(default=1, verbose_name="Versión")
 
     def __str__(self):
         return self.name
 
+    def clean(self):
+        super().clean()
+        try:
+            validate_fields_schema(self.fields_schema)
+        except ValidationError as e:
+            raise ValidationError({'fields_schema': e.messages})
+
     class Meta:
         verbose_name = "Plantilla de Informe"
         verbose_name_plural = "Plantillas de Informes"
@@ -66,21 +81,60 @@ class ReportTemplate(models.Model):
 
 class GeneratedReport(models.Model):
     """Informes generados a partir de plantillas"""
+    PDF_PENDING = 'pending'
+    PDF_RENDERING = 'rendering'
+    PDF_READY = 'ready'
+    PDF_FAILED = 'failed'
+    PDF_STATUS_CHOICES = [
+        (PDF_PENDING, "Pendiente"),
+        (PDF_RENDERING, "Generando"),
+        (PDF_READY, "Listo"),
+        (PDF_FAILED, "Error"),
+    ]
+
     template = models.ForeignKey(ReportTemplate, on_delete=models.SET_NULL, null=True,
                                  verbose_name="Plantilla")
+    # Informes generados desde una plantilla del editor visual (sin ReportTemplate)
+    plantilla = models.ForeignKey('Plantilla', on_delete=models.SET_NULL, null=True, blank=True,
+                                  related_name='informes', verbose_name="Plantilla visual")
 
     # Información del paciente y médico
     patient_name = models.CharField(max_length=255, verbose_name="Nombre del paciente")
+    # patient_name normalizado para el filtro del listado (ver normalization.py)
+    patient_name_folded = FoldedCopyField(max_length=255, source='patient_name',
+                                          verbose_name="Nombre del paciente normalizado")
     doctor_name = models.CharField(max_length=255, verbose_name="Nombre del doctor")
 
     # Contenido del informe
     title = models.CharField(max_length=200, verbose_name="Título")
-    report_content = models.TextField(verbose_name="Contenido del informe")
-    form_data = models.JSONField(verbose_name="Datos del formulario")
+    # Guardados comprimidos (ver compression.py); report_content con el diccionario de su plantilla
+    report_content = CompressedTextField(dictionary_from='template', verbose_name="Contenido del informe")
+    form_data = CompressedJSONField(verbose_name="Datos del formulario")
+    # Renderizado bajo demanda (ver rendering.report_html): report_content queda
+    # vacío y el HTML sale de esta versión de la plantilla y de form_data
+    template_version = models.PositiveIntegerField(null=True, blank=True,
+                                                   verbose_name="Versión de la plantilla")
+    # Lo que el HTML toma de fuera de form_data al generarlo: la especialidad de la
+    # plantilla y la hora que muestra {% now %}
+    specialty_name = models.CharField(max_length=100, blank=True, verbose_name="Especialidad al generarlo")
+    rendered_at = models.DateTimeField(null=True, blank=True, verbose_name="Fecha del renderizado")
+    content_hash = models.CharField(max_length=64, blank=True, verbose_name="Huella del contenido")
+    # Texto plano normalizado del informe, para la búsqueda sin FTS5 (ver search.SimpleSearchBackend)
+    search_text = models.TextField(blank=True, editable=False, verbose_name="Texto de búsqueda")
 
     # Archivo generado
     pdf_file = models.FileField(upload_to='reports/%Y/%m/', blank=True, null=True,
                                 verbose_name="Archivo PDF")
+    pdf_status = models.CharField(max_length=10, choices=PDF_STATUS_CHOICES, default=PDF_PENDING,
+                                  db_index=True, verbose_name="Estado del PDF")
+    pdf_status_changed_at = models.DateTimeField(null=True, blank=True,
+                                                 verbose_name="Último cambio de estado del PDF")
+    pdf_error = models.TextField(blank=True, verbose_name="Error al generar el PDF")
+    # Con qué se generó el PDF guardado: si no coinciden con los actuales, el PDF está obsoleto
+    pdf_source_hash = models.CharField(max_length=64, blank=True,
+                                       verbose_name="Huella del contenido del PDF")
+    pdf_renderer_version = models.CharField(max_length=100, blank=True,
+                                            verbose_name="Versión del renderizador del PDF")
 
     # Metadatos
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True,
@@ -95,6 +149,161 @@ class GeneratedReport(models.Model):
         verbose_name = "Informe Generado"
         verbose_name_plural = "Informes Generados"
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='report_created_idx'),
+            models.Index(fields=['created_by', '-created_at', '-id'], name='report_user_created_idx'),
+            models.Index(fields=['template', '-created_at', '-id'], name='report_template_created_idx'),
+            models.Index(fields=['patient_name_folded'], name='report_patient_folded_idx'),
+        ]
+
+
+class ReportFieldValue(models.Model):
+    """
+    Valor de un campo de form_data de un informe, con su tipo, para consultarlo con índices.
+
+    Las filas se generan a partir del fields_schema de la plantilla (ver
+    projection.py) y se regeneran cada vez que se guarda el informe. Los campos
+    con varios valores (piezas dentales, selección múltiple) tienen una fila
+    por valor; las filas repetidas, una por celda con el nombre 'campo.columna'.
+    """
+    report = models.ForeignKey(GeneratedReport, on_delete=models.CASCADE,
+                               related_name='field_values', verbose_name="Informe")
+    name = models.CharField(max_length=100, verbose_name="Campo")
+    field_type = models.CharField(max_length=20, verbose_name="Tipo")
+    position = models.PositiveIntegerField(default=0, verbose_name="Posición")
+    value_text = models.CharField(max_length=255, blank=True, verbose_name="Texto")
+    value_number = models.FloatField(null=True, blank=True, verbose_name="Número")
+    value_date = models.DateField(null=True, blank=True, verbose_name="Fecha")
+    value_bool = models.BooleanField(null=True, blank=True, verbose_name="Sí/No")
+
+    def __str__(self):
+        return f"{self.name}={self.value_text}"
+
+    class Meta:
+        verbose_name = "Valor de campo de informe"
+        verbose_name_plural = "Valores de campos de informes"
+        indexes = [
+            models.Index(fields=['name', 'value_text', 'report'], name='report_field_text_idx'),
+            models.Index(fields=['name', 'value_number', 'report'], name='report_field_number_idx'),
+            models.Index(fields=['name', 'value_date', 'report'], name='report_field_date_idx'),
+        ]
+
+
+class RevisionBase(models.Model):
+    """
+    Una versión del contenido de un objeto, comprimida con zlib.
+
+    Las instantáneas guardan el contenido completo; el resto, sólo las
+    diferencias con la versión anterior (ver revisions.py).
+    """
+    version = models.PositiveIntegerField(verbose_name="Versión")
+    is_snapshot = models.BooleanField(default=False, verbose_name="Instantánea")
+    data = models.BinaryField(verbose_name="Datos comprimidos")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Fecha")
+
+    class Meta:
+        abstract = True
+
+
+class TemplateRevision(RevisionBase):
+    template = models.ForeignKey(ReportTemplate, on_delete=models.CASCADE,
+                                 related_name='revisions', verbose_name="Plantilla")
+
+    def __str__(self):
+        return f"{self.template_id} v{self.version}"
+
+    class Meta:
+        verbose_name = "Versión de plantilla"
+        verbose_name_plural = "Versiones de plantillas"
+        constraints = [
+            models.UniqueConstraint(fields=['template', 'version'], name='template_revision_unique'),
+        ]
+
+
+class ReportRevision(RevisionBase):
+    report = models.ForeignKey(GeneratedReport, on_delete=models.CASCADE,
+                               related_name='revisions', verbose_name="Informe")
+
+    def __str__(self):
+        return f"{self.report_id} v{self.version}"
+
+    class Meta:
+        verbose_name = "Versión de informe"
+        verbose_name_plural = "Versiones de informes"
+        constraints = [
+            models.UniqueConstraint(fields=['report', 'version'], name='report_revision_unique'),
+        ]
+
+
+class CompressionDictionary(models.Model):
+    """
+    Diccionario de compresión entrenado con los informes de una plantilla.
+
+    No se modifica ni se borra: los informes comprimidos con él lo referencian
+    por id. Se usa el más reciente de cada plantilla y códec.
+    """
+    CODEC_CHOICES = [
+        ('z', "zlib"),
+        ('s', "zstd"),
+    ]
+
+    template = models.ForeignKey(ReportTemplate, on_delete=models.SET_NULL, null=True, blank=True,
+                                 related_name='compression_dictionaries', verbose_name="Plantilla")
+    codec = models.CharField(max_length=1, choices=CODEC_CHOICES, verbose_name="Códec")
+    data = models.BinaryField(verbose_name="Datos")
+    sample_count = models.PositiveIntegerField(default=0, verbose_name="Informes de ejemplo")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Fecha de creación")
+
+    def __str__(self):
+        return f"{self.get_codec_display()} #{self.pk} ({self.template_id})"
+
+    class Meta:
+        verbose_name = "Diccionario de compresión"
+        verbose_name_plural = "Diccionarios de compresión"
+        indexes = [
+            models.Index(fields=['template', 'codec', '-id'], name='compression_dict_active_idx'),
+        ]
+
+
+class BulkGenerationCheckpoint(models.Model):
+    """Progreso de una generación masiva de informes (permite reanudarla tras un fallo)"""
+    key = models.CharField(max_length=64, unique=True, verbose_name="Clave")
+    template = models.ForeignKey(ReportTemplate, on_delete=models.CASCADE,
+                                 related_name='bulk_checkpoints', verbose_name="Plantilla")
+    source = models.CharField(max_length=500, verbose_name="Archivo de origen")
+    rows_done = models.PositiveIntegerField(default=0, verbose_name="Filas procesadas")
+    created_count = models.PositiveIntegerField(default=0, verbose_name="Informes creados")
+    invalid_count = models.PositiveIntegerField(default=0, verbose_name="Filas no válidas")
+    finished = models.BooleanField(default=False, verbose_name="Terminada")
+    started_at = models.DateTimeField(auto_now_add=True, verbose_name="Inicio")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Última actualización")
+
+    def __str__(self):
+        return f"{self.source} ({self.rows_done} filas)"
+
+    class Meta:
+        verbose_name = "Generación masiva"
+        verbose_name_plural = "Generaciones masivas"
+
+
+class DashboardCounter(models.Model):
+    """
+    Total desnormalizado que se muestra en el panel de inicio.
+
+    Se actualiza con señales al crear o eliminar objetos y se puede recalcular
+    con `manage.py reconcile_dashboard_counters`. Los nombres siguen el formato
+    'grupo' para los totales y 'grupo:campo:id' para los desgloses.
+    """
+    name = models.CharField(max_length=100, unique=True, verbose_name="Nombre")
+    value = models.BigIntegerField(default=0, verbose_name="Valor")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Última actualización")
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+    class Meta:
+        verbose_name = "Contador del panel"
+        verbose_name_plural = "Contadores del panel"
 
 
 class DentalClinic(models.Model):
@@ -154,6 +363,84 @@ class DentistContact(models.Model):
         ordering = ['last_name', 'first_name']
 
 
+class OutboundEmail(models.Model):
+    """Correo pendiente de envío (bandeja de salida procesada por `manage.py send_outbox`)"""
+    STATUS_PENDING = 'pending'
+    STATUS_SENDING = 'sending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pendiente'),
+        (STATUS_SENDING, 'Enviando'),
+        (STATUS_SENT, 'Enviado'),
+        (STATUS_FAILED, 'Fallido'),
+    ]
+
+    report = models.ForeignKey(GeneratedReport, on_delete=models.CASCADE,
+                               related_name='emails', verbose_name="Informe")
+    dentist = models.ForeignKey(DentistContact, on_delete=models.SET_NULL, null=True, blank=True,
+                                related_name='emails', verbose_name="Dentista")
+    to_email = models.EmailField(verbose_name="Destinatario")
+    subject = models.CharField(max_length=255, verbose_name="Asunto")
+    body = models.TextField(verbose_name="Texto")
+    html_body = models.TextField(blank=True, verbose_name="HTML")
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING,
+                              verbose_name="Estado")
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name="Intentos")
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name="Próximo intento")
+    last_error = models.TextField(blank=True, verbose_name="Último error")
+
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True,
+                                   verbose_name="Creado por")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Fecha de creación")
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name="Fecha de envío")
+
+    def __str__(self):
+        return f"{self.subject} -> {self.to_email} ({self.get_status_display()})"
+
+    class Meta:
+        verbose_name = "Correo saliente"
+        verbose_name_plural = "Correos salientes"
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
+
+
+class ReportArchive(models.Model):
+    """Archivo ZIP con los PDF de varios informes, generado en segundo plano"""
+    STATUS_PENDING = 'pending'
+    STATUS_BUILDING = 'building'
+    STATUS_READY = 'ready'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pendiente'),
+        (STATUS_BUILDING, 'Generando'),
+        (STATUS_READY, 'Listo'),
+        (STATUS_FAILED, 'Error'),
+    ]
+
+    name = models.CharField(max_length=200, verbose_name="Nombre")
+    report_ids = models.JSONField(default=list, verbose_name="Informes")
+    file = models.FileField(upload_to='report_archives/', blank=True, verbose_name="Archivo ZIP")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING,
+                              db_index=True, verbose_name="Estado")
+    status_changed_at = models.DateTimeField(default=timezone.now, verbose_name="Cambio de estado")
+    error = models.TextField(blank=True, verbose_name="Error")
+    created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='report_archives',
+                                   verbose_name="Creado por")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Fecha de creación")
+
+    def __str__(self):
+        return f"{self.name} ({self.get_status_display()})"
+
+    class Meta:
+        verbose_name = "Descarga de informes"
+        verbose_name_plural = "Descargas de informes"
+        ordering = ['-created_at']
+
+
 # Si no tienes estos modelos ya, añádelos
 
 class TipoBloque(models.Model):
@@ -185,11 +472,31 @@ class Plantilla(models.Model):
     fecha_modificacion = models.DateTimeField(auto_now=True)
     # Este campo almacenará la configuración de los bloques en formato JSON
     contenido = models.JSONField(default=dict)
+    # Revisión actual y revisión incluida en `contenido`: las posteriores están en PlantillaCambio
+    revision = models.PositiveIntegerField(default=0)
+    revision_snapshot = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return self.nombre
 
 
+class PlantillaCambio(models.Model):
+    """Parche JSON (RFC 6902) guardado por el autoguardado del editor visual"""
+    plantilla = models.ForeignKey(Plantilla, on_delete=models.CASCADE, related_name='cambios')
+    revision = models.PositiveIntegerField()
+    operaciones = models.JSONField()
+    autor = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    fecha = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.plantilla_id} r{self.revision}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['plantilla', 'revision'], name='plantilla_cambio_revision_unique'),
+        ]
+
+
 class Variable(models.Model):
     nombre = models.CharField(max_length=50)
     etiqueta = models.CharField(max_length=100)
@@ -0,0 +1,60 @@
+# dental_reports/normalization.py
+"""
+Texto normalizado para búsquedas sin distinguir mayúsculas.
+
+LOWER() de SQLite sólo convierte letras ASCII ("Óscar" sigue siendo "Óscar"),
+así que comparar LOWER(columna) con un texto pasado a minúsculas en Python
+falla con los nombres acentuados. En su lugar se guarda una copia del texto
+ya normalizada en Python (fold_text) y las búsquedas normalizan igual el
+texto buscado.
+"""
+import unicodedata
+
+from django.db import models
+
+
+def fold_text(text):
+    """Forma canónica de un texto para compararlo sin distinguir mayúsculas"""
+    return unicodedata.normalize('NFC', text or '').casefold()
+
+
+def fold_search_text(text):
+    """
+    fold_text sin tildes ni otros diacríticos ("Núñez" -> "nunez")
+
+    Es la forma del texto de búsqueda: el índice FTS5 se crea con
+    remove_diacritics y la búsqueda simple tiene que encontrar lo mismo.
+    """
+    decomposed = unicodedata.normalize('NFD', fold_text(text))
+    return unicodedata.normalize('NFC', ''.join(char for char in decomposed if not unicodedata.combining(char)))
+
+
+class FoldedCopyField(models.CharField):
+    """
+    Copia normalizada (fold_text) de otro campo del modelo
+
+    Se calcula al guardar, también en bulk_create; no es editable.
+
+    Args:
+        source: Nombre del campo del que se copia
+    """
+
+    def __init__(self, *args, source=None, **kwargs):
+        self.source = source
+        kwargs.setdefault('editable', False)
+        kwargs.setdefault('blank', True)
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs['source'] = self.source
+        if kwargs.get('editable') is False:
+            del kwargs['editable']
+        if kwargs.get('blank') is True:
+            del kwargs['blank']
+        return name, path, args, kwargs
+
+    def pre_save(self, model_instance, add):
+        value = fold_text(getattr(model_instance, self.source))[:self.max_length]
+        setattr(model_instance, self.attname, value)
+        return value
@@ -0,0 +1,278 @@
+# dental_reports/patches.py
+"""
+Guardado incremental de las plantillas del editor visual.
+
+El autoguardado envía sólo lo que ha cambiado, como parche JSON (RFC 6902)
+sobre Plantilla.contenido, junto con la revisión sobre la que se hizo:
+
+    {"revision": 12, "operaciones": [
+        {"op": "replace", "path": "/blocks/3/content", "value": "<p>...</p>"},
+        {"op": "add", "path": "/blocks/-", "value": {...}}
+    ]}
+
+Cada parche es una fila PlantillaCambio y un UPDATE condicional de la
+revisión (concurrencia optimista: si otro guardado llegó antes, se responde
+con conflicto y la revisión actual); el guardado completo hace la misma
+comprobación. `contenido` es la instantánea de revision_snapshot; cada
+DENTAL_REPORTS_PLANTILLA_COMPACT_EVERY parches se aplican sobre ella y se
+borran, de modo que leer una plantilla nunca supone aplicar más que unos
+pocos parches.
+"""
+import copy
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import cache
+from .models import Plantilla, PlantillaCambio
+
+# Parches pendientes tras los que se compacta la plantilla
+DEFAULT_PLANTILLA_COMPACT_EVERY = 50
+
+PATCH_OPERATIONS = ('add', 'remove', 'replace', 'move', 'copy', 'test')
+
+
+class PatchError(ValueError):
+    """Parche JSON no válido o que no se puede aplicar"""
+
+
+class RevisionConflict(Exception):
+    """La plantilla cambió desde la revisión sobre la que se hizo el parche"""
+
+    def __init__(self, revision):
+        super().__init__(f"La plantilla está en la revisión {revision}")
+        self.revision = revision
+
+
+def compact_every():
+    return getattr(settings, 'DENTAL_REPORTS_PLANTILLA_COMPACT_EVERY', DEFAULT_PLANTILLA_COMPACT_EVERY)
+
+
+def _parse_pointer(path):
+    """Tokens de un JSON Pointer (RFC 6901)"""
+    if not isinstance(path, str) or (path and not path.startswith('/')):
+        raise PatchError(f"Ruta no válida: {path!r}")
+    if not path:
+        return []
+    return [token.replace('~1', '/').replace('~0', '~') for token in path[1:].split('/')]
+
+
+def _list_index(container, token, allow_end=False):
+    if allow_end and token == '-':
+        return len(container)
+    if not token.isdigit() or (len(token) > 1 and token[0] == '0'):
+        raise PatchError(f"Índice de lista no válido: {token!r}")
+    index = int(token)
+    if index > len(container) or (index == len(container) and not allow_end):
+        raise PatchError(f"Índice fuera de rango: {index}")
+    return index
+
+
+def _parent(document, tokens):
+    """Contenedor del último token de la ruta"""
+    container = document
+    for token in tokens[:-1]:
+        if isinstance(container, dict) and token in container:
+            container = container[token]
+        elif isinstance(container, list):
+            container = container[_list_index(container, token)]
+        else:
+            raise PatchError(f"La ruta no existe: /{'/'.join(tokens)}")
+    if not isinstance(container, (dict, list)):
+        raise PatchError(f"La ruta no existe: /{'/'.join(tokens)}")
+    return container
+
+
+def _get(document, tokens):
+    if not tokens:
+        return document
+    container = _parent(document, tokens)
+    if isinstance(container, list):
+        return container[_list_index(container, tokens[-1])]
+    if tokens[-1] not in container:
+        raise PatchError(f"La ruta no existe: /{'/'.join(tokens)}")
+    return container[tokens[-1]]
+
+
+def _add(document, tokens, value):
+    if not tokens:
+        return value
+    container = _parent(document, tokens)
+    if isinstance(container, list):
+        container.insert(_list_index(container, tokens[-1], allow_end=True), value)
+    else:
+        container[tokens[-1]] = value
+    return document
+
+
+def _remove(document, tokens):
+    if not tokens:
+        raise PatchError("No se puede eliminar el documento completo")
+    container = _parent(document, tokens)
+    if isinstance(container, list):
+        return container.pop(_list_index(container, tokens[-1]))
+    if tokens[-1] not in container:
+        raise PatchError(f"La ruta no existe: /{'/'.join(tokens)}")
+    return container.pop(tokens[-1])
+
+
+def apply_json_patch(document, operations):
+    """
+    Aplica un parche JSON (RFC 6902) sobre el documento, modificándolo
+
+    Returns:
+        El documento resultante (otro objeto sólo si se reemplaza la raíz)
+
+    Raises:
+        PatchError si alguna operación no es válida; el documento puede haber
+        quedado a medio modificar, así que conviene pasar una copia
+    """
+    if not isinstance(operations, list):
+        raise PatchError("El parche debe ser una lista de operaciones")
+
+    for operation in operations:
+        if not isinstance(operation, dict) or operation.get('op') not in PATCH_OPERATIONS:
+            raise PatchError(f"Operación no válida: {operation!r}")
+        op = operation['op']
+        tokens = _parse_pointer(operation.get('path'))
+        if op in ('add', 'replace', 'test') and 'value' not in operation:
+            raise PatchError(f"Falta 'value' en la operación {op} de {operation['path']}")
+
+        if op == 'add':
+            document = _add(document, tokens, copy.deepcopy(operation['value']))
+        elif op == 'remove':
+            _remove(document, tokens)
+        elif op == 'replace':
+            if not tokens:
+                document = copy.deepcopy(operation['value'])
+                continue
+            _get(document, tokens)
+            container = _parent(document, tokens)
+            key = _list_index(container, tokens[-1]) if isinstance(container, list) else tokens[-1]
+            container[key] = copy.deepcopy(operation['value'])
+        elif op == 'test':
+            if _get(document, tokens) != operation['value']:
+                raise PatchError(f"La comprobación de {operation['path']} no se cumple")
+        else:
+            source = _parse_pointer(operation.get('from'))
+            if op == 'move':
+                if tokens[:len(source)] == source and tokens != source:
+                    raise PatchError("No se puede mover un valor dentro de sí mismo")
+                value = _remove(document, source)
+            else:
+                value = copy.deepcopy(_get(document, source))
+            document = _add(document, tokens, value)
+    return document
+
+
+def current_contenido(plantilla):
+    """Contenido de la plantilla en su última revisión (instantánea + parches pendientes)"""
+    if plantilla.revision <= plantilla.revision_snapshot:
+        return plantilla.contenido
+    contenido = copy.deepcopy(plantilla.contenido)
+    pending = (PlantillaCambio.objects
+               .filter(plantilla=plantilla, revision__gt=plantilla.revision_snapshot,
+                       revision__lte=plantilla.revision)
+               .order_by('revision').values_list('operaciones', flat=True))
+    for operations in pending:
+        contenido = apply_json_patch(contenido, operations)
+    return contenido
+
+
+def patch_plantilla(plantilla, base_revision, operations, user=None):
+    """
+    Aplica un parche del editor a una plantilla
+
+    El parche se comprueba aplicándolo en memoria; en la base de datos sólo se
+    escribe la fila del parche y la nueva revisión.
+
+    Returns:
+        Nueva revisión de la plantilla
+
+    Raises:
+        RevisionConflict si la plantilla ya no está en base_revision
+        PatchError si el parche no se puede aplicar
+    """
+    if base_revision != plantilla.revision:
+        raise RevisionConflict(plantilla.revision)
+
+    contenido = apply_json_patch(copy.deepcopy(current_contenido(plantilla)), operations)
+    if not isinstance(contenido, dict):
+        raise PatchError("El contenido de la plantilla debe ser un objeto")
+
+    revision = base_revision + 1
+    updates = {'revision': revision, 'fecha_modificacion': timezone.now()}
+    nombre = contenido.get('name')
+    if isinstance(nombre, str) and nombre.strip() and nombre != plantilla.nombre:
+        updates['nombre'] = nombre[:Plantilla._meta.get_field('nombre').max_length]
+
+    with transaction.atomic():
+        if not Plantilla.objects.filter(pk=plantilla.pk, revision=base_revision).update(**updates):
+            raise RevisionConflict(
+                Plantilla.objects.filter(pk=plantilla.pk).values_list('revision', flat=True).first())
+        PlantillaCambio.objects.create(plantilla=plantilla, revision=revision, operaciones=operations, autor=user)
+        if 'nombre' in updates:
+            cache.invalidate('templates')
+
+    for field, value in updates.items():
+        setattr(plantilla, field, value)
+    if revision - plantilla.revision_snapshot >= compact_every():
+        compact_plantilla(plantilla, contenido)
+    return revision
+
+
+def compact_plantilla(plantilla, contenido=None):
+    """
+    Guarda el contenido actual como instantánea y borra los parches que incluye
+
+    Si otro guardado llega entretanto no se compacta: ya lo hará el siguiente.
+    """
+    if contenido is None:
+        contenido = current_contenido(plantilla)
+    revision = plantilla.revision
+    with transaction.atomic():
+        if not Plantilla.objects.filter(pk=plantilla.pk, revision=revision).update(
+                contenido=contenido, revision_snapshot=revision):
+            return False
+        PlantillaCambio.objects.filter(plantilla=plantilla, revision__lte=revision).delete()
+    plantilla.contenido = contenido
+    plantilla.revision_snapshot = revision
+    return True
+
+
+def save_plantilla_snapshot(plantilla, contenido, base_revision=None):
+    """
+    Guardado completo (botón Guardar): el contenido pasa a ser la instantánea de una revisión nueva
+
+    Una plantilla ya guardada sólo se sobrescribe si sigue en base_revision,
+    con el mismo UPDATE condicional que patch_plantilla.
+
+    Returns:
+        Nueva revisión de la plantilla
+
+    Raises:
+        RevisionConflict si la plantilla ya no está en base_revision
+    """
+    if plantilla.pk is None:
+        plantilla.contenido = contenido
+        plantilla.revision = plantilla.revision_snapshot = 1
+        plantilla.save()
+        return plantilla.revision
+
+    if base_revision is None or base_revision != plantilla.revision:
+        raise RevisionConflict(plantilla.revision)
+
+    revision = base_revision + 1
+    updates = {'nombre': plantilla.nombre, 'contenido': contenido, 'revision': revision,
+               'revision_snapshot': revision, 'fecha_modificacion': timezone.now()}
+    with transaction.atomic():
+        if not Plantilla.objects.filter(pk=plantilla.pk, revision=base_revision).update(**updates):
+            raise RevisionConflict(
+                Plantilla.objects.filter(pk=plantilla.pk).values_list('revision', flat=True).first())
+        PlantillaCambio.objects.filter(plantilla=plantilla, revision__lte=revision).delete()
+        cache.invalidate('templates')
+
+    for field, value in updates.items():
+        setattr(plantilla, field, value)
+    return revision
@@ -0,0 +1,196 @@
+# dental_reports/pdf_cache.py
+"""
+Caché de PDFs direccionada por contenido.
+
+Cada PDF se guarda una única vez en el almacenamiento por defecto, bajo el
+hash SHA-256 del documento HTML final más la huella del renderizador
+(versión y hojas de estilo). Dos informes idénticos comparten el mismo archivo:
+GeneratedReport.pdf_file apunta directamente a él, sin copiarlo.
+
+Los archivos de la caché están bajo MEDIA y se sirven públicamente, así que
+no pueden quedarse cuando ya no los usa ningún informe: se borran al eliminar
+(o regenerar) el último informe que apuntaba a ellos, y `manage.py
+sweep_pdf_cache` borra los que hayan quedado huérfanos por cualquier otro motivo.
+"""
+from datetime import timedelta
+import hashlib
+import logging
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+from .models import GeneratedReport
+from .utils import get_pdf_renderer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PDF_CACHE_DIR = 'pdf_cache'
+
+
+def pdf_cache_dir():
+    return getattr(settings, 'DENTAL_REPORTS_PDF_CACHE_DIR', DEFAULT_PDF_CACHE_DIR)
+
+
+def pdf_cache_key(styled_html, renderer=None):
+    """Hash del documento HTML final más la huella del renderizador"""
+    renderer = renderer or get_pdf_renderer()
+    digest = hashlib.sha256()
+    digest.update(renderer.fingerprint.encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(styled_html.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def pdf_cache_path(key):
+    # Se reparte en subdirectorios para no acumular miles de archivos en uno solo
+    return f"{pdf_cache_dir()}/{key[:2]}/{key}.pdf"
+
+
+def is_cached_pdf_path(name):
+    """True si el archivo es un PDF de la caché (compartido: no se borra con el informe)"""
+    return bool(name) and name.startswith(f"{pdf_cache_dir()}/")
+
+
+class CachedPdf:
+    """PDF almacenado en la caché"""
+
+    def __init__(self, key, storage=None):
+        self.key = key
+        self.path = pdf_cache_path(key)
+        self.storage = storage or default_storage
+
+    @property
+    def etag(self):
+        return f'"{self.key}"'
+
+    def exists(self):
+        return self.storage.exists(self.path)
+
+    def open(self):
+        return self.storage.open(self.path, 'rb')
+
+    def read(self):
+        with self.open() as f:
+            return f.read()
+
+    def size(self):
+        return self.storage.size(self.path)
+
+    def modified_time(self):
+        try:
+            return self.storage.get_modified_time(self.path)
+        except NotImplementedError:
+            return None
+
+
+def cached_pdf_for_html(html_content, renderer=None):
+    """Entrada de la caché correspondiente al contenido de un informe (exista o no)"""
+    renderer = renderer or get_pdf_renderer()
+    return CachedPdf(pdf_cache_key(renderer.build_html(html_content), renderer))
+
+
+def store_pdf(key, pdf_bytes, storage=None):
+    """Guarda los bytes de un PDF bajo su clave. Devuelve el CachedPdf"""
+    cached_pdf = CachedPdf(key, storage)
+    if cached_pdf.exists():
+        return cached_pdf
+
+    saved_name = cached_pdf.storage.save(cached_pdf.path, ContentFile(pdf_bytes))
+    if saved_name != cached_pdf.path:
+        # Otro proceso guardó el mismo contenido entre medias: nos quedamos con el suyo
+        cached_pdf.storage.delete(saved_name)
+    return cached_pdf
+
+
+def get_or_render_pdf(html_content, renderer=None):
+    """
+    Devuelve el PDF cacheado del contenido de un informe, renderizándolo sólo si falta
+
+    Returns:
+        CachedPdf o None si xhtml2pdf no pudo generar el PDF
+    """
+    renderer = renderer or get_pdf_renderer()
+    styled_html = renderer.build_html(html_content)
+    key = pdf_cache_key(styled_html, renderer)
+    cached_pdf = CachedPdf(key)
+    if cached_pdf.exists():
+        return cached_pdf
+
+    pdf_bytes = renderer.render_document(styled_html)
+    if pdf_bytes is None:
+        return None
+
+    logger.debug(f"PDF {key} añadido a la caché")
+    return store_pdf(key, pdf_bytes)
+
+
+def release_cached_pdf(name, storage=None):
+    """
+    Borra un PDF de la caché si ningún informe apunta ya a él
+
+    Returns:
+        True si se ha borrado
+    """
+    if not is_cached_pdf_path(name) or GeneratedReport.objects.filter(pdf_file=name).exists():
+        return False
+    (storage or default_storage).delete(name)
+    logger.debug(f"PDF {name} eliminado de la caché")
+    return True
+
+
+def iter_cached_pdf_names(storage=None):
+    """Nombres de todos los archivos de la caché de PDFs"""
+    storage = storage or default_storage
+    root = pdf_cache_dir()
+    if not storage.exists(root):
+        return
+    subdirs, _ = storage.listdir(root)
+    for subdir in sorted(subdirs):
+        _, files = storage.listdir(f"{root}/{subdir}")
+        for filename in sorted(files):
+            yield f"{root}/{subdir}/{filename}"
+
+
+def sweep_orphaned_pdfs(min_age=timedelta(hours=1), batch_size=500, storage=None, dry_run=False):
+    """
+    Borra los PDF de la caché que no usa ningún informe
+
+    Args:
+        min_age: No se tocan los archivos más recientes (pueden ser de un informe que
+            se está generando y aún no apunta a ellos)
+        dry_run: Sólo contarlos
+
+    Returns:
+        Número de archivos huérfanos (borrados salvo con dry_run)
+    """
+    storage = storage or default_storage
+    cutoff = timezone.now() - min_age
+    orphaned = 0
+
+    def sweep(names):
+        referenced = set(GeneratedReport.objects.filter(pdf_file__in=names).values_list('pdf_file', flat=True))
+        count = 0
+        for name in names:
+            if name in referenced:
+                continue
+            try:
+                if storage.get_modified_time(name) > cutoff:
+                    continue
+            except NotImplementedError:
+                pass
+            if not dry_run:
+                storage.delete(name)
+            count += 1
+        return count
+
+    batch = []
+    for name in iter_cached_pdf_names(storage):
+        batch.append(name)
+        if len(batch) >= batch_size:
+            orphaned += sweep(batch)
+            batch = []
+    if batch:
+        orphaned += sweep(batch)
+    return orphaned
@@ -0,0 +1,501 @@
+# dental_reports/plantillas.py
+"""
+Compilación de las plantillas del editor visual (Plantilla.contenido).
+
+El editor guarda bloques de HTML con variables ({nombrePaciente}) y
+condiciones ("Si edadPaciente > 40"), además de cabecera, pie, estilo y los
+campos predefinidos y personalizados. compile_plantilla() convierte ese JSON
+en un plan: una tupla de fragmentos de HTML literal, variables y condiciones
+ya evaluables. El plan se compila una vez por versión de la Plantilla
+(revisión y fecha_modificacion) y ejecutarlo es una sola pasada que concatena
+fragmentos, sin buscar ni reemplazar en el texto.
+
+El HTML resultante se guarda en GeneratedReport.report_content, de modo que
+los informes de plantillas visuales usan el mismo pipeline de PDF que el resto.
+"""
+from collections import namedtuple
+import datetime
+from html import unescape
+import operator
+import re
+
+from django.templatetags.static import static
+from django.utils.html import escape, strip_tags
+from django.utils.text import slugify
+
+from .fields_schema import RESERVED_FIELD_NAMES
+from .forms import build_report_form_class
+from .instrumentation import timed
+from .models import GeneratedReport
+from .patches import current_contenido
+from .rendering import CompiledTemplateCache, serialize_form_data
+
+# Bloque de condición tal como lo genera el editor (visual-editor.js)
+CONDITION_BLOCK_RE = re.compile(
+    r'<div class="condition-wrapper">\s*'
+    r'<div class="condition-expression">(?P<expression>.*?)</div>\s*'
+    r'<div class="condition-content">(?P<then>.*?)</div>\s*'
+    r'<div class="condition-else-content">(?P<otherwise>.*?)</div>\s*'
+    r'</div>',
+    re.S,
+)
+TAG_RE = re.compile(r'(<[^>]*>)')
+VARIABLE_RE = re.compile(r'\{\s*([A-Za-z_]\w*)\s*\}')
+CONDITION_RE = re.compile(
+    r'^(?P<negate>no\s+)?(?P<name>[A-Za-z_]\w*)\s*'
+    r'(?:(?P<operator>>=|<=|!=|==|=|>|<|(?:no\s+)?contiene\s|es\s)\s*(?P<value>.+?))?\s*$',
+    re.I,
+)
+
+COMPARISONS = {
+    '>': operator.gt,
+    '>=': operator.ge,
+    '<': operator.lt,
+    '<=': operator.le,
+    '=': operator.eq,
+    '==': operator.eq,
+    'es': operator.eq,
+    '!=': operator.ne,
+}
+
+# Campos predefinidos del editor: (variable, etiqueta)
+PATIENT_FIELDS = (
+    ('nombrePaciente', 'Nombre'),
+    ('fechaNacimiento', 'Fecha de Nacimiento'),
+    ('edad', 'Edad'),
+    ('telefono', 'Teléfono'),
+    ('email', 'Email'),
+)
+CLINICAL_FIELDS = (
+    ('diagnostico', 'Diagnóstico'),
+    ('tratamiento', 'Tratamiento'),
+    ('piezaDental', 'Pieza Dental'),
+    ('fechaConsulta', 'Fecha de Consulta'),
+    ('proximaCita', 'Próxima Cita'),
+)
+
+# Campo del formulario de informe de las variables conocidas
+VARIABLE_FIELDS = {
+    'edadPaciente': {'type': 'number', 'label': 'Edad del paciente'},
+    'edad': {'type': 'number', 'label': 'Edad'},
+    'fechaNacimiento': {'type': 'date', 'label': 'Fecha de nacimiento'},
+    'telefono': {'type': 'text', 'label': 'Teléfono'},
+    'email': {'type': 'text', 'label': 'Email'},
+    'diagnostico': {'type': 'textarea', 'label': 'Diagnóstico'},
+    'tratamiento': {'type': 'textarea', 'label': 'Tratamiento'},
+    'piezaDental': {'type': 'text', 'label': 'Pieza dental'},
+    'fechaConsulta': {'type': 'date', 'label': 'Fecha de consulta'},
+    'proximaCita': {'type': 'date', 'label': 'Próxima cita'},
+}
+
+# Variables que se rellenan con los campos fijos del formulario de informe
+FIXED_VARIABLES = {
+    'nombrePaciente': 'patient_name',
+    'dentistaNombre': 'doctor_name',
+}
+
+# Tipos de los campos personalizados del editor admitidos en el formulario
+# (las listas desplegables del editor no guardan opciones: se piden como texto)
+CUSTOM_FIELD_TYPES = {'text', 'number', 'date', 'textarea'}
+
+STYLE_CSS = {
+    'formal': "font-family: 'Times New Roman', Times, serif; line-height: 1.6",
+    'moderno': 'font-family: Arial, sans-serif; line-height: 1.5',
+    'minimalista': 'font-family: Helvetica, Arial, sans-serif; line-height: 1.5',
+    'profesional': "font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; line-height: 1.6",
+}
+
+LOGO_PATH = 'dental_reports/img/logo-placeholder.png'
+
+# Datos de ejemplo de la vista previa
+SAMPLE_DATA = {
+    'nombrePaciente': 'Juan Pérez',
+    'edadPaciente': '45',
+    'edad': '45',
+    'telefono': '+34 612 345 678',
+    'email': 'paciente@ejemplo.com',
+    'fechaConsulta': '08/05/2025',
+    'diagnostico': 'Caries en molar inferior',
+    'tratamiento': 'Empaste dental',
+    'piezaDental': '36 - Primer molar inferior izquierdo',
+    'dentistaNombre': 'Dra. Laura Martínez',
+    'proximaCita': '22/05/2025',
+}
+SAMPLE_VALUES = {
+    'text': 'Texto de ejemplo',
+    'number': '42',
+    'date': '01/01/2025',
+    'textarea': 'Área de texto con contenido extenso...',
+}
+
+Variable = namedtuple('Variable', ['name'])
+Condition = namedtuple('Condition', ['expression', 'test', 'then', 'otherwise'])
+
+
+def format_value(value):
+    """Texto con el que se muestra un dato en el informe"""
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'Sí' if value else 'No'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, datetime.date):
+        return value.strftime('%d/%m/%Y')
+    if isinstance(value, (list, tuple)):
+        return ', '.join(format_value(item) for item in value)
+    return str(value)
+
+
+def _as_number(value):
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(str(value).strip().replace(',', '.'))
+    except ValueError:
+        return None
+
+
+def _is_truthy(value):
+    if isinstance(value, str):
+        return value.strip().lower() not in ('', '0', 'no', 'false')
+    return bool(value)
+
+
+def _unquote(text):
+    if len(text) >= 2 and text[0] == text[-1] and text[0] in '"\'':
+        return text[1:-1]
+    return text
+
+
+def compile_condition(expression):
+    """
+    Convierte la expresión de un bloque de condición en una función datos -> bool
+
+    Expresiones admitidas (con o sin "Si " delante):
+        edadPaciente > 40          >, >=, <, <=, =, ==, !=; numérica si ambos lados son números
+        tratamiento es Endodoncia
+        diagnostico contiene caries
+        diagnostico no contiene caries
+        proximaCita                el dato tiene valor
+        no proximaCita
+
+    Returns:
+        Tupla (nombre de la variable, función)
+
+    Raises:
+        ValueError si la expresión no se entiende
+    """
+    expression = re.sub(r'^\s*si\s+', '', expression, flags=re.I).strip()
+    match = CONDITION_RE.match(expression)
+    if not match:
+        raise ValueError(f"Condición no válida: {expression!r}")
+
+    name = match['name']
+    operator_name = ' '.join(match['operator'].lower().split()) if match['operator'] else None
+
+    if operator_name is None:
+        def test(data):
+            return _is_truthy(data.get(name))
+    elif operator_name in ('contiene', 'no contiene'):
+        needle = _unquote(match['value']).casefold()
+        expected = operator_name == 'contiene'
+
+        def test(data):
+            return (needle in format_value(data.get(name)).casefold()) == expected
+    else:
+        compare = COMPARISONS[operator_name]
+        expected_text = _unquote(match['value'])
+        expected_number = _as_number(expected_text)
+        expected_text = expected_text.casefold()
+
+        def test(data):
+            value = data.get(name)
+            number = _as_number(value) if value not in (None, '') else None
+            if number is not None and expected_number is not None:
+                return compare(number, expected_number)
+            return compare(format_value(value).casefold(), expected_text)
+
+    if match['negate']:
+        return name, lambda data: not test(data)
+    return name, test
+
+
+def _never(data):
+    return False
+
+
+def _merge(nodes):
+    """Une los fragmentos literales consecutivos y descarta los vacíos"""
+    merged = []
+    for node in nodes:
+        if isinstance(node, str):
+            if not node:
+                continue
+            if merged and isinstance(merged[-1], str):
+                merged[-1] += node
+                continue
+        merged.append(node)
+    return tuple(merged)
+
+
+def _variable(name, variables):
+    if name not in variables:
+        variables.append(name)
+    return Variable(name)
+
+
+def _compile_text(html, variables):
+    """Fragmentos literales y variables de un trozo de HTML (las variables sólo fuera de las etiquetas)"""
+    nodes = []
+    for part in TAG_RE.split(html):
+        if part.startswith('<'):
+            nodes.append(part)
+            continue
+        position = 0
+        for match in VARIABLE_RE.finditer(part):
+            nodes.append(part[position:match.start()])
+            nodes.append(_variable(match[1], variables))
+            position = match.end()
+        nodes.append(part[position:])
+    return nodes
+
+
+def _compile_html(html, variables, warnings):
+    """Nodos del HTML de un bloque, con sus condiciones"""
+    nodes = []
+    position = 0
+    for match in CONDITION_BLOCK_RE.finditer(html):
+        nodes.extend(_compile_text(html[position:match.start()], variables))
+        expression = unescape(strip_tags(match['expression'])).strip()
+        try:
+            name, test = compile_condition(expression)
+            _variable(name, variables)
+        except ValueError as e:
+            # Como en la vista previa del navegador: una condición que no se entiende es falsa
+            warnings.append(str(e))
+            test = _never
+        nodes.append('<div class="condition-result">')
+        nodes.append(Condition(
+            expression,
+            test,
+            _merge(_compile_text(match['then'], variables)),
+            _merge(_compile_text(match['otherwise'], variables)),
+        ))
+        nodes.append('</div>')
+        position = match.end()
+    nodes.extend(_compile_text(html[position:], variables))
+    return nodes
+
+
+def custom_field_name(field, index):
+    """Nombre de variable de un campo personalizado del editor ('Alergias conocidas' -> 'alergias_conocidas')"""
+    name = slugify(str(field.get('name') or '')).replace('-', '_')
+    if not name.isidentifier() or name in RESERVED_FIELD_NAMES:
+        name = f'campo_{index}'
+    return name
+
+
+def _field_rows(fields, variables):
+    nodes = []
+    for name, label in fields:
+        nodes += [f'<tr><th>{escape(label)}:</th><td>', _variable(name, variables), '</td></tr>']
+    return nodes
+
+
+class PlantillaPlan:
+    """
+    Plantilla visual compilada
+
+    Atributos:
+        nodes: Fragmentos literales (str), Variable y Condition
+        variables: Variables que usa la plantilla, en orden de aparición
+        fields_schema: Esquema de los campos que hay que pedir para generar un informe
+        warnings: Problemas encontrados al compilar (p. ej. condiciones no válidas)
+    """
+
+    def __init__(self, nodes, variables, fields_schema, warnings):
+        self.nodes = nodes
+        self.variables = variables
+        self.fields_schema = fields_schema
+        self.warnings = warnings
+        self._form_class = None
+
+    def render(self, data, keep_missing=False):
+        """
+        HTML de la plantilla con los datos dados
+
+        Args:
+            data: Diccionario variable -> valor
+            keep_missing: Dejar las variables sin valor como {nombre} (vista previa)
+                          en lugar de vacías
+        """
+        parts = []
+        self._render(self.nodes, data, {}, keep_missing, parts.append)
+        return ''.join(parts)
+
+    def _render(self, nodes, data, rendered, keep_missing, append):
+        for node in nodes:
+            if type(node) is str:
+                append(node)
+            elif type(node) is Variable:
+                text = rendered.get(node.name)
+                if text is None:
+                    value = data.get(node.name)
+                    if value is None or value == '':
+                        text = f'{{{node.name}}}' if keep_missing else ''
+                    else:
+                        text = escape(format_value(value))
+                    rendered[node.name] = text
+                append(text)
+            else:
+                branch = node.then if node.test(data) else node.otherwise
+                self._render(branch, data, rendered, keep_missing, append)
+
+    @property
+    def form_class(self):
+        """Formulario (subclase de DynamicReportForm) con los campos de la plantilla"""
+        if self._form_class is None:
+            self._form_class = build_report_form_class(self.fields_schema, name='PlantillaReportForm')
+        return self._form_class
+
+    def sample_data(self):
+        """Datos de ejemplo para la vista previa"""
+        data = dict(SAMPLE_DATA)
+        for config in self.fields_schema['fields']:
+            data.setdefault(config['name'], SAMPLE_VALUES.get(config['type'], SAMPLE_VALUES['text']))
+        return data
+
+
+def compile_plantilla(contenido):
+    """
+    Compila el JSON del editor visual en un PlantillaPlan
+
+    El HTML generado sigue la estructura de la vista previa del editor:
+    cabecera, logo, campos predefinidos, campos personalizados, bloques y pie.
+    """
+    contenido = contenido if isinstance(contenido, dict) else {}
+    fields = contenido.get('fields') if isinstance(contenido.get('fields'), dict) else {}
+    variables, warnings, nodes = [], [], []
+
+    if fields.get('header'):
+        nodes += ['<div class="mb-4 text-center"><h3>', *_compile_text(str(fields['header']), variables),
+                  '</h3></div>']
+
+    if fields.get('includeLogo'):
+        nodes.append(f'<div class="text-center mb-3">'
+                     f'<img src="{escape(static(LOGO_PATH))}" alt="Logo" height="60"></div>')
+
+    predefined = fields.get('predefined') if isinstance(fields.get('predefined'), list) else []
+    for title, group in (('Datos del Paciente', PATIENT_FIELDS), ('Datos Clínicos', CLINICAL_FIELDS)):
+        selected = [(name, label) for name, label in group if name in predefined]
+        if selected:
+            nodes += [f'<div class="mb-4"><h4>{title}</h4><table class="table table-bordered">',
+                      *_field_rows(selected, variables), '</table></div>']
+
+    custom_fields = {}
+    custom = fields.get('custom') if isinstance(fields.get('custom'), list) else []
+    for index, field in enumerate(custom, start=1):
+        if isinstance(field, dict):
+            name = custom_field_name(field, index)
+            custom_fields.setdefault(name, {
+                'name': name,
+                'type': field.get('type') if field.get('type') in CUSTOM_FIELD_TYPES else 'text',
+                'label': str(field.get('name') or name),
+            })
+    if custom_fields:
+        nodes += ['<div class="mb-4"><h4>Campos Personalizados</h4><table class="table table-bordered">',
+                  *_field_rows([(name, config['label']) for name, config in custom_fields.items()], variables),
+                  '</table></div>']
+
+    blocks = [block for block in contenido.get('blocks') or [] if isinstance(block, dict)]
+    if blocks:
+        nodes.append('<div class="mb-4"><h4>Contenido Visual</h4>')
+        for block in blocks:
+            nodes.append('<div class="preview-block mb-3">')
+            nodes.extend(_compile_html(str(block.get('content') or ''), variables, warnings))
+            nodes.append('</div>')
+        nodes.append('</div>')
+
+    if fields.get('footer'):
+        nodes += ['<div class="mt-5 pt-3 border-top text-center">',
+                  *_compile_text(str(fields['footer']), variables), '</div>']
+
+    if not nodes:
+        nodes.append('<p class="text-muted">Esta plantilla no tiene contenido.</p>')
+
+    style = fields.get('style') if fields.get('style') in STYLE_CSS else ''
+    nodes.insert(0, f'<div class="plantilla-informe preview-style-{style}" style="{STYLE_CSS.get(style, "")}">')
+    nodes.append('</div>')
+
+    return PlantillaPlan(_merge(nodes), tuple(variables), plantilla_fields_schema(variables, custom_fields),
+                         tuple(warnings))
+
+
+def plantilla_fields_schema(variables, custom_fields):
+    """Esquema de campos (como ReportTemplate.fields_schema) de las variables de una plantilla"""
+    schema_fields = []
+    for name in variables:
+        if name in FIXED_VARIABLES or name in RESERVED_FIELD_NAMES:
+            continue
+        config = custom_fields.get(name) or {'name': name, **VARIABLE_FIELDS.get(name, {'type': 'text'})}
+        schema_fields.append({'label': name, **config})
+    return {'fields': schema_fields}
+
+
+class PlantillaPlanCache(CompiledTemplateCache):
+    """Caché LRU de los planes compilados, por (Plantilla, revisión, fecha_modificacion)"""
+
+    @staticmethod
+    def make_key(plantilla):
+        # El autoguardado por parches no emite post_save: la revisión cambia la clave
+        return (plantilla._meta.label_lower, plantilla.pk, plantilla.revision, plantilla.fecha_modificacion)
+
+    def compile(self, plantilla):
+        return compile_plantilla(current_contenido(plantilla))
+
+
+# Caché compartida por todo el proceso
+plan_cache = PlantillaPlanCache()
+
+
+def get_plan(plantilla):
+    """Plan compilado (cacheado) de una Plantilla"""
+    return plan_cache.get(plantilla)
+
+
+def render_plantilla_html(plantilla, data, keep_missing=False):
+    """Renderiza una Plantilla con los datos dados"""
+    with timed('tpl'):
+        return get_plan(plantilla).render(data, keep_missing=keep_missing)
+
+
+def plantilla_report_data(cleaned_data):
+    """Datos de la plantilla a partir de un formulario de informe válido"""
+    data = dict(cleaned_data)
+    for variable, field in FIXED_VARIABLES.items():
+        data.setdefault(variable, cleaned_data.get(field))
+    return data
+
+
+def build_plantilla_report(plantilla, cleaned_data, created_by=None):
+    """
+    Construye, sin guardarlo, el informe de una Plantilla visual
+
+    Args:
+        plantilla: Instancia de Plantilla
+        cleaned_data: cleaned_data del formulario de get_plan(plantilla).form_class
+        created_by: Usuario autor del informe
+    """
+    patient_name = cleaned_data.get('patient_name')
+    return GeneratedReport(
+        plantilla=plantilla,
+        patient_name=patient_name,
+        doctor_name=cleaned_data.get('doctor_name'),
+        title=f"Informe para {patient_name} - {plantilla.nombre}",
+        report_content=render_plantilla_html(plantilla, plantilla_report_data(cleaned_data)),
+        form_data=serialize_form_data(cleaned_data),
+        created_by=created_by,
+    )
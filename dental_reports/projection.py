@@ -0,0 +1,184 @@
+# dental_reports/projection.py
+"""
+Proyección de form_data en filas ReportFieldValue.
+
+form_data es un JSON cuya forma depende de la plantilla, así que filtrar o
+agregar por un campo clínico ("endodoncias del diente 36", "longitud media
+de trabajo") obligaría a cargar y recorrer el JSON de cada informe. Aquí cada
+campo del fields_schema de la plantilla se copia a una fila con el valor en
+la columna de su tipo (texto, número, fecha o sí/no), que está indexada.
+
+Las claves de form_data que no están en el esquema no se proyectan. Las filas
+se regeneran enteras cada vez que cambian los datos del informe; si cambia el
+esquema de una plantilla, `manage.py rebuild_report_fields --template ID`
+regenera las de sus informes.
+"""
+import datetime
+
+from django.db import transaction
+
+from .fields_schema import schema_fields
+from .models import GeneratedReport, ReportFieldValue, ReportTemplate
+
+# Tipos de campo con varios valores: una fila por valor
+MULTIPLE_VALUE_TYPES = ('multiselect', 'teeth')
+
+TRUE_VALUES = {'1', 'true', 'on', 'sí', 'si', 'yes'}
+
+_TEXT_MAX_LENGTH = ReportFieldValue._meta.get_field('value_text').max_length
+_NAME_MAX_LENGTH = ReportFieldValue._meta.get_field('name').max_length
+
+
+def _to_number(value):
+    if isinstance(value, bool):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_date(value):
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    try:
+        # serialize_form_data guarda las fechas como 'AAAA-MM-DD'
+        return datetime.date.fromisoformat(str(value)[:10])
+    except ValueError:
+        return None
+
+
+def _to_bool(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in TRUE_VALUES
+
+
+def field_value_row(name, field_type, value, position=0):
+    """Valores de una fila ReportFieldValue para un valor de form_data"""
+    row = {
+        'name': name[:_NAME_MAX_LENGTH],
+        'field_type': field_type,
+        'position': position,
+        'value_text': '',
+        'value_number': None,
+        'value_date': None,
+        'value_bool': None,
+    }
+    if field_type == 'number':
+        row['value_number'] = _to_number(value)
+        # 36.0 -> '36', para poder filtrar también por texto
+        row['value_text'] = f"{row['value_number']:g}" if row['value_number'] is not None else str(value)
+    elif field_type == 'date':
+        row['value_date'] = _to_date(value)
+        row['value_text'] = row['value_date'].isoformat() if row['value_date'] else str(value)
+    elif field_type == 'checkbox':
+        row['value_bool'] = _to_bool(value)
+        row['value_text'] = 'sí' if row['value_bool'] else 'no'
+    else:
+        row['value_text'] = str(value)
+    row['value_text'] = row['value_text'][:_TEXT_MAX_LENGTH]
+    return row
+
+
+def _is_empty(value):
+    return value is None or value == '' or value == []
+
+
+def project_form_data(fields_schema, form_data):
+    """
+    Filas ReportFieldValue (como diccionarios) de los campos del esquema presentes en form_data
+
+    Args:
+        fields_schema: fields_schema de la plantilla del informe
+        form_data: form_data del informe
+    """
+    if not isinstance(form_data, dict):
+        return []
+
+    rows = []
+    for config in schema_fields(fields_schema):
+        if not isinstance(config, dict) or not isinstance(config.get('name'), str):
+            continue
+        name = config['name']
+        field_type = config.get('type', 'text')
+        value = form_data.get(name)
+        if _is_empty(value):
+            continue
+
+        if field_type in MULTIPLE_VALUE_TYPES:
+            values = value if isinstance(value, list) else [part.strip() for part in str(value).split(',')]
+            rows.extend(field_value_row(name, field_type, item, position)
+                        for position, item in enumerate(values) if not _is_empty(item))
+        elif field_type == 'rows':
+            if not isinstance(value, list):
+                continue
+            columns = [column for column in config.get('columns', [])
+                       if isinstance(column, dict) and isinstance(column.get('name'), str)]
+            for position, row in enumerate(value):
+                if not isinstance(row, dict):
+                    continue
+                for column in columns:
+                    cell = row.get(column['name'])
+                    if not _is_empty(cell):
+                        rows.append(field_value_row(f"{name}.{column['name']}", column.get('type', 'text'),
+                                                    cell, position))
+        else:
+            rows.append(field_value_row(name, field_type, value))
+    return rows
+
+
+def sync_report_fields(reports):
+    """
+    Regenera las filas ReportFieldValue de informes ya guardados
+
+    Una consulta para los esquemas, un DELETE y un INSERT por lotes, sea cual
+    sea el número de informes.
+
+    Returns:
+        Número de filas creadas
+    """
+    reports = [report for report in reports if report.pk]
+    if not reports:
+        return 0
+
+    template_ids = {report.template_id for report in reports}
+    schemas = dict(ReportTemplate.objects.filter(id__in=template_ids).values_list('id', 'fields_schema'))
+    values = [
+        ReportFieldValue(report_id=report.pk, **row)
+        for report in reports
+        for row in project_form_data(schemas.get(report.template_id), report.form_data)
+    ]
+
+    with transaction.atomic():
+        ReportFieldValue.objects.filter(report_id__in=[report.pk for report in reports]).delete()
+        ReportFieldValue.objects.bulk_create(values, batch_size=1000)
+    return len(values)
+
+
+def rebuild_report_fields(batch_size=500, template_id=None):
+    """
+    Regenera la proyección de todos los informes (o de los de una plantilla)
+
+    Returns:
+        Número de informes procesados
+    """
+    reports = GeneratedReport.objects.only('id', 'template_id', 'form_data').order_by('id')
+    if template_id:
+        reports = reports.filter(template_id=template_id)
+
+    total = 0
+    batch = []
+    for report in reports.iterator(chunk_size=batch_size):
+        batch.append(report)
+        if len(batch) >= batch_size:
+            sync_report_fields(batch)
+            total += len(batch)
+            batch = []
+    if batch:
+        sync_report_fields(batch)
+        total += len(batch)
+    return total
+
@@ -0,0 +1,238 @@
+# dental_reports/queries.py
+"""Consultas de informes compartidas por las vistas y los comandos de gestión"""
+import base64
+from datetime import date, datetime
+
+from django.conf import settings
+from django.db.models import Avg, Count, Exists, Max, Min, OuterRef, Q
+from django.utils import timezone
+
+from .models import GeneratedReport, ReportFieldValue
+from .normalization import fold_text
+
+
+def parse_month(month):
+    """Convierte 'AAAA-MM' en el rango [inicio, fin) de ese mes, o None si no es válido"""
+    try:
+        year, month_number = (int(part) for part in month.split('-'))
+        start = datetime(year, month_number, 1)
+        end = datetime(year + month_number // 12, month_number % 12 + 1, 1)
+    except (ValueError, AttributeError):
+        return None
+    if settings.USE_TZ:
+        start, end = timezone.make_aware(start), timezone.make_aware(end)
+    return start, end
+
+
+# Prefijo de los parámetros GET que filtran por un campo de form_data (?datos.diente=36)
+FIELD_PARAM_PREFIX = 'datos.'
+# Sufijos de rango: ?datos.longitud__min=18&datos.proxima_cita__max=2026-12-31
+FIELD_PARAM_RANGES = {'__min': 'gte', '__max': 'lte'}
+
+
+def filter_by_field(queryset, name, **conditions):
+    """
+    Informes con algún valor del campo `name` de form_data que cumpla las condiciones
+
+    Las condiciones se aplican a las columnas value_* de ReportFieldValue:
+
+        filter_by_field(reports, 'diente', text='36')
+        filter_by_field(reports, 'longitud_trabajo', number__gte=20)
+        filter_by_field(reports, 'piezas', text__in=['36', '37'])
+    """
+    lookups = {f'value_{key}': value for key, value in conditions.items()}
+    return queryset.filter(Exists(
+        ReportFieldValue.objects.filter(report=OuterRef('pk'), name=name, **lookups)
+    ))
+
+
+def _range_condition(value, lookup):
+    """Condición de rango sobre la fecha o el número, según el valor recibido"""
+    try:
+        return {f'date__{lookup}': date.fromisoformat(value)}
+    except ValueError:
+        pass
+    try:
+        return {f'number__{lookup}': float(value)}
+    except ValueError:
+        return None
+
+
+def field_filters_from_params(params):
+    """
+    Filtros por campo de form_data de los parámetros de una petición
+
+    Returns:
+        Lista de tuplas (campo, condiciones) para filter_by_field
+    """
+    filters = []
+    for key in params:
+        if not key.startswith(FIELD_PARAM_PREFIX):
+            continue
+        value = params.get(key, '').strip()
+        name = key[len(FIELD_PARAM_PREFIX):]
+        if not value or not name:
+            continue
+        for suffix, lookup in FIELD_PARAM_RANGES.items():
+            if name.endswith(suffix):
+                condition = _range_condition(value, lookup)
+                if condition:
+                    filters.append((name[:-len(suffix)], condition))
+                break
+        else:
+            filters.append((name, {'text': value}))
+    return filters
+
+
+def field_value_counts(queryset, name, limit=None):
+    """
+    Número de informes por valor de un campo: [(valor, informes), ...] de más a menos frecuente
+
+    p. ej. field_value_counts(endodoncias, 'diente') -> [('36', 120), ('46', 98), ...]
+    """
+    counts = (ReportFieldValue.objects
+              .filter(name=name, report__in=queryset.order_by().values('pk'))
+              .values_list('value_text')
+              .annotate(reports=Count('report', distinct=True))
+              .order_by('-reports', 'value_text'))
+    if limit:
+        counts = counts[:limit]
+    return list(counts)
+
+
+def field_number_stats(queryset, name):
+    """Número de valores, media, mínimo y máximo de un campo numérico de los informes"""
+    return (ReportFieldValue.objects
+            .filter(name=name, report__in=queryset.order_by().values('pk'), value_number__isnull=False)
+            .aggregate(count=Count('id'), avg=Avg('value_number'),
+                       min=Min('value_number'), max=Max('value_number')))
+
+
+def filter_patient_name(reports, patient_name):
+    """
+    Informes cuyo paciente contiene el texto buscado, sin distinguir mayúsculas
+
+    Se compara con patient_name_folded, normalizado en Python igual que el texto
+    buscado (LOWER() de SQLite no convierte las letras acentuadas). La búsqueda
+    es en cualquier parte del nombre ("Pérez" encuentra "Juan Pérez" y "Pérez
+    Ana"), así que recorre los nombres de los informes ya filtrados por el resto
+    de condiciones en lugar de usar el índice.
+    """
+    needle = fold_text(patient_name.strip())
+    if not needle:
+        return reports
+    return reports.filter(patient_name_folded__contains=needle)
+
+
+def filter_reports(queryset=None, user=None, template_id=None, patient_name=None, month=None, fields=None):
+    """
+    Aplica los filtros del listado de informes
+
+    Args:
+        queryset: QuerySet de partida (por defecto, todos los informes)
+        user: Si no es superusuario, sólo se devuelven sus informes
+        template_id: Filtrar por plantilla
+        patient_name: Filtrar por nombre del paciente (ver filter_patient_name)
+        month: Filtrar por mes de creación ('AAAA-MM')
+        fields: Lista de tuplas (campo, condiciones) de filter_by_field
+    """
+    reports = GeneratedReport.objects.all() if queryset is None else queryset
+
+    if user is not None and not user.is_superuser:
+        reports = reports.filter(created_by=user)
+
+    if template_id:
+        reports = reports.filter(template_id=template_id)
+
+    month_range = parse_month(month) if month else None
+    if month_range:
+        # Rango sobre created_at (y no __month/__year) para poder usar el índice
+        reports = reports.filter(created_at__gte=month_range[0], created_at__lt=month_range[1])
+
+    if patient_name:
+        reports = filter_patient_name(reports, patient_name)
+
+    for name, conditions in fields or ():
+        reports = filter_by_field(reports, name, **conditions)
+
+    return reports
+
+
+def encode_cursor(report):
+    raw = f"{report.created_at.isoformat()}|{report.pk}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Devuelve (created_at, id) o None si el cursor no es válido"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        created_at, pk = raw.rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, UnicodeError):
+        return None
+
+
+class KeysetPage:
+    """Página de resultados paginada por cursor (keyset_paginate, o search.search_page para las búsquedas)"""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+def keyset_paginate(queryset, after=None, before=None, page_size=50):
+    """
+    Pagina un QuerySet de informes por cursor, de más reciente a más antiguo
+
+    A diferencia de OFFSET, el coste de cada página no depende de su posición:
+    la consulta salta directamente al cursor gracias a los índices sobre
+    (created_at, id).
+
+    Args:
+        after: Cursor del último elemento de la página anterior
+        before: Cursor del primer elemento de la página siguiente (para retroceder)
+    """
+    after_key = decode_cursor(after) if after else None
+    before_key = decode_cursor(before) if before and not after_key else None
+
+    if before_key:
+        created_at, pk = before_key
+        rows = list(queryset.filter(
+            Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk)
+        ).order_by('created_at', 'id')[:page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size][::-1]
+        return KeysetPage(
+            rows,
+            next_cursor=encode_cursor(rows[-1]) if rows else None,
+            previous_cursor=encode_cursor(rows[0]) if rows and has_more else None,
+        )
+
+    if after_key:
+        created_at, pk = after_key
+        queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+
+    rows = list(queryset.order_by('-created_at', '-id')[:page_size + 1])
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    return KeysetPage(
+        rows,
+        next_cursor=encode_cursor(rows[-1]) if rows and has_more else None,
+        previous_cursor=encode_cursor(rows[0]) if rows and after_key else None,
+    )
@@ -0,0 +1,396 @@
+# dental_reports/rendering.py
+from collections import OrderedDict
+import copy
+import hashlib
+import json
+import logging
+import re
+import threading
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.template import Context, Engine, Library, Template
+from django.template.defaultfilters import date
+from django.template.defaulttags import NowNode, now as parse_now
+from django.utils import timezone
+
+from . import cache
+from .instrumentation import timed
+from .models import GeneratedReport
+from .revisions import materialize_texts
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TEMPLATE_CACHE_SIZE = 128
+DEFAULT_RENDER_CACHE_TIMEOUT = 600
+
+# Variable del contexto con la fecha y hora que da {% now %} en los informes.
+# Las plantillas no pueden leerla (las variables no empiezan por '_')
+CLOCK_CONTEXT_KEY = '_render_clock'
+
+
+class ReportNowNode(NowNode):
+    """{% now %} que usa la hora del contexto del informe, si la tiene, en lugar de la actual"""
+
+    def render(self, context):
+        clock = context.get(CLOCK_CONTEXT_KEY)
+        if clock is None:
+            return super().render(context)
+        if settings.USE_TZ and timezone.is_aware(clock):
+            clock = timezone.localtime(clock)
+        formatted = date(clock, self.format_string)
+        if self.asvar:
+            context[self.asvar] = formatted
+            return ''
+        return formatted
+
+
+report_tags = Library()
+
+
+@report_tags.tag
+def now(parser, token):
+    node = parse_now(parser, token)
+    return ReportNowNode(node.format_string, node.asvar)
+
+
+_report_engine = None
+
+
+def report_engine():
+    """El motor de plantillas por defecto con el {% now %} de los informes"""
+    global _report_engine
+    if _report_engine is None:
+        engine = copy.copy(Engine.get_default())
+        engine.template_builtins = [*engine.template_builtins, report_tags]
+        _report_engine = engine
+    return _report_engine
+
+
+class CompiledTemplateCache:
+    """
+    Caché LRU de plantillas Django ya compiladas (lexer + parser).
+
+    Las claves son (modelo, pk, updated_at), de modo que una plantilla editada
+    genera una clave nueva aunque no llegue la señal de invalidación.
+    Los objetos Template compilados son seguros para renderizar en paralelo.
+    """
+
+    def __init__(self, max_size=None):
+        self._max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def max_size(self):
+        if self._max_size is not None:
+            return self._max_size
+        return getattr(settings, 'DENTAL_REPORTS_TEMPLATE_CACHE_SIZE', DEFAULT_TEMPLATE_CACHE_SIZE)
+
+    @staticmethod
+    def make_key(template):
+        return (template._meta.label_lower, template.pk, template.updated_at)
+
+    def compile(self, template):
+        return Template(template.html_content, engine=report_engine())
+
+    def get(self, template):
+        """Devuelve la plantilla compilada, compilándola sólo si no está en caché"""
+        if template.pk is None:
+            # Plantillas sin guardar (p. ej. previsualizaciones): no se cachean
+            return self.compile(template)
+
+        key = self.make_key(template)
+        with self._lock:
+            compiled = self._entries.get(key)
+            if compiled is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return compiled
+            self.misses += 1
+
+        # Compilar fuera del lock para no bloquear al resto de hilos
+        compiled = self.compile(template)
+
+        with self._lock:
+            self._entries[key] = compiled
+            self._entries.move_to_end(key)
+            while len(self._entries) > max(self.max_size, 0):
+                self._entries.popitem(last=False)
+        return compiled
+
+    def invalidate(self, template):
+        """Elimina todas las versiones cacheadas de una plantilla"""
+        label, pk = template._meta.label_lower, template.pk
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == label and k[1] == pk]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / total if total else 0.0,
+            }
+
+
+# Caché compartida por todo el proceso
+template_cache = CompiledTemplateCache()
+
+
+def get_compiled_template(template):
+    """Obtiene la versión compilada de template.html_content"""
+    return template_cache.get(template)
+
+
+def render_report_html(template, context_data):
+    """
+    Renderiza el contenido HTML de una plantilla de informe con el contexto dado
+
+    Args:
+        template: Instancia de ReportTemplate
+        context_data: Diccionario con el contexto (paciente, medico, datos)
+
+    Returns:
+        String con el HTML renderizado
+    """
+    with timed('tpl'):
+        return get_compiled_template(template).render(Context(context_data))
+
+
+def build_report_context(template, cleaned_data, specialty_name=None, clock=None):
+    """
+    Contexto con el que se renderizan las plantillas de informe
+
+    Args:
+        specialty_name: Especialidad guardada con el informe (por defecto, la actual de la plantilla)
+        clock: Fecha y hora que muestra {% now %} (por defecto, la actual)
+    """
+    if specialty_name is None:
+        specialty_name = template.specialty.name if template.specialty else ''
+    context = {
+        'paciente': {
+            'nombre': cleaned_data.get('patient_name'),
+        },
+        'medico': {
+            'nombre': cleaned_data.get('doctor_name'),
+            'especialidad': specialty_name,
+        },
+        'datos': cleaned_data
+    }
+    if clock is not None:
+        context[CLOCK_CONTEXT_KEY] = clock
+    return context
+
+
+def serialize_form_data(cleaned_data):
+    """Convierte los datos validados (fechas, decimales...) en valores aptos para JSONField"""
+    return json.loads(json.dumps(cleaned_data, cls=DjangoJSONEncoder))
+
+
+def build_generated_report(template, cleaned_data, created_by=None):
+    """
+    Construye, sin guardarlo, el informe correspondiente a los datos de un formulario válido
+
+    Args:
+        template: Instancia de ReportTemplate
+        cleaned_data: cleaned_data de un DynamicReportForm válido
+        created_by: Usuario autor del informe
+
+    Returns:
+        Instancia de GeneratedReport sin guardar
+    """
+    patient_name = cleaned_data.get('patient_name')
+    # La misma hora para el HTML y, si se renderiza bajo demanda, para volver a generarlo
+    clock = timezone.now()
+    report = GeneratedReport(
+        template=template,
+        patient_name=patient_name,
+        doctor_name=cleaned_data.get('doctor_name'),
+        title=f"Informe para {patient_name} - {template.name}",
+        report_content=render_report_html(template, build_report_context(template, cleaned_data, clock=clock)),
+        form_data=serialize_form_data(cleaned_data),
+        created_by=created_by
+    )
+    if render_on_read_enabled():
+        make_render_on_read(report, clock=clock)
+    return report
+
+
+# --- Renderizado bajo demanda -------------------------------------------------
+#
+# Con DENTAL_REPORTS_RENDER_ON_READ un informe no guarda su HTML sino la versión
+# de la plantilla con la que se generó (template_version), lo que el HTML toma de
+# fuera de form_data en ese momento (la especialidad de la plantilla y la hora de
+# {% now %}: specialty_name y rendered_at) y la huella del HTML (content_hash).
+# El HTML se vuelve a renderizar al leerlo desde form_data y el historial de la
+# plantilla (revisions.py). Sólo se guarda así un informe si ese renderizado
+# coincide byte a byte con el original y la plantilla no usa filtros relativos a
+# la hora actual (|timesince, |timeuntil): si no, se guarda el HTML como siempre.
+
+# Filtros cuyo resultado depende de la hora a la que se renderiza
+RELATIVE_TIME_RE = re.compile(r'\|\s*(?:timesince|timeuntil)\b')
+
+
+class RenderMismatch(Exception):
+    """El informe renderizado bajo demanda no da el HTML de su huella (no hay otro HTML al que volver)"""
+
+    def __init__(self, report):
+        super().__init__(f"El informe {report.pk} renderizado bajo demanda no coincide con su huella")
+        self.report_id = report.pk
+
+
+def render_on_read_enabled():
+    return getattr(settings, 'DENTAL_REPORTS_RENDER_ON_READ', False)
+
+
+def content_hash(html):
+    return hashlib.sha256(html.encode('utf-8')).hexdigest()
+
+
+def uses_relative_time(html_content):
+    """True si la plantilla da un HTML distinto según la hora a la que se renderiza"""
+    return bool(RELATIVE_TIME_RE.search(html_content or ''))
+
+
+class TemplateVersion:
+    """El HTML de una plantilla en una versión concreta (las versiones no cambian)"""
+
+    def __init__(self, template, version):
+        self.template = template
+        self.version = version
+        self.pk = template.pk
+        self._meta = template._meta
+
+    @property
+    def html_content(self):
+        if self.version == self.template.version:
+            return self.template.html_content
+        return materialize_texts(self.template, self.version)['html_content']
+
+
+class TemplateVersionCache(CompiledTemplateCache):
+    """Caché LRU de plantillas compiladas por versión (no hace falta invalidarla)"""
+
+    @staticmethod
+    def make_key(template_version):
+        return (template_version._meta.label_lower, template_version.pk, template_version.version)
+
+
+version_cache = TemplateVersionCache()
+
+
+def render_report_version(template, version, form_data, specialty_name=None, clock=None):
+    """HTML de un informe renderizado con una versión de su plantilla y su form_data"""
+    with timed('tpl'):
+        compiled = version_cache.get(TemplateVersion(template, version))
+        return compiled.render(Context(build_report_context(template, form_data, specialty_name, clock)))
+
+
+def render_stored_version(report):
+    """HTML de un informe renderizado bajo demanda, con los datos guardados con él (sin caché)"""
+    return render_report_version(report.template, report.template_version, report.form_data,
+                                 report.specialty_name, report.rendered_at)
+
+
+def render_cache_timeout():
+    return getattr(settings, 'DENTAL_REPORTS_RENDER_CACHE_TIMEOUT', DEFAULT_RENDER_CACHE_TIMEOUT)
+
+
+def _render_checked(report):
+    html = render_stored_version(report)
+    if content_hash(html) != report.content_hash:
+        # No hay HTML guardado al que volver: no se sirve (ni se cachea) un HTML
+        # distinto del original; se avisa para revisarlo con convert_render_on_read
+        error = RenderMismatch(report)
+        logger.error(str(error))
+        raise error
+    return html
+
+
+def report_html(report):
+    """
+    Contenido HTML del informe: el guardado o, si se renderiza bajo demanda,
+    el renderizado (cacheado por versión de plantilla y huella del contenido)
+
+    Raises:
+        RenderMismatch si el renderizado no coincide con la huella guardada
+    """
+    if report.template_version is None:
+        return report.report_content
+    return cache.get_or_set(
+        'renders', (report.template_id, report.template_version, report.content_hash),
+        lambda: _render_checked(report),
+        timeout=render_cache_timeout(),
+    )
+
+
+def make_render_on_read(report, html=None, clock=None):
+    """
+    Pasa un informe (sin guardar los cambios) a renderizado bajo demanda si
+    renderizarlo desde form_data con la versión actual de la plantilla da
+    exactamente su HTML
+
+    Args:
+        clock: Hora con la que se renderizó el HTML (por defecto, la de creación del informe)
+
+    Returns:
+        True si se ha convertido
+    """
+    if report.template_version is not None:
+        return True
+    template = report.template
+    clock = report.created_at if clock is None else clock
+    if template is None or template.pk is None or report.plantilla_id or clock is None:
+        return False
+    if uses_relative_time(template.html_content):
+        return False
+    html = report.report_content if html is None else html
+    specialty_name = template.specialty.name if template.specialty else ''
+    if render_report_version(template, template.version, report.form_data, specialty_name, clock) != html:
+        return False
+    report.template_version = template.version
+    report.specialty_name = specialty_name
+    report.rendered_at = clock
+    report.content_hash = content_hash(html)
+    report.report_content = ''
+    return True
+
+
+def verify_render_on_read(report):
+    """True si el informe renderizado bajo demanda sigue dando el HTML de su huella (sin caché)"""
+    if report.template_version is None:
+        return True
+    return content_hash(render_stored_version(report)) == report.content_hash
+
+
+def freeze_report(report, html=None):
+    """
+    Vuelve a guardar el HTML de un informe renderizado bajo demanda (sin guardar los cambios)
+
+    Args:
+        html: HTML que se guarda (por defecto, el renderizado)
+
+    Raises:
+        RenderMismatch si el renderizado ya no da el HTML original
+    """
+    if report.template_version is None:
+        return
+    report.report_content = report_html(report) if html is None else html
+    report.template_version = None
+    report.specialty_name = ''
+    report.rendered_at = None
+    report.content_hash = ''
@@ -0,0 +1,230 @@
+# dental_reports/revisions.py
+"""
+Historial de versiones de plantillas e informes.
+
+Cada vez que cambia el contenido de una ReportTemplate (nombre, HTML,
+esquema de campos) o de un GeneratedReport (título, HTML, datos) se
+incrementa su `version` y se guarda una fila de revisión comprimida con zlib:
+
+- una instantánea con el contenido completo cada
+  DENTAL_REPORTS_REVISION_SNAPSHOT_EVERY versiones (y la primera),
+- y entre medias sólo las diferencias con la versión anterior.
+
+Al crear un objeto no se guarda ninguna revisión (su contenido ya está en la
+propia fila): la instantánea de la versión inicial se guarda con el primer cambio.
+
+Las diferencias se calculan sobre el texto partido en trozos que terminan en
+'>' o en salto de línea, así que editar una etiqueta de un HTML de una sola
+línea ocupa lo que ocupa la edición. Reconstruir cualquier versión supone
+leer una instantánea y, como mucho, SNAPSHOT_EVERY - 1 diferencias.
+"""
+from difflib import HtmlDiff, SequenceMatcher
+import json
+import re
+import zlib
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Max
+from django.db.models.functions import Length
+
+from .models import GeneratedReport, ReportRevision, ReportTemplate, TemplateRevision
+
+# Versiones entre dos instantáneas completas
+DEFAULT_REVISION_SNAPSHOT_EVERY = 20
+
+# Trozos del texto que se comparan: hasta el siguiente '>' o salto de línea
+TOKEN_RE = re.compile(r'[^>\n]*[>\n]|[^>\n]+')
+
+
+class RevisionSpec:
+    """Qué campos se versionan de un modelo y dónde se guardan sus revisiones"""
+
+    def __init__(self, revision_model, foreign_key, fields, json_fields):
+        self.revision_model = revision_model
+        self.foreign_key = foreign_key
+        self.fields = fields
+        self.json_fields = json_fields
+
+    def revisions(self, instance):
+        return self.revision_model.objects.filter(**{f'{self.foreign_key}_id': instance.pk})
+
+
+REVISION_SPECS = {
+    ReportTemplate: RevisionSpec(TemplateRevision, 'template', ('name', 'html_content', 'fields_schema'),
+                                 {'fields_schema'}),
+    GeneratedReport: RevisionSpec(ReportRevision, 'report', ('title', 'report_content', 'form_data'),
+                                  {'form_data'}),
+}
+
+
+def snapshot_every():
+    return getattr(settings, 'DENTAL_REPORTS_REVISION_SNAPSHOT_EVERY', DEFAULT_REVISION_SNAPSHOT_EVERY)
+
+
+def field_text(spec, field, value):
+    """Texto con el que se versiona un campo (los JSON, indentados y con las claves ordenadas)"""
+    if field in spec.json_fields:
+        return json.dumps(value, indent=1, sort_keys=True, ensure_ascii=False, cls=DjangoJSONEncoder)
+    return value or ''
+
+
+def content_texts(spec, values):
+    """Textos versionados a partir de un diccionario campo -> valor"""
+    return {field: field_text(spec, field, values.get(field)) for field in spec.fields}
+
+
+def instance_texts(instance):
+    spec = REVISION_SPECS[type(instance)]
+    return content_texts(spec, {field: getattr(instance, field) for field in spec.fields})
+
+
+def stored_state(instance):
+    """(versión, textos versionados) del objeto tal como está en la base de datos, o None"""
+    spec = REVISION_SPECS[type(instance)]
+    values = type(instance)._default_manager.filter(pk=instance.pk).values('version', *spec.fields).first()
+    if values is None:
+        return None
+    return values['version'], content_texts(spec, values)
+
+
+def _tokens(text):
+    return TOKEN_RE.findall(text)
+
+
+def make_delta(old_text, new_text):
+    """
+    Diferencias entre dos textos: lista de [inicio, fin] (trozos copiados del
+    texto anterior) y cadenas (texto nuevo)
+    """
+    old, new = _tokens(old_text), _tokens(new_text)
+    delta = []
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, old, new, autojunk=False).get_opcodes():
+        if tag == 'equal':
+            delta.append([i1, i2])
+        elif j2 > j1:
+            delta.append(''.join(new[j1:j2]))
+    return delta
+
+
+def apply_delta(old_text, delta):
+    old = _tokens(old_text)
+    return ''.join(part if isinstance(part, str) else ''.join(old[part[0]:part[1]]) for part in delta)
+
+
+def _encode(payload):
+    return zlib.compress(json.dumps(payload, separators=(',', ':'), ensure_ascii=False).encode('utf-8'))
+
+
+def _decode(data):
+    return json.loads(zlib.decompress(bytes(data)).decode('utf-8'))
+
+
+def record_revision(instance, version, texts, previous_texts=None):
+    """
+    Guarda una versión del objeto
+
+    Args:
+        texts: Textos versionados de esta versión
+        previous_texts: Textos de la versión anterior (None: guardar una instantánea)
+    """
+    spec = REVISION_SPECS[type(instance)]
+    revisions = spec.revisions(instance)
+    is_snapshot = previous_texts is None
+    if not is_snapshot:
+        last_snapshot = revisions.filter(is_snapshot=True).aggregate(version=Max('version'))['version']
+        is_snapshot = last_snapshot is None or version - last_snapshot >= snapshot_every()
+
+    if is_snapshot:
+        payload = texts
+    else:
+        payload = {field: make_delta(previous_texts[field], text)
+                   for field, text in texts.items() if text != previous_texts[field]}
+    return spec.revision_model.objects.create(
+        **{spec.foreign_key: instance}, version=version, is_snapshot=is_snapshot, data=_encode(payload))
+
+
+def record_change(instance, previous_version, previous_texts, texts):
+    """
+    Guarda la versión actual de un objeto cuyo contenido acaba de cambiar
+
+    Si el objeto es anterior al historial (no tiene ninguna revisión), antes se
+    guarda una instantánea de la versión anterior.
+    """
+    spec = REVISION_SPECS[type(instance)]
+    if not spec.revisions(instance).exists():
+        record_revision(instance, previous_version, previous_texts)
+    return record_revision(instance, instance.version, texts, previous_texts)
+
+
+def materialize_texts(instance, version=None):
+    """
+    Textos versionados de una versión (por defecto, la última guardada)
+
+    Raises:
+        LookupError si esa versión no está en el historial
+    """
+    spec = REVISION_SPECS[type(instance)]
+    revisions = spec.revisions(instance)
+    if version is None:
+        version = revisions.aggregate(version=Max('version'))['version']
+    snapshot = (revisions.filter(is_snapshot=True, version__lte=version or 0)
+                .order_by('-version').only('version', 'data').first())
+    if snapshot is None:
+        # Sin cambios desde que se creó: la única versión es la guardada en la fila
+        stored = stored_state(instance)
+        if stored is not None and version in (None, stored[0]) and not revisions.exists():
+            return stored[1]
+        raise LookupError(f"La versión {version} no está en el historial")
+
+    texts = _decode(snapshot.data)
+    current = snapshot.version
+    deltas = (revisions.filter(version__gt=snapshot.version, version__lte=version)
+              .order_by('version').values_list('version', 'data'))
+    for delta_version, data in deltas:
+        for field, delta in _decode(data).items():
+            texts[field] = apply_delta(texts[field], delta)
+        current = delta_version
+    if current != version:
+        raise LookupError(f"La versión {version} no está en el historial")
+    return texts
+
+
+def materialize(instance, version=None):
+    """Contenido (campo -> valor) de una versión del objeto"""
+    spec = REVISION_SPECS[type(instance)]
+    texts = materialize_texts(instance, version)
+    return {field: json.loads(text) if field in spec.json_fields else text for field, text in texts.items()}
+
+
+def revision_history(instance):
+    """Versiones guardadas, de la más reciente a la más antigua (sin descomprimir nada)"""
+    return list(
+        REVISION_SPECS[type(instance)].revisions(instance)
+        .annotate(size=Length('data'))
+        .order_by('-version')
+        .values('version', 'created_at', 'is_snapshot', 'size')
+    )
+
+
+def diff_tables(instance, from_version, to_version, context_lines=3):
+    """
+    Diferencias entre dos versiones, como tablas HTML de difflib
+
+    Returns:
+        Lista de (campo, tabla HTML) de los campos que cambian
+    """
+    old = materialize_texts(instance, from_version)
+    new = materialize_texts(instance, to_version)
+    differ = HtmlDiff(wrapcolumn=100)
+    tables = []
+    for field in REVISION_SPECS[type(instance)].fields:
+        if old[field] == new[field]:
+            continue
+        tables.append((field, differ.make_table(
+            [token.rstrip('\n') for token in _tokens(old[field])],
+            [token.rstrip('\n') for token in _tokens(new[field])],
+            f'Versión {from_version}', f'Versión {to_version}',
+            context=True, numlines=context_lines,
+        )))
+    return tables
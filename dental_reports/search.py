@@ -0,0 +1,345 @@
+# dental_reports/search.py
+"""
+Búsqueda de texto completo sobre los informes generados.
+
+El backend se elige con settings.DENTAL_REPORTS_SEARCH_BACKEND:
+  - 'auto' (por defecto): SQLite FTS5 si está disponible, si no búsqueda simple
+  - ruta a una clase que herede de BaseSearchBackend
+"""
+import logging
+import re
+import threading
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape, strip_tags
+from django.utils.module_loading import import_string
+from django.utils.safestring import mark_safe
+
+from .models import GeneratedReport
+from .normalization import fold_search_text
+from .queries import KeysetPage
+from .rendering import RenderMismatch, report_html
+
+logger = logging.getLogger(__name__)
+
+# Marcadores de resaltado que no pueden aparecer en el texto escapado
+HIGHLIGHT_START = '\x02'
+HIGHLIGHT_END = '\x03'
+
+
+def report_search_document(report):
+    """Campos indexados de un informe, como texto plano"""
+    form_data = report.form_data if isinstance(report.form_data, dict) else {}
+    return {
+        'title': report.title or '',
+        'patient_name': report.patient_name or '',
+        'doctor_name': report.doctor_name or '',
+        'content': strip_tags(_report_html_or_empty(report)),
+        'form_data': ' '.join(str(value) for value in form_data.values() if value not in (None, '')),
+    }
+
+
+def _report_html_or_empty(report):
+    # Un informe que ya no da su HTML se indexa sin contenido (rendering ya lo registra)
+    try:
+        return report_html(report) or ''
+    except RenderMismatch:
+        return ''
+
+
+def report_search_text(report):
+    """Campos indexados de un informe en un solo texto normalizado (columna search_text)"""
+    return fold_search_text('\n'.join(report_search_document(report).values()))
+
+
+def highlight(snippet):
+    """Escapa el fragmento y convierte los marcadores de resaltado en <mark>"""
+    return mark_safe(
+        escape(snippet).replace(HIGHLIGHT_START, '<mark>').replace(HIGHLIGHT_END, '</mark>')
+    )
+
+
+class BaseSearchBackend:
+    """Interfaz de los backends de búsqueda"""
+
+    def __init__(self, using='default'):
+        self.using = using
+
+    def ensure_index(self):
+        """Crea las estructuras del índice si hacen falta"""
+
+    def index_reports(self, reports):
+        """Añade o actualiza informes en el índice"""
+
+    def remove_reports(self, report_ids):
+        """Elimina informes del índice"""
+
+    def rebuild(self, batch_size=500):
+        """Reconstruye el índice completo. Devuelve el número de informes indexados"""
+        self.ensure_index()
+        self.clear()
+        total = 0
+        batch = []
+        for report in GeneratedReport.objects.order_by('id').iterator(chunk_size=batch_size):
+            batch.append(report)
+            if len(batch) >= batch_size:
+                self.index_reports(batch)
+                total += len(batch)
+                batch = []
+        if batch:
+            self.index_reports(batch)
+            total += len(batch)
+        return total
+
+    def clear(self):
+        """Vacía el índice"""
+
+    def search(self, query, queryset=None, limit=50, offset=0):
+        """
+        Busca informes
+
+        Args:
+            query: Texto introducido por el usuario
+            queryset: Restringe los resultados (p. ej. a los informes del usuario)
+            limit: Número máximo de resultados
+            offset: Resultados que se saltan (paginación)
+
+        Returns:
+            Lista de GeneratedReport ordenada por relevancia, con los atributos
+            `search_rank` y `search_snippet` (HTML seguro con <mark>)
+        """
+        raise NotImplementedError
+
+    def filter(self, query, queryset=None):
+        """
+        Todos los informes que coinciden con la búsqueda, sin límite ni orden de relevancia
+
+        Returns:
+            QuerySet de GeneratedReport (para exportar todos los resultados)
+        """
+        raise NotImplementedError
+
+
+class SimpleSearchBackend(BaseSearchBackend):
+    """
+    Búsqueda sin FTS5, válida para cualquier base de datos
+
+    El índice es la columna GeneratedReport.search_text: el texto plano ya
+    normalizado de cada informe, que report_content (comprimido) y los informes
+    renderizados bajo demanda no permiten consultar. La búsqueda es un LIKE sobre
+    esa columna, sin relevancia: los resultados salen del más reciente al más antiguo.
+    """
+
+    def index_reports(self, reports):
+        reports = [report for report in reports if report.pk]
+        for report in reports:
+            report.search_text = report_search_text(report)
+        # bulk_update no envía post_save: no vuelve a disparar la indexación
+        GeneratedReport.objects.bulk_update(reports, ['search_text'], batch_size=500)
+
+    def clear(self):
+        GeneratedReport.objects.update(search_text='')
+
+    def search(self, query, queryset=None, limit=50, offset=0):
+        query = query.strip()
+        if not query:
+            return []
+
+        results = list(self.filter(query, queryset).select_related('template')
+                       .order_by('-created_at', '-id')[offset:offset + limit])
+        for report in results:
+            report.search_rank = None
+            report.search_snippet = highlight(self._snippet(report, query))
+        return results
+
+    def filter(self, query, queryset=None):
+        queryset = GeneratedReport.objects.all() if queryset is None else queryset
+        query = query.strip()
+        if not query:
+            return queryset.none()
+        return queryset.filter(search_text__contains=fold_search_text(query))
+
+    def _snippet(self, report, query, width=60):
+        text = ' '.join(report_search_document(report).values())
+        folded = fold_search_text(text)
+        # Buscar en el texto normalizado sólo si conserva las posiciones del original
+        if len(folded) == len(text):
+            position = folded.find(fold_search_text(query))
+        else:
+            position = text.lower().find(query.lower())
+        if position < 0:
+            return text[:width * 2]
+        start = max(position - width, 0)
+        end = position + len(query)
+        return (('…' if start else '') + text[start:position] + HIGHLIGHT_START + text[position:end] +
+                HIGHLIGHT_END + text[end:end + width] + '…')
+
+
+class SQLiteFTS5Backend(BaseSearchBackend):
+    """Índice SQLite FTS5 con resultados ordenados por BM25 y fragmentos resaltados"""
+
+    table = 'dental_reports_report_fts'
+    columns = ('title', 'patient_name', 'doctor_name', 'content', 'form_data')
+    # Peso de cada columna en la puntuación BM25
+    weights = (10.0, 8.0, 4.0, 1.0, 2.0)
+
+    _availability = {}
+
+    @classmethod
+    def is_available(cls, using='default'):
+        """Comprueba (una vez por conexión) que la base de datos es SQLite con FTS5"""
+        if using not in cls._availability:
+            connection = connections[using]
+            available = False
+            if connection.vendor == 'sqlite':
+                try:
+                    with connection.cursor() as cursor:
+                        cursor.execute('CREATE VIRTUAL TABLE IF NOT EXISTS temp.fts5_probe USING fts5(x)')
+                        cursor.execute('DROP TABLE temp.fts5_probe')
+                    available = True
+                except DatabaseError:
+                    logger.warning('SQLite sin soporte FTS5: se usará la búsqueda simple')
+            cls._availability[using] = available
+        return cls._availability[using]
+
+    def ensure_index(self):
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} USING fts5("
+                f"{', '.join(self.columns)}, tokenize='unicode61 remove_diacritics 2')"
+            )
+
+    def index_reports(self, reports):
+        rows = []
+        for report in reports:
+            document = report_search_document(report)
+            rows.append([report.pk] + [document[column] for column in self.columns])
+        if not rows:
+            return
+        with connections[self.using].cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {self.table} WHERE rowid = %s", [[row[0]] for row in rows])
+            cursor.executemany(
+                f"INSERT INTO {self.table} (rowid, {', '.join(self.columns)}) "
+                f"VALUES (%s, {', '.join(['%s'] * len(self.columns))})",
+                rows,
+            )
+
+    def remove_reports(self, report_ids):
+        with connections[self.using].cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {self.table} WHERE rowid = %s", [[pk] for pk in report_ids])
+
+    def clear(self):
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table}")
+
+    @staticmethod
+    def build_match_query(query):
+        """Convierte el texto del usuario en una consulta FTS5 segura (la última palabra como prefijo)"""
+        terms = re.findall(r'\w+', query)
+        if not terms:
+            return None
+        return ' '.join(f'"{term}"' for term in terms) + '*'
+
+    def search(self, query, queryset=None, limit=50, offset=0):
+        match = self.build_match_query(query)
+        if match is None:
+            return []
+
+        sql = (
+            f"SELECT rowid, bm25({self.table}, {', '.join(str(w) for w in self.weights)}) AS rank, "
+            f"snippet({self.table}, -1, %s, %s, '…', 16) "
+            f"FROM {self.table} WHERE {self.table} MATCH %s"
+        )
+        params = [HIGHLIGHT_START, HIGHLIGHT_END, match]
+
+        if queryset is not None:
+            # Restringir dentro de la propia consulta para que el LIMIT se aplique después
+            subquery, subparams = queryset.order_by().values('id').query.sql_with_params()
+            sql += f" AND rowid IN ({subquery})"
+            params.extend(subparams)
+
+        sql += " ORDER BY rank, rowid DESC LIMIT %s OFFSET %s"
+        params.extend([limit, offset])
+
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(sql, params)
+            hits = cursor.fetchall()
+
+        reports = GeneratedReport.objects.select_related('template').in_bulk([hit[0] for hit in hits])
+        results = []
+        for report_id, rank, snippet in hits:
+            report = reports.get(report_id)
+            if report is None:
+                continue
+            report.search_rank = rank
+            report.search_snippet = highlight(snippet)
+            results.append(report)
+        return results
+
+    def filter(self, query, queryset=None):
+        queryset = GeneratedReport.objects.all() if queryset is None else queryset
+        match = self.build_match_query(query)
+        if match is None:
+            return queryset.none()
+        return queryset.filter(id__in=RawSQL(f"SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s",
+                                             [match]))
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_search_backend():
+    """Backend de búsqueda configurado (compartido por el proceso)"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                path = getattr(settings, 'DENTAL_REPORTS_SEARCH_BACKEND', 'auto')
+                if path == 'auto':
+                    backend_class = SQLiteFTS5Backend if SQLiteFTS5Backend.is_available() else SimpleSearchBackend
+                else:
+                    backend_class = import_string(path)
+                _backend = backend_class()
+    return _backend
+
+
+def search_reports(query, queryset=None, limit=50, offset=0):
+    """Atajo para buscar con el backend configurado"""
+    return get_search_backend().search(query, queryset=queryset, limit=limit, offset=offset)
+
+
+def _parse_offset(cursor):
+    try:
+        offset = int(cursor)
+    except (TypeError, ValueError):
+        return None
+    return offset if offset >= 0 else None
+
+
+def search_page(query, queryset=None, after=None, before=None, page_size=50):
+    """
+    Página de resultados de búsqueda, en orden de relevancia
+
+    Los resultados no siguen el orden de (created_at, id), así que se paginan
+    por posición. Los cursores tienen el mismo sentido que en keyset_paginate:
+    after es la posición del primer resultado de la página siguiente y before la
+    del primero de la página desde la que se retrocede.
+    """
+    offset = _parse_offset(after)
+    if offset is None:
+        before_offset = _parse_offset(before)
+        offset = max(before_offset - page_size, 0) if before_offset is not None else 0
+
+    # Uno de más para saber si hay página siguiente
+    results = search_reports(query, queryset=queryset, limit=page_size + 1, offset=offset)
+    next_cursor = str(offset + page_size) if len(results) > page_size else None
+    previous_cursor = str(offset) if offset else None
+    return KeysetPage(results[:page_size], next_cursor, previous_cursor)
+
+
+def filter_by_search(query, queryset=None):
+    """Atajo para filtrar todos los informes que coinciden con la búsqueda (exportaciones)"""
+    return get_search_backend().filter(query, queryset=queryset)
@@ -0,0 +1,215 @@
+# dental_reports/signals.py
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import cache, dashboard, projection, revisions
+from .models import ReportTemplate, GeneratedReport, DentalClinic, DentistContact, TemplateCategory, Plantilla
+from .pdf_cache import is_cached_pdf_path, release_cached_pdf
+from .plantillas import plan_cache
+from .rendering import content_hash, freeze_report, render_stored_version, template_cache
+from .search import get_search_backend
+
+
+@receiver(post_save, sender=ReportTemplate)
+@receiver(post_delete, sender=ReportTemplate)
+def invalidate_compiled_template(sender, instance, **kwargs):
+    """Descarta la plantilla compilada cuando se modifica o elimina"""
+    template_cache.invalidate(instance)
+
+
+@receiver(post_save, sender=Plantilla)
+@receiver(post_delete, sender=Plantilla)
+def invalidate_plantilla_plan(sender, instance, **kwargs):
+    """Descarta el plan compilado de una plantilla visual cuando se modifica o elimina"""
+    plan_cache.invalidate(instance)
+
+
+# Campos de GeneratedReport que alimentan el índice de búsqueda
+SEARCH_FIELDS = {'title', 'patient_name', 'doctor_name', 'report_content', 'form_data'}
+
+
+@receiver(post_save, sender=GeneratedReport)
+def index_report(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Mantiene actualizado el índice de búsqueda"""
+    if raw:
+        return
+    # Los cambios de estado del PDF no afectan al índice
+    if update_fields is not None and not SEARCH_FIELDS.intersection(update_fields):
+        return
+    get_search_backend().index_reports([instance])
+
+
+# Campos de GeneratedReport de los que sale la proyección ReportFieldValue
+PROJECTION_FIELDS = {'form_data', 'template', 'template_id'}
+
+
+@receiver(post_save, sender=GeneratedReport)
+def project_report_fields(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Regenera los valores de campo consultables del informe (se borran en cascada con él)"""
+    if raw:
+        return
+    if update_fields is not None and not PROJECTION_FIELDS.intersection(update_fields):
+        return
+    projection.sync_report_fields([instance])
+
+
+@receiver(pre_save, sender=ReportTemplate)
+@receiver(pre_save, sender=GeneratedReport)
+def bump_content_version(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Si cambia el contenido versionado, incrementa `version` y recuerda la versión anterior"""
+    if raw or instance._state.adding or instance.pk is None:
+        return
+    fields = revisions.REVISION_SPECS[sender].fields
+    if update_fields is not None and not set(fields).intersection(update_fields):
+        return
+    stored = revisions.stored_state(instance)
+    if stored is None:
+        return
+    version, previous = stored
+    # Con update_fields sólo se escriben esos campos: el resto queda como estaba
+    texts = {field: revisions.field_text(revisions.REVISION_SPECS[sender], field, getattr(instance, field))
+             if update_fields is None or field in update_fields else text
+             for field, text in previous.items()}
+    if texts == previous:
+        return
+    instance.version = version + 1
+    instance._revision_previous = (version, previous, texts)
+
+
+@receiver(post_save, sender=ReportTemplate)
+@receiver(post_save, sender=GeneratedReport)
+def record_content_revision(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """Guarda la versión nueva en el historial (instantánea o diferencias con la anterior)"""
+    # Al crearlo no se guarda nada: record_change guarda la instantánea de la
+    # primera versión cuando se modifica por primera vez
+    if raw or created or not hasattr(instance, '_revision_previous'):
+        return
+    version, previous, texts = instance.__dict__.pop('_revision_previous')
+    if update_fields is not None and 'version' not in update_fields:
+        sender._default_manager.filter(pk=instance.pk).update(version=instance.version)
+    revisions.record_change(instance, version, previous, texts)
+
+
+@receiver(pre_save, sender=GeneratedReport)
+def refresh_rendered_hash(sender, instance, raw=False, update_fields=None, **kwargs):
+    """
+    Los informes renderizados bajo demanda cambian si cambia su form_data: se recalcula la huella
+
+    Si se ha editado su HTML (report_content, vacío en estos informes), el
+    informe pasa a guardar ese HTML en lugar de descartar la edición.
+    """
+    # Al crearlo, make_render_on_read ya calculó la huella
+    if raw or instance._state.adding or instance.template_version is None:
+        return
+    if update_fields is not None:
+        if 'report_content' in update_fields and instance.report_content:
+            raise ValueError(f"El informe {instance.pk} se renderiza bajo demanda: para guardar su HTML "
+                             f"hay que guardarlo completo o llamar antes a freeze_report")
+        return
+    if instance.report_content:
+        freeze_report(instance, html=instance.report_content)
+        return
+    instance.content_hash = content_hash(render_stored_version(instance))
+
+
+@receiver(pre_delete, sender=ReportTemplate)
+def freeze_template_reports(sender, instance, **kwargs):
+    """Los informes renderizados bajo demanda con la plantilla que se borra vuelven a guardar su HTML"""
+    reports = list(GeneratedReport.objects.filter(template=instance, template_version__isnull=False))
+    for report in reports:
+        report.template = instance
+        freeze_report(report)
+    GeneratedReport.objects.bulk_update(
+        reports, ['report_content', 'template_version', 'specialty_name', 'rendered_at', 'content_hash'],
+        batch_size=500,
+    )
+
+
+@receiver(post_delete, sender=GeneratedReport)
+def unindex_report(sender, instance, **kwargs):
+    get_search_backend().remove_reports([instance.pk])
+
+
+@receiver(post_delete, sender=GeneratedReport)
+def delete_report_pdf(sender, instance, **kwargs):
+    """Borra el PDF del informe eliminado (los de la caché, sólo si ya no los usa ningún otro informe)"""
+    if not instance.pdf_file:
+        return
+    storage, name = instance.pdf_file.storage, instance.pdf_file.name
+    if is_cached_pdf_path(name):
+        transaction.on_commit(lambda: release_cached_pdf(name, storage))
+    else:
+        transaction.on_commit(lambda: storage.delete(name))
+
+
+@receiver(pre_save, sender=GeneratedReport)
+@receiver(pre_save, sender=DentistContact)
+def remember_counter_breakdown(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Guarda el valor anterior del campo de desglose para detectar reasignaciones"""
+    _, breakdown = dashboard.counter_group(sender)
+    if raw or instance._state.adding or instance.pk is None:
+        return
+    attname = sender._meta.get_field(breakdown).attname
+    if update_fields is not None and breakdown not in update_fields and attname not in update_fields:
+        return
+    instance._dashboard_breakdown = (
+        sender._default_manager.filter(pk=instance.pk).values_list(attname, flat=True).first()
+    )
+
+
+@receiver(post_save, sender=ReportTemplate)
+@receiver(post_save, sender=GeneratedReport)
+@receiver(post_save, sender=DentalClinic)
+@receiver(post_save, sender=DentistContact)
+def update_dashboard_on_save(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """Actualiza los contadores del panel y descarta el panel cacheado"""
+    if raw:
+        return
+    if created:
+        dashboard.record_created([instance])
+        return
+    if hasattr(instance, '_dashboard_breakdown'):
+        dashboard.record_reassigned(instance, instance.__dict__.pop('_dashboard_breakdown'))
+    if update_fields is None or not dashboard.IGNORED_UPDATE_FIELDS.issuperset(update_fields):
+        dashboard.invalidate_dashboard()
+
+
+@receiver(post_delete, sender=ReportTemplate)
+@receiver(post_delete, sender=GeneratedReport)
+@receiver(post_delete, sender=DentalClinic)
+@receiver(post_delete, sender=DentistContact)
+def update_dashboard_on_delete(sender, instance, **kwargs):
+    dashboard.record_deleted(instance)
+
+
+@receiver(post_delete, sender=User)
+def drop_user_dashboard_breakdowns(sender, instance, **kwargs):
+    dashboard.drop_breakdowns(instance)
+
+
+# Espacios de caché de los listados afectados por cada modelo
+CACHE_NAMESPACES = {
+    ReportTemplate: ('templates', 'categories'),
+    TemplateCategory: ('templates', 'categories'),
+    Plantilla: ('templates',),
+    DentalClinic: ('clinics', 'dentists'),
+    DentistContact: ('clinics', 'dentists'),
+}
+
+
+@receiver(post_save, sender=ReportTemplate)
+@receiver(post_save, sender=TemplateCategory)
+@receiver(post_save, sender=Plantilla)
+@receiver(post_save, sender=DentalClinic)
+@receiver(post_save, sender=DentistContact)
+@receiver(post_delete, sender=ReportTemplate)
+@receiver(post_delete, sender=TemplateCategory)
+@receiver(post_delete, sender=Plantilla)
+@receiver(post_delete, sender=DentalClinic)
+@receiver(post_delete, sender=DentistContact)
+def invalidate_cached_lists(sender, raw=False, **kwargs):
+    """Invalida los listados cacheados que muestran el objeto modificado"""
+    if not raw:
+        cache.invalidate(*CACHE_NAMESPACES[sender])
@@ -14,6 +14,7 @@ urlpatterns = [
     path('templates/new/', views.template_create, name='template_create'),
     path('templates/<int:pk>/', views.template_detail, name='template_detail'),
     path('templates/<int:pk>/edit/', views.template_edit, name='template_edit'),
+    path('templates/<int:pk>/history/', views.template_history, name='template_history'),
     path('templates/<int:template_id>/generate/', views.generate_report, name='generate_report'),
     path('templates/category/<int:category_id>/', views.template_list, name='template_category'),
 
@@ -24,9 +25,15 @@ urlpatterns = [
 
     # Informes generados
     path('reports/', views.report_list, name='report_list'),
+    path('reports/export/', views.report_export, name='report_export'),
+    path('reports/archive/', views.report_archive, name='report_archive'),
+    path('archives/<int:pk>/', views.archive_detail, name='archive_detail'),
+    path('archives/<int:pk>/download/', views.archive_download, name='archive_download'),
     path('reports/<int:pk>/', views.report_detail, name='report_detail'),
     path('reports/<int:pk>/pdf/', views.report_pdf, name='report_pdf'),
+    path('reports/<int:pk>/status/', views.report_status, name='report_status'),
     path('reports/<int:pk>/send/', views.send_report, name='send_report'),
+    path('reports/<int:pk>/history/', views.report_history, name='report_history'),
 
     # Clínicas dentales
     path('clinics/', views.clinic_list, name='clinic_list'),
@@ -40,6 +47,12 @@ urlpatterns = [
     path('dentists/<int:pk>/', views.dentist_detail, name='dentist_detail'),
     path('dentists/<int:pk>/edit/', views.dentist_edit, name='dentist_edit'),
 
+    # Estadísticas de la caché
+    path('cache/stats/', views.cache_stats, name='cache_stats'),
+
+    # Tiempos por vista (middleware de instrumentación)
+    path('metrics/', views.request_metrics, name='request_metrics'),
+
     # Utilidad para crear el módulo utils.py
     path('utils/create/', views.create_utils_module, name='create_utils_module'),
 
@@ -51,7 +64,12 @@ urlpatterns = [
     path('visual-editor/', views.editor_visual, name='editor_visual'),
     path('visual-editor/<int:template_id>/', views.editor_visual, name='editor_visual_edit'),
     path('api/save-template/', views.guardar_plantilla, name='guardar_plantilla'),
+    path('api/plantillas/<int:template_id>/', views.plantilla_contenido, name='plantilla_contenido'),
+    path('api/plantillas/<int:template_id>/patch/', views.guardar_plantilla_parche,
+         name='guardar_plantilla_parche'),
     path('visual-editor/<int:template_id>/preview/', views.vista_previa_plantilla, name='vista_previa_plantilla'),
+    path('visual-editor/<int:template_id>/generate/', views.generar_informe_plantilla,
+         name='generar_informe_plantilla'),
 
     # Nueva URL para integrar el editor visual dentro del flujo actual de creación de plantillas
     path('templates/new/visual/', views.editor_visual, name='template_create_visual'),
@@ -1,38 +1,40 @@
 # dental_reports/utils.py
 from io import BytesIO
-from django.http import HttpResponse
+from django.http import HttpResponse, FileResponse
 from django.core.files.base import ContentFile
 from django.template.loader import render_to_string
-from django.core.mail import EmailMultiAlternatives
-from django.utils.html import strip_tags
 from django.conf import settings
 from xhtml2pdf import pisa
-import os
+from xhtml2pdf.default import DEFAULT_CSS
+from importlib import metadata
+import hashlib
 import uuid
 import logging
 
+from .assets import asset_resolver
+from .instrumentation import record_value, timed
+
 # Configuración de logging
 logger = logging.getLogger(__name__)
 
+try:
+    XHTML2PDF_VERSION = metadata.version('xhtml2pdf')
+except metadata.PackageNotFoundError:
+    XHTML2PDF_VERSION = 'desconocida'
+
+# Versión del renderizador de PDFs. Cambiarla invalida todos los PDF cacheados.
+PDF_RENDERER_VERSION = f"2-xhtml2pdf-{XHTML2PDF_VERSION}"
+
 
 def link_callback(uri, rel):
     """
-    Convierte URIs de HTML a rutas absolutas del sistema de archivos
+    Convierte URIs de HTML en lo que necesita xhtml2pdf: rutas absolutas del
+    sistema de archivos o, para las imágenes, URIs data: ya preparadas
+
+    Las rutas y las imágenes se memorizan entre renderizados (ver assets.py).
     """
     try:
-        if uri.startswith(settings.MEDIA_URL):
-            path = os.path.join(settings.MEDIA_ROOT, uri.replace(settings.MEDIA_URL, ""))
-        elif uri.startswith(settings.STATIC_URL):
-            path = os.path.join(settings.STATIC_ROOT, uri.replace(settings.STATIC_URL, ""))
-        else:
-            return uri
-
-        # Verificar si el archivo existe
-        if not os.path.isfile(path):
-            logger.warning(f'Media URI {uri} no encontrado')
-            return uri  # Devolver URI original si no se encuentra, en lugar de lanzar excepción
-
-        return path
+        return asset_resolver.link_callback(uri, rel)
     except Exception as e:
         logger.error(f'Error en link_callback: {e}')
         return uri  # Devolver URI original en caso de error
@@ -50,123 +52,214 @@ def generate_pdf_from_template(template_name, context=None):
     return generate_pdf_from_html(html_content)
 
 
-def generate_pdf_from_html(html_content):
+# Estilos de página del PDF. Se mantienen en el documento porque las reglas
+# @page configuran los marcos de la página del contexto de cada documento.
+PDF_PAGE_CSS = """
+    @page {
+        size: A4;
+        margin: 2cm;
+    }
+    .footer {
+        position: fixed;
+        bottom: 0;
+        width: 100%;
+        text-align: center;
+        font-size: 10px;
+        color: #7f8c8d;
+        padding-bottom: 10px;
+    }
+    .page-number:before {
+        content: "Página " counter(page) " de " counter(pages);
+    }
+"""
+
+# Estilos base de los informes, añadidos a la hoja por defecto de xhtml2pdf
+PDF_BASE_CSS = """
+    body {
+        font-family: Arial, sans-serif;
+        font-size: 12px;
+        line-height: 1.5;
+    }
+    h1 {
+        font-size: 18px;
+        text-align: center;
+        color: #2c3e50;
+        margin-bottom: 20px;
+    }
+    h2 {
+        font-size: 16px;
+        color: #3498db;
+        margin-top: 15px;
+    }
+    h3 {
+        font-size: 14px;
+        color: #2c3e50;
+    }
+    table {
+        width: 100%;
+        border-collapse: collapse;
+        margin-bottom: 15px;
+    }
+    table, th, td {
+        border: 1px solid #ddd;
+    }
+    th, td {
+        padding: 8px;
+        text-align: left;
+    }
+    th {
+        background-color: #f2f2f2;
+        font-weight: bold;
+    }
+    img {
+        max-width: 100%;
+        height: auto;
+    }
+    .header {
+        display: table;
+        width: 100%;
+        margin-bottom: 20px;
+    }
+    .header-left {
+        display: table-cell;
+        width: 50%;
+    }
+    .header-right {
+        display: table-cell;
+        width: 50%;
+        text-align: right;
+    }
+"""
+
+
+class PdfRenderer:
     """
-    Genera un PDF a partir de contenido HTML
+    Motor de renderizado de PDFs de informes.
+
+    La hoja de estilos por defecto (la de xhtml2pdf más los estilos de los
+    informes) y el documento que envuelve al informe se
+    preparan una sola vez al crear el renderizador; cada renderizado sólo
+    concatena el contenido del informe.
+    """
+
+    def __init__(self):
+        self.default_css = '\n'.join([DEFAULT_CSS, PDF_BASE_CSS])
+
+        # Documento base partido alrededor del contenido del informe
+        self._shell_head = (
+            '<!DOCTYPE html>\n<html>\n<head>\n'
+            '<meta charset="UTF-8">\n<title>Informe Dental</title>\n'
+            f'<style>{PDF_PAGE_CSS}</style>\n'
+            '</head>\n<body>\n'
+        )
+        self._shell_tail = (
+            '\n<div class="footer">\n<span class="page-number"></span>\n</div>\n'
+            '</body>\n</html>\n'
+        )
+
+        # Identifica la combinación de estilos para la caché de PDFs
+        self.fingerprint = hashlib.sha256(
+            f"{PDF_RENDERER_VERSION}\0{self.default_css}\0{self._shell_head}{self._shell_tail}".encode('utf-8')
+        ).hexdigest()[:16]
+
+    def build_html(self, html_content):
+        """Envuelve el contenido de un informe en el documento que se pasa a xhtml2pdf"""
+        return self._shell_head + html_content + self._shell_tail
+
+    def render_document(self, styled_html):
+        """
+        Convierte un documento completo (ver build_html) en bytes PDF
+
+        Returns:
+            bytes con el PDF generado o None si hay error
+        """
+        result = BytesIO()
+
+        try:
+            with timed('pdf'):
+                pdf = pisa.pisaDocument(
+                    BytesIO(styled_html.encode("UTF-8")),
+                    result,
+                    link_callback=link_callback,
+                    encoding='utf-8',
+                    default_css=self.default_css,
+                )
+
+            if not pdf.err:
+                pdf_bytes = result.getvalue()
+                record_value('pdf_bytes', len(pdf_bytes))
+                return pdf_bytes
+            else:
+                logger.error(f"Error al generar PDF: {pdf.err}")
+                return None
+        except Exception as e:
+            logger.error(f"Excepción al generar PDF: {str(e)}")
+            return None
+
+    def render_bytes(self, html_content):
+        """Renderiza el contenido de un informe a bytes PDF (o None si hay error)"""
+        return self.render_document(self.build_html(html_content))
+
+    def render_response(self, html_content, filename="informe.pdf", as_attachment=False):
+        """
+        Renderiza el contenido de un informe como respuesta HTTP en streaming
+
+        Returns:
+            FileResponse con el PDF o HttpResponse con el mensaje de error
+        """
+        pdf_bytes = self.render_bytes(html_content)
+        if pdf_bytes is None:
+            return HttpResponse('Error al generar el PDF: Problema de conversión.', content_type='text/plain',
+                                status=500)
+        return FileResponse(BytesIO(pdf_bytes), content_type='application/pdf',
+                            as_attachment=as_attachment, filename=filename)
+
+
+_pdf_renderer = PdfRenderer()
+
+
+def get_pdf_renderer():
+    """Devuelve el renderizador de PDFs (compartido por el proceso)"""
+    return _pdf_renderer
+
+
+def build_pdf_html(html_content):
+    """
+    Envuelve el contenido de un informe en el documento HTML del PDF
 
     Args:
         html_content: String con contenido HTML
 
     Returns:
-        ContentFile con el PDF generado o None si hay error
+        String con el documento HTML completo que se pasa a xhtml2pdf
     """
-    result = BytesIO()
-
-    # Añadir estilos básicos para el PDF
-    styled_html = f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <meta charset="UTF-8">
-        <title>Informe Dental</title>
-        <style>
-            @page {{
-                size: A4;
-                margin: 2cm;
-            }}
-            body {{ 
-                font-family: Arial, sans-serif; 
-                font-size: 12px; 
-                line-height: 1.5;
-            }}
-            h1 {{ 
-                font-size: 18px; 
-                text-align: center; 
-                color: #2c3e50;
-                margin-bottom: 20px;
-            }}
-            h2 {{ 
-                font-size: 16px; 
-                color: #3498db;
-                margin-top: 15px;
-            }}
-            h3 {{ 
-                font-size: 14px; 
-                color: #2c3e50;
-            }}
-            table {{ 
-                width: 100%; 
-                border-collapse: collapse; 
-                margin-bottom: 15px;
-            }}
-            table, th, td {{ 
-                border: 1px solid #ddd; 
-            }}
-            th, td {{ 
-                padding: 8px; 
-                text-align: left; 
-            }}
-            th {{ 
-                background-color: #f2f2f2; 
-                font-weight: bold;
-            }}
-            img {{ 
-                max-width: 100%; 
-                height: auto; 
-            }}
-            .header {{ 
-                display: table;
-                width: 100%;
-                margin-bottom: 20px;
-            }}
-            .header-left {{
-                display: table-cell;
-                width: 50%;
-            }}
-            .header-right {{
-                display: table-cell;
-                width: 50%;
-                text-align: right;
-            }}
-            .footer {{
-                position: fixed;
-                bottom: 0;
-                width: 100%;
-                text-align: center;
-                font-size: 10px;
-                color: #7f8c8d;
-                padding-bottom: 10px;
-            }}
-            .page-number:before {{
-                content: "Página " counter(page) " de " counter(pages);
-            }}
-        </style>
-    </head>
-    <body>
-        {html_content}
-        <div class="footer">
-            <span class="page-number"></span>
-        </div>
-    </body>
-    </html>
+    return get_pdf_renderer().build_html(html_content)
+
+
+def render_pdf_bytes(styled_html):
     """
+    Convierte un documento HTML completo (ver build_pdf_html) en bytes PDF
 
-    try:
-        pdf = pisa.pisaDocument(
-            BytesIO(styled_html.encode("UTF-8")),
-            result,
-            link_callback=link_callback,
-            encoding='utf-8'
-        )
+    Returns:
+        bytes con el PDF generado o None si hay error
+    """
+    return get_pdf_renderer().render_document(styled_html)
 
-        if not pdf.err:
-            return ContentFile(result.getvalue())
-        else:
-            logger.error(f"Error al generar PDF: {pdf.err}")
-            return None
-    except Exception as e:
-        logger.error(f"Excepción al generar PDF: {str(e)}")
+
+def generate_pdf_from_html(html_content):
+    """
+    Genera un PDF a partir de contenido HTML
+
+    Args:
+        html_content: String con contenido HTML
+
+    Returns:
+        ContentFile con el PDF generado o None si hay error
+    """
+    pdf_bytes = get_pdf_renderer().render_bytes(html_content)
+    if pdf_bytes is None:
         return None
+    return ContentFile(pdf_bytes)
 
 
 def html_to_pdf_response(html_content, filename="informe.pdf", as_attachment=False):
@@ -180,119 +273,19 @@ def html_to_pdf_response(html_content, filename="informe.pdf", as_attachment=Fal
                       Si es False, muestra el PDF en el navegador
 
     Returns:
-        HttpResponse con el PDF o mensaje de error
-    """
-    result = BytesIO()
-
-    # Añadir estilos básicos para el PDF
-    styled_html = f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <meta charset="UTF-8">
-        <title>Informe Dental</title>
-        <style>
-            @page {{
-                size: A4;
-                margin: 2cm;
-            }}
-            body {{ 
-                font-family: Arial, sans-serif; 
-                font-size: 12px; 
-                line-height: 1.5;
-            }}
-            h1 {{ 
-                font-size: 18px; 
-                text-align: center; 
-                color: #2c3e50;
-                margin-bottom: 20px;
-            }}
-            h2 {{ 
-                font-size: 16px; 
-                color: #3498db;
-                margin-top: 15px;
-            }}
-            h3 {{ 
-                font-size: 14px; 
-                color: #2c3e50;
-            }}
-            table {{ 
-                width: 100%; 
-                border-collapse: collapse; 
-                margin-bottom: 15px;
-            }}
-            table, th, td {{ 
-                border: 1px solid #ddd; 
-            }}
-            th, td {{ 
-                padding: 8px; 
-                text-align: left; 
-            }}
-            th {{ 
-                background-color: #f2f2f2; 
-                font-weight: bold;
-            }}
-            img {{ 
-                max-width: 100%; 
-                height: auto; 
-            }}
-            .header {{ 
-                display: table;
-                width: 100%;
-                margin-bottom: 20px;
-            }}
-            .header-left {{
-                display: table-cell;
-                width: 50%;
-            }}
-            .header-right {{
-                display: table-cell;
-                width: 50%;
-                text-align: right;
-            }}
-            .footer {{
-                position: fixed;
-                bottom: 0;
-                width: 100%;
-                text-align: center;
-                font-size: 10px;
-                color: #7f8c8d;
-                padding-bottom: 10px;
-            }}
-            .page-number:before {{
-                content: "Página " counter(page) " de " counter(pages);
-            }}
-        </style>
-    </head>
-    <body>
-        {html_content}
-        <div class="footer">
-            <span class="page-number"></span>
-        </div>
-    </body>
-    </html>
+        FileResponse con el PDF o HttpResponse con el mensaje de error
     """
+    from .pdf_cache import get_or_render_pdf
 
-    try:
-        pdf = pisa.pisaDocument(
-            BytesIO(styled_html.encode("UTF-8")),
-            result,
-            link_callback=link_callback,
-            encoding='utf-8'
-        )
+    cached_pdf = get_or_render_pdf(html_content)
+    if cached_pdf is None:
+        return HttpResponse('Error al generar el PDF: Problema de conversión.', content_type='text/plain',
+                            status=500)
 
-        if not pdf.err:
-            response = HttpResponse(result.getvalue(), content_type='application/pdf')
-            disposition = 'attachment' if as_attachment else 'inline'
-            response['Content-Disposition'] = f'{disposition}; filename="{filename}"'
-            return response
-        else:
-            logger.error(f"Error al generar PDF para respuesta: {pdf.err}")
-            return HttpResponse('Error al generar el PDF: Problema de conversión.', content_type='text/plain',
-                                status=500)
-    except Exception as e:
-        logger.error(f"Excepción al generar PDF para respuesta: {str(e)}")
-        return HttpResponse(f'Error al generar el PDF: {str(e)}', content_type='text/plain', status=500)
+    response = FileResponse(cached_pdf.open(), content_type='application/pdf',
+                            as_attachment=as_attachment, filename=filename)
+    response['ETag'] = cached_pdf.etag
+    return response
 
 
 def save_pdf_to_model(model_instance, html_content, field_name='pdf_file', filename=None):
@@ -308,30 +301,37 @@ def save_pdf_to_model(model_instance, html_content, field_name='pdf_file', filen
     Returns:
         bool: True si se guardó correctamente, False en caso contrario
     """
+    from .pdf_cache import get_or_render_pdf
+
     if filename is None:
         filename = f"report_{uuid.uuid4().hex}.pdf"
 
-    pdf_content = generate_pdf_from_html(html_content)
-    if pdf_content:
+    cached_pdf = get_or_render_pdf(html_content)
+    if cached_pdf:
+        pdf_content = ContentFile(cached_pdf.read())
+
         # Obtener el campo FileField del modelo
         file_field = getattr(model_instance, field_name)
+        previous_name = file_field.name if file_field else None
 
-        # Si ya existe un archivo, eliminarlo para no acumular archivos
-        if file_field:
+        # Guardar el nuevo archivo antes de eliminar el anterior, para no dejar
+        # el campo apuntando a un archivo borrado si algo falla
+        file_field.save(filename, pdf_content, save=True)
+        if previous_name and previous_name != file_field.name:
             try:
-                file_field.delete(save=False)
+                file_field.storage.delete(previous_name)
             except Exception as e:
                 logger.warning(f"No se pudo eliminar el archivo PDF anterior: {e}")
-
-        # Guardar el nuevo archivo
-        file_field.save(filename, pdf_content, save=True)
         return True
     return False
 
 
 def send_report_email(report, dentist, subject=None, message=None, template=None):
     """
-    Envía un informe por email a un dentista
+    Encola el envío de un informe por email a un dentista
+
+    El correo lo envía el trabajador de la bandeja de salida (`manage.py send_outbox`),
+    fuera de la petición y reutilizando la conexión SMTP.
 
     Args:
         report: Objeto Report (informe a enviar)
@@ -341,49 +341,13 @@ def send_report_email(report, dentist, subject=None, message=None, template=None
         template: Plantilla de email a utilizar (opcional)
 
     Returns:
-        bool: True si se envió correctamente, False en caso contrario
+        bool: True si se encoló correctamente, False en caso contrario
     """
-    try:
-        if not subject:
-            subject = f"Informe dental: {report.title}"
-
-        context = {
-            'report': report,
-            'dentist': dentist,
-            'message': message or ""
-        }
-
-        if template:
-            # Usar plantilla HTML para el email
-            html_content = render_to_string(f'dental_reports/email_templates/{template}.html', context)
-            text_content = strip_tags(html_content)
-        else:
-            # Email simple sin plantilla HTML
-            text_content = message or f"Adjuntamos el informe dental {report.title} para el paciente {report.patient_name}."
-            html_content = f"<p>{text_content}</p>"
-
-        email = EmailMultiAlternatives(
-            subject=subject,
-            body=text_content,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            to=[dentist.email]
-        )
+    from .mail import queue_report_email
 
-        email.attach_alternative(html_content, "text/html")
-
-        # Adjuntar el PDF si existe
-        if report.pdf_file and hasattr(report.pdf_file, 'path') and os.path.exists(report.pdf_file.path):
-            with open(report.pdf_file.path, 'rb') as f:
-                email.attach(f"Informe_{report.title}.pdf", f.read(), 'application/pdf')
-        else:
-            # Si no hay PDF guardado, generarlo al vuelo
-            html_content = render_to_string('dental_reports/pdf_templates/report.html', {'report': report})
-            pdf_content = generate_pdf_from_html(html_content)
-            if pdf_content:
-                email.attach(f"Informe_{report.title}.pdf", pdf_content.read(), 'application/pdf')
-
-        email.send()
+    try:
+        queue_report_email(report, dentist, subject=subject, message=message, template=template)
         return True
     except Exception as e:
-        logger.error(f"Error al enviar email con informe: {e}")
+        logger.error(f"Error al encolar email con informe: {e}")
         return False
@@ -1,43 +1,63 @@
 # dental_reports/views.py
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.template import Template, Context
-from django.http import HttpResponse, JsonResponse
+from django.http import HttpResponse, JsonResponse, FileResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.utils import timezone
 from django.db.models import Count
 from django.views.decorators.http import require_POST
+from django.conf import settings
 import json
 
 from .models import (
-    ReportTemplate, TemplateCategory, Specialty, GeneratedReport,
+    ReportTemplate, TemplateCategory, Specialty, GeneratedReport, ReportArchive,
     DentalClinic, DentistContact, TipoBloque, BloquePreconfigurado, Plantilla, Variable
 )
 from .forms import TemplateForm, DynamicReportForm, DentalClinicForm, DentistContactForm, TemplateCategoryForm
-from .utils import generate_pdf_from_html, html_to_pdf_response
+from .rendering import RenderMismatch, build_generated_report
+from .plantillas import build_plantilla_report, get_plan, render_plantilla_html
+from .patches import RevisionConflict, current_contenido, patch_plantilla, save_plantilla_snapshot
+from .revisions import diff_tables, revision_history
+from .dashboard import counter_breakdown, get_dashboard
+from .cache import cache_stats as namespace_cache_stats, cached_view
+from .instrumentation import metrics_snapshot
+from .mail import queue_report_for_dentists
+from .jobs import enqueue_report_pdf, ensure_report_pdf, pdf_is_stale, report_pdf_key
+from .queries import FIELD_PARAM_PREFIX, field_filters_from_params, filter_reports, keyset_paginate
+from .search import filter_by_search, search_page
+from .export import EXPORT_FORMATS, iter_export
+from .archives import (
+    archive_queryset, can_stream, create_archive, iter_zip, report_zip_entries, zip_max_reports, zip_stream_limit
+)
+
+# Informes por página en el listado
+REPORTS_PER_PAGE = 50
 
 
 def home(request):
     """Vista de inicio mejorada con estadísticas y elementos recientes"""
-    templates_count = ReportTemplate.objects.count()
-    reports_count = GeneratedReport.objects.count()
-    clinics_count = DentalClinic.objects.count()
-    dentists_count = DentistContact.objects.count()
-
-    recent_templates = ReportTemplate.objects.filter(is_active=True).order_by('-created_at')[:5]
-    recent_reports = GeneratedReport.objects.order_by('-created_at')[:5]
+    # Contadores y elementos recientes en una sola lectura de la caché
+    dashboard = get_dashboard()
+    counters = dashboard['counters']
 
     context = {
-        'templates_count': templates_count,
-        'reports_count': reports_count,
-        'clinics_count': clinics_count,
-        'dentists_count': dentists_count,
-        'recent_templates': recent_templates,
-        'recent_reports': recent_reports
+        'templates_count': counters.get('templates', 0),
+        'reports_count': counters.get('reports', 0),
+        'clinics_count': counters.get('clinics', 0),
+        'dentists_count': counters.get('dentists', 0),
+        'recent_templates': dashboard['recent_templates'],
+        'recent_reports': dashboard['recent_reports']
     }
+    if request.user.is_authenticated:
+        context['my_reports_count'] = counter_breakdown(dashboard, 'reports').get(request.user.pk, 0)
     return render(request, 'dental_reports/home.html', context)
 
 
 @login_required
+@cached_view('templates')
 def template_list(request):
     """Vista para listar plantillas de informes con filtrado mejorado"""
     category_id = request.GET.get('category')
@@ -70,7 +90,7 @@ def template_create(request):
         if form.is_valid():
             template = form.save()
             messages.success(request, f"Plantilla '{template.name}' creada con éxito.")
-            return redirect('template_detail', pk=template.pk)
+            return redirect('dental_reports:template_detail', pk=template.pk)
     else:
         form = TemplateForm(user=request.user)
 
@@ -110,14 +130,14 @@ def template_edit(request, pk):
     # Validar permisos - solo el creador o un superusuario pueden editar
     if template.created_by != request.user and not request.user.is_superuser:
         messages.error(request, "No tienes permiso para editar esta plantilla.")
-        return redirect('template_detail', pk=template.pk)
+        return redirect('dental_reports:template_detail', pk=template.pk)
 
     if request.method == 'POST':
         form = TemplateForm(request.POST, instance=template, user=request.user)
         if form.is_valid():
             template = form.save()
             messages.success(request, f"Plantilla '{template.name}' actualizada con éxito.")
-            return redirect('template_detail', pk=template.pk)
+            return redirect('dental_reports:template_detail', pk=template.pk)
     else:
         form = TemplateForm(instance=template, user=request.user)
 
@@ -146,52 +166,26 @@ def generate_report(request, template_id):
         form = DynamicReportForm(request.POST, template=template)
 
         if form.is_valid():
-            # Obtener datos del paciente y médico
-            patient_name = form.cleaned_data.get('patient_name')
-            doctor_name = form.cleaned_data.get('doctor_name')
-
-            # Crear contexto con todos los datos
-            context_data = {
-                'paciente': {
-                    'nombre': patient_name,
-                },
-                'medico': {
-                    'nombre': doctor_name,
-                    'especialidad': template.specialty.name if template.specialty else '',
-                },
-                'datos': form.cleaned_data
-            }
-
             # Renderizar la plantilla con los datos
             try:
-                html_template = Template(template.html_content)
-                html_context = Context(context_data)
-                rendered_content = html_template.render(html_context)
-
                 # Crear el informe en la base de datos
-                report = GeneratedReport(
-                    template=template,
-                    patient_name=patient_name,
-                    doctor_name=doctor_name,
-                    title=f"Informe para {patient_name} - {template.name}",
-                    report_content=rendered_content,
-                    form_data=form.cleaned_data,
-                    created_by=request.user
-                )
-
-                # Generar PDF
-                pdf_file = generate_pdf_from_html(rendered_content)
-                if pdf_file:
-                    filename = f"informe_{patient_name.replace(' ', '_')}_{template.name.replace(' ', '_')}.pdf"
-                    report.pdf_file.save(filename, pdf_file)
-
+                report = build_generated_report(template, form.cleaned_data, created_by=request.user)
                 report.save()
 
-                messages.success(request, "Informe generado con éxito.")
-                return redirect('report_detail', pk=report.id)
+                # Generar PDF: en segundo plano salvo que se haya desactivado la cola
+                if getattr(settings, 'DENTAL_REPORTS_PDF_ASYNC', True):
+                    enqueue_report_pdf(report)
+                else:
+                    pdf_file = ensure_report_pdf(report)
+                    if pdf_file:
+                        pdf_file.close()
 
             except Exception as e:
                 messages.error(request, f"Error al generar el informe: {str(e)}")
+            else:
+                # Fuera del try: el informe ya está guardado y no debe mostrarse como error
+                messages.success(request, "Informe generado con éxito.")
+                return redirect('dental_reports:report_detail', pk=report.id)
     else:
         # Crear formulario dinámico inicial
         form = DynamicReportForm(template=template)
@@ -206,36 +200,147 @@ def generate_report(request, template_id):
     })
 
 
+def filtered_reports_for_request(request, params):
+    """Informes visibles para el usuario con los filtros del listado (plantilla, paciente, mes, campos y búsqueda)"""
+    reports = filter_reports(
+        user=request.user,
+        template_id=params.get('template'),
+        patient_name=params.get('patient'),
+        month=params.get('month'),
+        fields=field_filters_from_params(params),
+    )
+    search_query = params.get('q', '').strip()
+    if search_query:
+        # Todos los resultados, no sólo los primeros por relevancia: se exportan completos
+        reports = filter_by_search(search_query, queryset=reports)
+    return reports
+
+
 @login_required
 def report_list(request):
-    """Lista de informes generados con opciones de filtrado"""
+    """Lista de informes generados con opciones de filtrado, paginada por cursor"""
     # Filtrar por template si se especifica
     template_id = request.GET.get('template')
     patient_name = request.GET.get('patient')
-
-    reports = GeneratedReport.objects.all().order_by('-created_at')
-
-    if template_id:
-        reports = reports.filter(template_id=template_id)
-
-    if patient_name:
-        reports = reports.filter(patient_name__icontains=patient_name)
-
-    # Si no es superusuario, mostrar solo sus informes
-    if not request.user.is_superuser:
-        reports = reports.filter(created_by=request.user)
+    month = request.GET.get('month')
+    search_query = request.GET.get('q', '').strip()
+
+    reports = filter_reports(
+        GeneratedReport.objects.select_related('template'),
+        user=request.user,
+        template_id=template_id,
+        patient_name=patient_name,
+        month=month,
+        fields=field_filters_from_params(request.GET),
+    )
+    if search_query:
+        # Resultados ordenados por relevancia: paginados por posición
+        page = search_page(
+            search_query,
+            queryset=reports,
+            after=request.GET.get('after'),
+            before=request.GET.get('before'),
+            page_size=REPORTS_PER_PAGE,
+        )
+    else:
+        page = keyset_paginate(
+            reports,
+            after=request.GET.get('after'),
+            before=request.GET.get('before'),
+            page_size=REPORTS_PER_PAGE,
+        )
+
+    # Parámetros de filtrado que se conservan en los enlaces de paginación
+    filter_params = request.GET.copy()
+    for param in ('after', 'before'):
+        filter_params.pop(param, None)
 
     # Datos para filtros
     templates = ReportTemplate.objects.filter(is_active=True).order_by('name')
 
     return render(request, 'dental_reports/report_list.html', {
-        'reports': reports,
+        'reports': page,
+        'page': page,
+        'filter_query': filter_params.urlencode(),
         'templates': templates,
         'selected_template': template_id,
-        'patient_search': patient_name
+        'patient_search': patient_name,
+        'selected_month': month,
+        'search_query': search_query,
+        'field_filters': [(key, value) for key, value in request.GET.items()
+                          if key.startswith(FIELD_PARAM_PREFIX)],
     })
 
 
+@login_required
+def report_export(request):
+    """Exporta en streaming (CSV o JSONL) los informes con los mismos filtros que el listado"""
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return HttpResponse("Formato de exportación no válido.", status=400)
+
+    reports = filtered_reports_for_request(request, request.GET)
+
+    response = StreamingHttpResponse(iter_export(reports, export_format),
+                                     content_type=EXPORT_FORMATS[export_format])
+    filename = f"informes_{timezone.now():%Y%m%d_%H%M}.{export_format}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+@login_required
+@require_POST
+def report_archive(request):
+    """
+    Descarga en un ZIP los PDF de los informes seleccionados, o de todos los
+    que cumplen los filtros del listado si se envía all=1
+    """
+    if request.POST.get('all'):
+        reports = filtered_reports_for_request(request, request.POST)
+    else:
+        try:
+            selected_ids = [int(report_id) for report_id in request.POST.getlist('report_ids')]
+        except ValueError:
+            selected_ids = []
+        reports = filter_reports(user=request.user).filter(id__in=selected_ids)
+    report_ids = list(reports.order_by('-created_at', '-id').values_list('id', flat=True)[:zip_max_reports() + 1])
+
+    if not report_ids:
+        messages.error(request, "No hay informes que descargar.")
+        return redirect('dental_reports:report_list')
+    if len(report_ids) > zip_max_reports():
+        messages.error(request, f"Como máximo se pueden descargar {zip_max_reports()} informes a la vez. "
+                                f"Ajusta los filtros.")
+        return redirect('dental_reports:report_list')
+
+    selected = list(archive_queryset(report_ids)) if len(report_ids) <= zip_stream_limit() else None
+    if selected is not None and can_stream(selected):
+        filename = f"informes_{timezone.now():%Y%m%d_%H%M}.zip"
+        response = StreamingHttpResponse(iter_zip(report_zip_entries(selected)), content_type='application/zip')
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    # Selecciones grandes o con PDFs por generar: en segundo plano
+    archive = create_archive(report_ids, request.user)
+    messages.info(request, f"Se está preparando un ZIP con {len(report_ids)} informes.")
+    return redirect('dental_reports:archive_detail', pk=archive.pk)
+
+
+@login_required
+def archive_detail(request, pk):
+    """Estado de un ZIP generado en segundo plano, con el enlace de descarga cuando está listo"""
+    archive = get_object_or_404(ReportArchive, pk=pk, created_by=request.user)
+    return render(request, 'dental_reports/archive_detail.html', {'archive': archive})
+
+
+@login_required
+def archive_download(request, pk):
+    archive = get_object_or_404(ReportArchive, pk=pk, created_by=request.user,
+                                status=ReportArchive.STATUS_READY)
+    return FileResponse(archive.file.open('rb'), as_attachment=True, filename=f"{archive.name}.zip",
+                        content_type='application/zip')
+
+
 @login_required
 def report_detail(request, pk):
     """Vista para ver un informe generado con opciones para descargar PDF y enviar"""
@@ -244,7 +349,7 @@ def report_detail(request, pk):
     # Verificar permisos
     if report.created_by != request.user and not request.user.is_superuser:
         messages.error(request, "No tienes permiso para ver este informe.")
-        return redirect('report_list')
+        return redirect('dental_reports:report_list')
 
     # Lista de dentistas para posible envío
     dentists = DentistContact.objects.filter(is_active=True).order_by('last_name', 'first_name')
@@ -255,6 +360,84 @@ def report_detail(request, pk):
     })
 
 
+@login_required
+def report_status(request, pk):
+    """Estado de la generación del PDF de un informe (consultado por la página de detalle)"""
+    report = get_object_or_404(GeneratedReport, pk=pk)
+
+    if report.created_by != request.user and not request.user.is_superuser:
+        return JsonResponse({'error': 'Sin permiso'}, status=403)
+
+    return JsonResponse({
+        'status': report.pdf_status,
+        'status_display': report.get_pdf_status_display(),
+        'error': report.pdf_error,
+        'pdf_url': reverse('dental_reports:report_pdf', kwargs={'pk': report.pk})
+        if report.pdf_status == GeneratedReport.PDF_READY else None,
+    })
+
+
+def _revision_history_page(request, obj, back_url):
+    """Listado de versiones de un objeto y diferencias entre dos de ellas (?from=&to=)"""
+    history = revision_history(obj)
+    versions = [entry['version'] for entry in history]
+    try:
+        to_version = int(request.GET.get('to') or (versions[0] if versions else 0))
+        from_version = int(request.GET.get('from') or (versions[1] if len(versions) > 1 else to_version))
+    except ValueError:
+        return HttpResponse('Versión no válida', status=400)
+
+    tables = []
+    if versions and from_version != to_version:
+        if from_version not in versions or to_version not in versions:
+            return HttpResponse('Versión no encontrada en el historial', status=404)
+        tables = diff_tables(obj, from_version, to_version)
+
+    return render(request, 'dental_reports/revision_history.html', {
+        'object': obj,
+        'history': history,
+        'from_version': from_version,
+        'to_version': to_version,
+        'tables': tables,
+        'back_url': back_url,
+    })
+
+
+@login_required
+def template_history(request, pk):
+    """Historial de versiones de una plantilla"""
+    template = get_object_or_404(ReportTemplate, pk=pk)
+    return _revision_history_page(request, template, reverse('dental_reports:template_detail', kwargs={'pk': pk}))
+
+
+@login_required
+def report_history(request, pk):
+    """Historial de versiones de un informe"""
+    report = get_object_or_404(GeneratedReport, pk=pk)
+
+    if report.created_by != request.user and not request.user.is_superuser:
+        messages.error(request, "No tienes permiso para ver este informe.")
+        return redirect('dental_reports:report_list')
+
+    return _revision_history_page(request, report, reverse('dental_reports:report_detail', kwargs={'pk': pk}))
+
+
+@login_required
+def cache_stats(request):
+    """Tasa de aciertos de la caché por espacio de nombres (sólo personal)"""
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Sin permiso'}, status=403)
+    return JsonResponse({'namespaces': namespace_cache_stats()})
+
+
+@login_required
+def request_metrics(request):
+    """Histogramas de tiempos por vista y por operación de este proceso (sólo personal)"""
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Sin permiso'}, status=403)
+    return JsonResponse(metrics_snapshot())
+
+
 @login_required
 def report_pdf(request, pk):
     """Vista para generar y descargar un PDF del informe"""
@@ -263,19 +446,51 @@ def report_pdf(request, pk):
     # Verificar permisos
     if report.created_by != request.user and not request.user.is_superuser:
         messages.error(request, "No tienes permiso para descargar este informe.")
-        return redirect('report_list')
+        return redirect('dental_reports:report_list')
+
+    # El PDF se genera y se guarda la primera vez (o si el guardado está obsoleto);
+    # las descargas siguientes redirigen al archivo guardado. En ambos casos la
+    # respuesta lleva ETag (la huella del contenido) y Last-Modified del archivo
+    try:
+        source_hash = report_pdf_key(report)
+    except RenderMismatch:
+        return HttpResponse('Error al generar el PDF: el contenido del informe no coincide con el original.',
+                            content_type='text/plain', status=500)
+    etag = f'"{source_hash}"'
+    stale = pdf_is_stale(report, source_hash)
+    not_modified = get_conditional_response(
+        request, etag=etag, last_modified=None if stale else _file_modified_timestamp(report.pdf_file))
+    if not_modified is not None:
+        return not_modified
+
+    if stale:
+        pdf_file = ensure_report_pdf(report)
+        if pdf_file is None:
+            return HttpResponse('Error al generar el PDF: Problema de conversión.', content_type='text/plain',
+                                status=500)
+        filename = f"informe_{report.patient_name.replace(' ', '_')}_{report.id}.pdf"
+        response = FileResponse(pdf_file, content_type='application/pdf', filename=filename)
+    else:
+        response = redirect(report.pdf_file.url)
+
+    response['ETag'] = etag
+    modified = _file_modified_timestamp(report.pdf_file)
+    if modified is not None:
+        response['Last-Modified'] = http_date(modified)
+    return response
 
-    # Si ya existe un archivo PDF generado, servir ese
-    if report.pdf_file:
-        return redirect(report.pdf_file.url)
 
-    # Si no, generar PDF dinámicamente
-    filename = f"informe_{report.patient_name.replace(' ', '_')}_{report.id}.pdf"
-    return html_to_pdf_response(report.report_content, filename)
+def _file_modified_timestamp(field_file):
+    """Fecha de modificación del archivo (marca de tiempo) o None si el almacenamiento no la da"""
+    try:
+        return int(field_file.storage.get_modified_time(field_file.name).timestamp())
+    except (NotImplementedError, OSError):
+        return None
 
 
 # Vistas para gestión de clínicas dentales
 @login_required
+@cached_view('clinics')
 def clinic_list(request):
     """Lista de clínicas dentales"""
     clinics = DentalClinic.objects.all().order_by('name')
@@ -290,7 +505,7 @@ def clinic_create(request):
         if form.is_valid():
             clinic = form.save()
             messages.success(request, f"Clínica '{clinic.name}' creada con éxito.")
-            return redirect('clinic_list')
+            return redirect('dental_reports:clinic_list')
     else:
         form = DentalClinicForm()
 
@@ -319,7 +534,7 @@ def clinic_edit(request, pk):
         if form.is_valid():
             clinic = form.save()
             messages.success(request, f"Clínica '{clinic.name}' actualizada con éxito.")
-            return redirect('clinic_detail', pk=clinic.pk)
+            return redirect('dental_reports:clinic_detail', pk=clinic.pk)
     else:
         form = DentalClinicForm(instance=clinic)
 
@@ -332,6 +547,7 @@ def clinic_edit(request, pk):
 
 # Vistas para gestión de contactos de dentistas
 @login_required
+@cached_view('dentists')
 def dentist_list(request):
     """Lista de contactos de dentistas"""
     # Filtrar por clínica si se especifica
@@ -362,7 +578,7 @@ def dentist_create(request):
         if form.is_valid():
             dentist = form.save()
             messages.success(request, f"Contacto '{dentist.first_name} {dentist.last_name}' creado con éxito.")
-            return redirect('dentist_list')
+            return redirect('dental_reports:dentist_list')
     else:
         form = DentistContactForm()
 
@@ -393,7 +609,7 @@ def dentist_edit(request, pk):
         if form.is_valid():
             dentist = form.save()
             messages.success(request, f"Contacto '{dentist.first_name} {dentist.last_name}' actualizado con éxito.")
-            return redirect('dentist_detail', pk=dentist.pk)
+            return redirect('dental_reports:dentist_detail', pk=dentist.pk)
     else:
         form = DentistContactForm(instance=dentist)
 
@@ -407,33 +623,29 @@ def dentist_edit(request, pk):
 # Función de utilidad para enviar informes por correo electrónico (opcional)
 @login_required
 def send_report(request, pk):
-    """Enviar informe por correo electrónico a un contacto"""
+    """Enviar informe por correo electrónico a uno o varios contactos"""
     report = get_object_or_404(GeneratedReport, pk=pk)
 
-    if request.method == 'POST':
-        dentist_id = request.POST.get('dentist_id')
-        if dentist_id:
-            dentist = get_object_or_404(DentistContact, id=dentist_id)
-
-            try:
-                # Aquí iría la lógica de envío de correo electrónico
-                # send_email_with_attachment(
-                #     subject=f"Informe: {report.title}",
-                #     message=f"Adjunto informe médico para paciente {report.patient_name}.",
-                #     from_email=settings.DEFAULT_FROM_EMAIL,
-                #     recipient_list=[dentist.email],
-                #     attachment=report.pdf_file.path if report.pdf_file else None,
-                # )
-
-                messages.success(request, f"Informe enviado con éxito a {dentist.first_name} {dentist.last_name}.")
-                return redirect('report_detail', pk=report.pk)
+    if report.created_by != request.user and not request.user.is_superuser:
+        messages.error(request, "No tienes permiso para enviar este informe.")
+        return redirect('dental_reports:report_list')
 
-            except Exception as e:
-                messages.error(request, f"Error al enviar el correo: {str(e)}")
+    if request.method == 'POST':
+        dentist_ids = request.POST.getlist('dentist_id')
+        dentists = list(DentistContact.objects.filter(id__in=dentist_ids, is_active=True).exclude(email=''))
+        if dentists:
+            # El envío lo hace el trabajador de la bandeja de salida (manage.py send_outbox)
+            queue_report_for_dentists(
+                report, dentists,
+                message=request.POST.get('message') or None,
+                created_by=request.user,
+            )
+            names = ', '.join(f"{dentist.first_name} {dentist.last_name}" for dentist in dentists)
+            messages.success(request, f"Informe en cola para su envío a {names}.")
         else:
             messages.error(request, "Por favor selecciona un destinatario.")
 
-    return redirect('report_detail', pk=report.pk)
+    return redirect('dental_reports:report_detail', pk=report.pk)
 
 
 # Función para crear automáticamente un módulo de utilidades
@@ -540,10 +752,11 @@ def html_to_pdf_response(html_content, filename="informe.pdf"):
         return redirect('admin:index')
 
     messages.error(request, "No tienes permiso para realizar esta acción.")
-    return redirect('home')
+    return redirect('dental_reports:home')
 
 
 @login_required
+@cached_view('categories')
 def category_list(request):
     """Lista todas las categorías de plantillas"""
     # Asegúrate de importar Count si aún no lo has hecho
@@ -566,7 +779,7 @@ def category_create(request):
         if form.is_valid():
             category = form.save()
             messages.success(request, f"Categoría '{category.name}' creada con éxito.")
-            return redirect('category_list')
+            return redirect('dental_reports:category_list')
     else:
         form = TemplateCategoryForm()
 
@@ -586,7 +799,7 @@ def category_edit(request, pk):
         if form.is_valid():
             category = form.save()
             messages.success(request, f"Categoría '{category.name}' actualizada con éxito.")
-            return redirect('category_list')
+            return redirect('dental_reports:category_list')
     else:
         form = TemplateCategoryForm(instance=category)
 
@@ -623,6 +836,7 @@ def editor_visual(request, template_id=None):
         'bloques': bloques,
         'variables': variables,
         'plantilla': plantilla,
+        'contenido': current_contenido(plantilla) if plantilla else None,
     }
     return render(request, 'dental_reports/editor_visual.html', context)
 
@@ -636,25 +850,33 @@ def guardar_plantilla(request):
 
         # Crear o actualizar plantilla
         template_id = data.get('template_id')
+        base_revision = data.pop('revision', None)
         if template_id:
             plantilla = get_object_or_404(Plantilla, id=template_id, creador=request.user)
+            if base_revision is None:
+                return JsonResponse({'success': False, 'error': 'Falta la revisión de la plantilla'}, status=400)
         else:
             plantilla = Plantilla(creador=request.user)
 
         # Actualizar datos
         plantilla.nombre = data.get('name', 'Sin nombre')
 
-        # Guardar todo el objeto JSON (incluye bloques y campos predefinidos)
-        plantilla.contenido = data
-
-        plantilla.save()
+        # Guardar todo el objeto JSON (incluye bloques y campos predefinidos) como nueva instantánea
+        save_plantilla_snapshot(plantilla, data, base_revision)
 
         return JsonResponse({
             'success': True,
             'id': plantilla.id,
+            'revision': plantilla.revision,
             'message': 'Plantilla guardada correctamente'
         })
 
+    except RevisionConflict as e:
+        return JsonResponse({
+            'success': False,
+            'error': 'La plantilla se ha modificado desde otra ventana',
+            'revision': e.revision,
+        }, status=409)
     except Plantilla.DoesNotExist:
         return JsonResponse({'success': False, 'error': 'Plantilla no encontrada'})
     except Exception as e:
@@ -662,29 +884,84 @@ def guardar_plantilla(request):
 
 
 @login_required
-def vista_previa_plantilla(request, template_id):
-    """Muestra una vista previa de la plantilla con datos de ejemplo"""
+def plantilla_contenido(request, template_id):
+    """Contenido actual y revisión de una plantilla visual (para recargar el editor tras un conflicto)"""
     plantilla = get_object_or_404(Plantilla, id=template_id, creador=request.user)
+    return JsonResponse({'revision': plantilla.revision, 'contenido': current_contenido(plantilla)})
 
-    # Datos de ejemplo para la vista previa
-    datos_ejemplo = {
-        'nombrePaciente': 'Juan Pérez',
-        'edadPaciente': '45',
-        'fechaConsulta': '08/05/2025',
-        'diagnostico': 'Caries en molar inferior',
-        'tratamiento': 'Empaste dental',
-        'dentistaNombre': 'Dra. Laura Martínez',
-        'proximaCita': '22/05/2025'
-    }
+
+@login_required
+@require_POST
+def guardar_plantilla_parche(request, template_id):
+    """
+    Autoguardado del editor visual: aplica un parche JSON sobre la revisión indicada
+
+    Cuerpo: {"revision": n, "operaciones": [operaciones RFC 6902]}
+    Responde 409 con la revisión actual si la plantilla cambió entretanto.
+    """
+    plantilla = get_object_or_404(Plantilla, id=template_id, creador=request.user)
+    try:
+        data = json.loads(request.body)
+        revision = patch_plantilla(plantilla, data.get('revision'), data.get('operaciones'), user=request.user)
+    except RevisionConflict as e:
+        return JsonResponse({'success': False, 'error': str(e), 'revision': e.revision}, status=409)
+    except (ValueError, AttributeError) as e:
+        # PatchError es un ValueError, igual que un cuerpo que no es JSON
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    return JsonResponse({'success': True, 'revision': revision})
+
+
+@login_required
+def vista_previa_plantilla(request, template_id):
+    """Muestra una vista previa de la plantilla, renderizada en el servidor con datos de ejemplo"""
+    plantilla = get_object_or_404(Plantilla, id=template_id, creador=request.user)
+    plan = get_plan(plantilla)
 
     context = {
         'plantilla': plantilla,
-        'datos_ejemplo': datos_ejemplo
+        'contenido_html': render_plantilla_html(plantilla, plan.sample_data(), keep_missing=True),
+        'avisos': plan.warnings,
     }
 
     return render(request, 'dental_reports/vista_previa_plantilla.html', context)
 
 
+@login_required
+def generar_informe_plantilla(request, template_id):
+    """Genera un informe a partir de una plantilla del editor visual"""
+    plantilla = get_object_or_404(Plantilla, id=template_id, creador=request.user)
+    form_class = get_plan(plantilla).form_class
+
+    if request.method == 'POST':
+        form = form_class(request.POST)
+        if form.is_valid():
+            try:
+                report = build_plantilla_report(plantilla, form.cleaned_data, created_by=request.user)
+                report.save()
+
+                # Generar PDF: en segundo plano salvo que se haya desactivado la cola
+                if getattr(settings, 'DENTAL_REPORTS_PDF_ASYNC', True):
+                    enqueue_report_pdf(report)
+                else:
+                    pdf_file = ensure_report_pdf(report)
+                    if pdf_file:
+                        pdf_file.close()
+
+            except Exception as e:
+                messages.error(request, f"Error al generar el informe: {str(e)}")
+            else:
+                # Fuera del try: el informe ya está guardado y no debe mostrarse como error
+                messages.success(request, "Informe generado con éxito.")
+                return redirect('dental_reports:report_detail', pk=report.id)
+    else:
+        form = form_class()
+
+    return render(request, 'dental_reports/generar_informe_plantilla.html', {
+        'form': form,
+        'plantilla': plantilla,
+    })
+
+
 @login_required
 def plantilla_list(request):
     """Lista de plantillas visuales"""
@@ -707,7 +984,7 @@ def template_create(request):
         if form.is_valid():
             template = form.save()
             messages.success(request, f"Plantilla '{template.name}' creada con éxito.")
-            return redirect('template_detail', pk=template.pk)
+            return redirect('dental_reports:template_detail', pk=template.pk)
     else:
         form = TemplateForm(user=request.user)
 
@@ -928,7 +1205,7 @@ def save_template_ajax(request):
             return JsonResponse({
                 'success': True,
                 'template_id': template.id,
-                'redirect_url': reverse('template_detail', kwargs={'pk': template.id})
+                'redirect_url': reverse('dental_reports:template_detail', kwargs={'pk': template.id})
             })
 
         except Exception as e:
@@ -1,12 +1,12 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.template import Template, Context
 from django.http import HttpResponse
 from django.core.files.base import ContentFile
 
 from .models import ReportTemplate, TemplateCategory, Specialty, GeneratedReport
 from .forms import TemplateForm, DynamicReportForm
+from dental_reports.rendering import render_report_html
 
 from io import BytesIO
 import json
@@ -107,9 +107,7 @@ def generate_report(request, template_id):
 
             # Renderizar contenido HTML
             try:
-                html_template = Template(template.html_content)
-                html_context = Context(context_data)
-                rendered_html = html_template.render(html_context)
+                rendered_html = render_report_html(template, context_data)
             except Exception as e:
                 messages.error(request, f"Error al renderizar el informe: {str(e)}")
                 return redirect('template_detail', pk=template.pk)